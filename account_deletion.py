@@ -0,0 +1,310 @@
+"""Deleting user accounts in the background.
+
+Deleting a busy account in one transaction holds locks on thousands of
+likes, follows, messages, timeline entries and mentions for as long as
+it takes. Instead, the delete view only marks the user with `deleted_at`
+and hands the rest to AccountDeleter. Until the purge is done, the rows
+stay, but every query that lists users or messages (profiles, follow and
+like lists, timelines, search, tags, mentions) filters out marked users.
+
+purge_user removes the account in chunks of at most `chunk_size` rows,
+committing after each, and keeps the other users' and messages' counters
+right as it goes. The database's ON DELETE CASCADE foreign keys remove
+each message's likes and timeline entries, and whatever is left when the
+user row itself goes.
+
+Users marked but not purged (say, the process was restarted) are picked
+up by `flask purge-deleted-users`.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from sqlalchemy import delete, func, select, update
+
+import counters
+import timeline
+from models import db, Follow, Like, Mention, Message, TimelineEntry, User
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_WORKERS = 1
+
+
+def mark_deleted(user_id):
+    """Mark user `user_id` as deleted; the caller should commit."""
+
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(deleted_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _delete_messages(user_id, chunk_size):
+    """Delete a chunk of `user_id`'s messages; return how many."""
+
+    message_ids = db.session.scalars(
+        select(Message.id)
+        .where(Message.user_id == user_id)
+        .limit(chunk_size)
+    ).all()
+
+    if not message_ids:
+        return 0
+
+    # their likes go with them, so uncount those from the likers
+    likes = (select(Like.user_id, func.count().label('likes'))
+             .where(Like.message_id.in_(message_ids))
+             .group_by(Like.user_id)
+             .subquery())
+
+    db.session.execute(
+        update(User)
+        .where(User.id == likes.c.user_id)
+        .values(likes_count=User.likes_count - likes.c.likes)
+        .execution_options(synchronize_session=False)
+    )
+
+    return db.session.execute(
+        delete(Message).where(Message.id.in_(message_ids))
+    ).rowcount
+
+
+def _delete_likes(user_id, chunk_size):
+    """Delete a chunk of `user_id`'s likes; return how many."""
+
+    message_ids = db.session.scalars(
+        delete(Like)
+        .where(
+            Like.user_id == user_id,
+            Like.message_id.in_(
+                select(Like.message_id)
+                .where(Like.user_id == user_id)
+                .limit(chunk_size)
+            ),
+        )
+        .returning(Like.message_id)
+    ).all()
+
+    if message_ids:
+        counters.bump(Message, message_ids, likes_count=-1)
+
+    return len(message_ids)
+
+
+def _delete_following(user_id, chunk_size):
+    """Delete a chunk of the follows by `user_id`; return how many."""
+
+    followed_ids = db.session.scalars(
+        delete(Follow)
+        .where(
+            Follow.user_following_id == user_id,
+            Follow.user_being_followed_id.in_(
+                select(Follow.user_being_followed_id)
+                .where(Follow.user_following_id == user_id)
+                .limit(chunk_size)
+            ),
+        )
+        .returning(Follow.user_being_followed_id)
+    ).all()
+
+    if followed_ids:
+        counters.bump(User, followed_ids, followers_count=-1)
+        timeline.resume_fan_out(followed_ids)
+
+    return len(followed_ids)
+
+
+def _delete_followers(user_id, chunk_size):
+    """Delete a chunk of the follows of `user_id`; return how many."""
+
+    follower_ids = db.session.scalars(
+        delete(Follow)
+        .where(
+            Follow.user_being_followed_id == user_id,
+            Follow.user_following_id.in_(
+                select(Follow.user_following_id)
+                .where(Follow.user_being_followed_id == user_id)
+                .limit(chunk_size)
+            ),
+        )
+        .returning(Follow.user_following_id)
+    ).all()
+
+    if follower_ids:
+        counters.bump(User, follower_ids, following_count=-1)
+
+    return len(follower_ids)
+
+
+def _delete_timeline(user_id, chunk_size):
+    """Delete a chunk of `user_id`'s home timeline; return how many."""
+
+    return db.session.execute(
+        delete(TimelineEntry)
+        .where(
+            TimelineEntry.user_id == user_id,
+            TimelineEntry.message_id.in_(
+                select(TimelineEntry.message_id)
+                .where(TimelineEntry.user_id == user_id)
+                .limit(chunk_size)
+            ),
+        )
+    ).rowcount
+
+
+def _delete_mentions(user_id, chunk_size):
+    """Delete a chunk of the mentions of `user_id`; return how many."""
+
+    return db.session.execute(
+        delete(Mention)
+        .where(
+            Mention.user_id == user_id,
+            Mention.message_id.in_(
+                select(Mention.message_id)
+                .where(Mention.user_id == user_id)
+                .limit(chunk_size)
+            ),
+        )
+    ).rowcount
+
+
+# messages first, since they're what other users can still see
+STEPS = [
+    ('messages', _delete_messages),
+    ('likes', _delete_likes),
+    ('following', _delete_following),
+    ('followers', _delete_followers),
+    ('timeline', _delete_timeline),
+    ('mentions', _delete_mentions),
+]
+
+
+def purge_user(user_id, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Delete user `user_id` and everything of theirs, a chunk at a time.
+
+    Commits after every chunk. Calls `progress(step, deleted)` after each
+    one, with the number of rows deleted so far in that step. Returns a
+    dict of step -> rows deleted, including 'user'.
+    """
+
+    deleted = {}
+
+    for step, delete_chunk in STEPS:
+        deleted[step] = 0
+
+        while True:
+            count = delete_chunk(user_id, chunk_size)
+            db.session.commit()
+
+            if not count:
+                break
+
+            deleted[step] += count
+            if progress:
+                progress(step, deleted[step])
+
+    # anything added since goes by cascade; passive_deletes keeps the ORM
+    # from loading the user's (by now empty) collections
+    user = db.session.get(User, user_id)
+    if user:
+        db.session.delete(user)
+    db.session.commit()
+
+    deleted['user'] = 1 if user else 0
+    if progress:
+        progress('user', deleted['user'])
+
+    return deleted
+
+
+def purge_deleted_users(chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Purge every user marked as deleted; return their ids.
+
+    Calls `progress(user_id, step, deleted)` as purge_user goes.
+    """
+
+    user_ids = db.session.scalars(
+        select(User.id)
+        .where(User.deleted_at.is_not(None))
+        .order_by(User.deleted_at)
+    ).all()
+
+    for user_id in user_ids:
+        purge_user(
+            user_id,
+            chunk_size,
+            partial(progress, user_id) if progress else None,
+        )
+
+    return user_ids
+
+
+class AccountDeleter:
+    """Purges deleted accounts in a background thread, off the request.
+
+    With ACCOUNT_DELETION_WORKERS set to 0, nothing is purged in-process;
+    run `flask purge-deleted-users` instead.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = DEFAULT_WORKERS
+        self.chunk_size = DEFAULT_CHUNK_SIZE
+        self._executor = None
+        self._executor_pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read settings from `app`'s config."""
+
+        self.app = app
+        self.workers = app.config.get('ACCOUNT_DELETION_WORKERS', self.workers)
+        self.chunk_size = app.config.get(
+            'ACCOUNT_DELETION_CHUNK_SIZE', self.chunk_size)
+
+    def _get_executor(self):
+        """Return this process's thread pool.
+
+        Threads don't survive fork, so each worker process starts its own.
+        """
+
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='account-deletion',
+            )
+            self._executor_pid = os.getpid()
+
+        return self._executor
+
+    def submit(self, user_id):
+        """Purge user `user_id`, who must already be marked, in the background.
+
+        Returns a Future, or None if purging in-process is turned off.
+        """
+
+        if not self.workers:
+            return None
+
+        return self._get_executor().submit(self._purge, user_id)
+
+    def _purge(self, user_id):
+        app = self.app
+
+        def progress(step, deleted):
+            app.logger.info(
+                "purging user %s: %s %s deleted", user_id, deleted, step)
+
+        with app.app_context():
+            try:
+                return purge_user(user_id, self.chunk_size, progress)
+            except Exception:
+                app.logger.exception("purging user %s failed", user_id)
+                db.session.rollback()
+                raise
@@ -1,51 +1,129 @@
 import os
-from dotenv import load_dotenv
 
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+import click
+from flask import (
+    Blueprint, Flask, abort, current_app, render_template, request, flash,
+    redirect, session, g, jsonify)
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
 
 from forms import UserAddForm, UserEditForm, LoginForm, MessageForm, CSRFProtectForm
-from models import db, connect_db, User, Message
-
-load_dotenv()
+from models import (
+    db, connect_db, User, Message, Follow, Like, Hashtag, Mention,
+    MessageHashtag)
+from pagination import (
+    Page, get_cursors, get_page_size, make_page, paginate, page_url,
+    message_key, user_key)
+import counters
+from account_deletion import (
+    AccountDeleter, mark_deleted, purge_deleted_users)
+from assets import StaticAssets, build_assets
+from compression import Compress
+from config import PROFILES
+from follow_graph import FollowGraph
+from fragment_cache import FragmentCache
+from like_buffer import LikeBuffer, likes_count
+from page_cache import PageCache
+from recommendations import build_recommendations, suggestions_for
+from replicas import Replicas
+from http_cache import (
+    render_conditional, add_cache_headers, user_stamp, author_stamp,
+    message_stamp)
+from hashing import HashingBusy
+from identity import CurrentUser, IdentityCache
+import search
+import tags
+import timeline
+from trending import Trending
 
 CURR_USER_KEY = "curr_user"
+HASHING_BUSY_MESSAGE = "We're very busy right now. Please try again in a moment."
+KNOWN_FOLLOWERS_SHOWN = 3
+
+bp = Blueprint('warbler', __name__, cli_group=None)
+
+compress = Compress()
+static_assets = StaticAssets()
+fragment_cache = FragmentCache()
+page_cache = PageCache()
+replicas = Replicas()
+identity_cache = IdentityCache()
+account_deleter = AccountDeleter()
+like_buffer = LikeBuffer()
+trending = Trending()
+follow_graph = FollowGraph()
 
-app = Flask(__name__)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
-app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
-toolbar = DebugToolbarExtension(app)
+def create_app(config=None):
+    """Create the Warbler app.
+
+    `config` is a profile name from config.PROFILES or a config object;
+    by default the profile named by WARBLER_CONFIG, else production.
+
+    Nothing here touches the database (create tables with
+    `flask create-tables`), so the app can be built once in a gunicorn
+    master with --preload and shared copy-on-write by its workers.
+    """
 
+    if config is None:
+        config = os.environ.get('WARBLER_CONFIG', 'production')
+    if isinstance(config, str):
+        config = PROFILES[config]
 
-try:
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    app.jinja_env.globals['page_url'] = page_url
+    app.jinja_env.globals['user_stamp'] = user_stamp
+    app.jinja_env.globals['author_stamp'] = author_stamp
+    app.jinja_env.filters['link_hashtags'] = tags.link_hashtags
+
+    replicas.init_app(app)
     connect_db(app)
-    with app.app_context():
-        db.create_all()
-        print("All tables created successfully.")
-except Exception as e:
-    print(e, "failed to connect db or create tables")
+    identity_cache.init_app(app)
+
+    # before the toolbar, which needs to see uncompressed pages
+    compress.init_app(app)
+
+    if app.config['DEBUG_TB_ENABLED']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    static_assets.init_app(app)
+    fragment_cache.init_app(app)
+    page_cache.init_app(app)
+    account_deleter.init_app(app)
+    like_buffer.init_app(app)
+    trending.init_app(app)
+    follow_graph.init_app(app)
+
+    app.register_blueprint(bp)
+
+    return app
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@bp.before_app_request
 def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+    """If we're logged in, add curr user to Flask global.
+
+    The user's identity comes from the identity cache; the full User is
+    only loaded if the request uses more than id, username and image_url.
+    """
+
+    principal = None
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        principal = identity_cache.get(session[CURR_USER_KEY])
 
-    else:
-        g.user = None
+    g.user = CurrentUser(principal) if principal else None
 
 
-@app.before_request
+@bp.before_app_request
 def add_csrf_to_g():
     """If we're logged in, add csrf form to Flask global."""
 
@@ -58,6 +136,59 @@ def add_csrf_to_g():
 
 
 
+def message_list_context(messages):
+    """Template context for rendering like buttons on a list of messages.
+
+    Loads the current user's likes for all of `messages` in one query,
+    rather than once per message.
+    """
+
+    message_ids = [msg.id for msg in messages]
+    like_buffer.preload(message_ids)
+
+    return {
+        'liked_message_ids': g.user.liked_message_ids(message_ids),
+    }
+
+
+def user_list_context(users):
+    """Template context for rendering follow buttons on a list of users.
+
+    Loads which of `users` the current user follows in one query, rather
+    than once per user.
+    """
+
+    user_ids = [user.id for user in users]
+
+    return {
+        'followed_user_ids': g.user.following_ids_among(user_ids),
+    }
+
+
+def relation_context(user):
+    """Template context for how the current user relates to `user`.
+
+    Whether `user` follows them, and who they follow that follows `user`
+    (the first few loaded, for names, and how many in all).
+    """
+
+    known_ids = []
+    if user.id != g.user.id:
+        known_ids = g.user.followers_known_to_me(user)
+
+    known = (User.query
+             .filter(User.id.in_(known_ids[:KNOWN_FOLLOWERS_SHOWN]))
+             .order_by(User.id)
+             .all()) if known_ids else []
+
+    return {
+        'following': user.id != g.user.id and g.user.is_following(user),
+        'follows_you': user.id != g.user.id and g.user.is_followed_by(user),
+        'known_followers': [known_user.username for known_user in known],
+        'known_followers_count': len(known_ids),
+    }
+
+
 def do_login(user):
     """Log in user."""
 
@@ -71,7 +202,28 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/signup', methods=["GET", "POST"])
+def wants_json():
+    """Did the client ask for JSON instead of a page?
+
+    The like and follow buttons' scripts do, to update in place rather
+    than follow a redirect and re-render the whole page.
+    """
+
+    return request.accept_mimetypes.best == 'application/json'
+
+
+def unauthorized(message="Access unauthorized.", status=401, to="/"):
+    """Refuse the request: a JSON error, or flash `message` and redirect."""
+
+    if wants_json():
+        return jsonify(error=message), status
+
+    flash(message, "danger")
+    return redirect(to)
+
+
+@bp.route('/signup', methods=["GET", "POST"])
+@page_cache.anonymous
 def signup():
     """Handle user signup.
 
@@ -106,6 +258,10 @@ def signup():
             flash("An error occurred while creating your account. Please try again.", 'danger')
             print(f"SQLAlchemyError: {e}")
             return render_template('users/signup.html', form=form)
+        except HashingBusy:
+            db.session.rollback()
+            flash(HASHING_BUSY_MESSAGE, 'danger')
+            return render_template('users/signup.html', form=form), 503
 
         do_login(user)
         return redirect("/")
@@ -113,19 +269,26 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@bp.route('/login', methods=["GET", "POST"])
+@page_cache.anonymous
 def login():
     """Handle user login and redirect to homepage on success."""
 
     form = LoginForm()
 
     if form.validate_on_submit():
-        user = User.authenticate(
-            form.username.data,
-            form.password.data,
-        )
+        try:
+            user = User.authenticate(
+                form.username.data,
+                form.password.data,
+            )
+        except HashingBusy:
+            flash(HASHING_BUSY_MESSAGE, 'danger')
+            return render_template('users/login.html', form=form), 503
 
         if user:
+            # authenticate may have upgraded the password hash
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -135,7 +298,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.post('/logout')
+@bp.post('/logout')
 def logout():
     """Handle logout of user and redirect to homepage."""
 
@@ -154,7 +317,14 @@ def logout():
 ##############################################################################
 # General user routes:
 
-@app.get('/users')
+def get_user_or_404(user_id):
+    """Return user `user_id`, or abort with 404 if missing or deleted."""
+
+    return User.query.filter_by(id=user_id, deleted_at=None).first_or_404()
+
+
+@bp.get('/users')
+@replicas.read_only
 def list_users():
     """Page with listing of users.
 
@@ -165,17 +335,70 @@ def list_users():
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    search = request.args.get('q')
+    term = search.normalize_term(request.args.get('q'))
 
-    if not search:
-        users = User.query.all()
+    if not term:
+        page = paginate(
+            User.query.filter_by(deleted_at=None), (User.id,), user_key)
+        users = page.items
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        page = paginate(
+            search.search_users(term),
+            (search.user_search_rank(term), User.id),
+            lambda row: (row[1], row[0].id),
+        )
+        users = [user for user, rank in page.items]
+
+    context = user_list_context(users)
+    stamp = (
+        [user_stamp(user) for user in users],
+        sorted(context['followed_user_ids']),
+    )
 
-    return render_template('users/index.html', users=users)
+    return render_conditional(
+        'users/index.html',
+        stamp,
+        users=users,
+        page=page,
+        **context,
+    )
 
 
-@app.get('/users/<int:user_id>')
+@bp.get('/users/typeahead')
+@replicas.read_only
+def typeahead_users():
+    """Return JSON of the best username matches for 'q', for typeahead.
+
+    Returns {"users": [{"id", "username", "image_url"}, ...]}.
+    """
+
+    if not g.user:
+        return jsonify(error="Access unauthorized."), 401
+
+    term = search.normalize_term(request.args.get('q'))
+
+    if not term:
+        return jsonify(users=[])
+
+    rank = search.user_search_rank(term)
+    matches = (search
+               .search_users(term)
+               .order_by(rank.desc(), User.username)
+               .limit(current_app.config['TYPEAHEAD_LIMIT'])
+               .all())
+
+    return jsonify(users=[
+        {
+            "id": user.id,
+            "username": user.username,
+            "image_url": user.image_url,
+        }
+        for user, rank in matches
+    ])
+
+
+@bp.get('/users/<int:user_id>')
+@replicas.read_only
 def show_user(user_id):
     """Show user profile."""
 
@@ -183,12 +406,38 @@ def show_user(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-
-    return render_template('users/show.html', user=user)
-
-
-@app.get('/users/<int:user_id>/following')
+    user = get_user_or_404(user_id)
+    page = paginate(
+        Message.query.filter(Message.user_id == user.id),
+        (Message.timestamp, Message.id),
+        message_key,
+    )
+
+    context = message_list_context(page.items)
+    relation = relation_context(user)
+    suggestions = suggestions_for(g.user.id) if user.id == g.user.id else []
+    stamp = (
+        user_stamp(user),
+        sorted(relation.items()),
+        [message_stamp(msg) for msg in page.items],
+        sorted(context['liked_message_ids']),
+        [author_stamp(suggested) for suggested in suggestions],
+    )
+
+    return render_conditional(
+        'users/show.html',
+        stamp,
+        user=user,
+        messages=page.items,
+        page=page,
+        suggestions=suggestions,
+        **relation,
+        **context,
+    )
+
+
+@bp.get('/users/<int:user_id>/following')
+@replicas.read_only
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -196,11 +445,39 @@ def show_following(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
-
-
-@app.get('/users/<int:user_id>/followers')
+    user = get_user_or_404(user_id)
+    page = paginate(
+        (User
+         .query
+         .join(Follow, Follow.user_being_followed_id == User.id)
+         .filter(Follow.user_following_id == user.id,
+                 User.deleted_at.is_(None))),
+        (User.id,),
+        user_key,
+    )
+
+    context = user_list_context(page.items)
+    relation = relation_context(user)
+    stamp = (
+        user_stamp(user),
+        sorted(relation.items()),
+        [user_stamp(listed_user) for listed_user in page.items],
+        sorted(context['followed_user_ids']),
+    )
+
+    return render_conditional(
+        'users/following.html',
+        stamp,
+        user=user,
+        users=page.items,
+        page=page,
+        **relation,
+        **context,
+    )
+
+
+@bp.get('/users/<int:user_id>/followers')
+@replicas.read_only
 def show_followers(user_id):
     """Show list of followers of this user."""
 
@@ -208,11 +485,39 @@ def show_followers(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
-
-
-@app.get('/users/<int:user_id>/likes')
+    user = get_user_or_404(user_id)
+    page = paginate(
+        (User
+         .query
+         .join(Follow, Follow.user_following_id == User.id)
+         .filter(Follow.user_being_followed_id == user.id,
+                 User.deleted_at.is_(None))),
+        (User.id,),
+        user_key,
+    )
+
+    context = user_list_context(page.items)
+    relation = relation_context(user)
+    stamp = (
+        user_stamp(user),
+        sorted(relation.items()),
+        [user_stamp(listed_user) for listed_user in page.items],
+        sorted(context['followed_user_ids']),
+    )
+
+    return render_conditional(
+        'users/followers.html',
+        stamp,
+        user=user,
+        users=page.items,
+        page=page,
+        **relation,
+        **context,
+    )
+
+
+@bp.get('/users/<int:user_id>/likes')
+@replicas.read_only
 def show_likes(user_id):
     """Show list of likes this user liked."""
 
@@ -220,11 +525,81 @@ def show_likes(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/likes.html', user=user)
+    user = get_user_or_404(user_id)
+    page = paginate(
+        (Message
+         .query
+         .options(joinedload(Message.user))
+         .join(Like, Like.message_id == Message.id)
+         .filter(Like.user_id == user.id,
+                 ~User.marked_deleted(Message.user_id))),
+        (Message.timestamp, Message.id),
+        message_key,
+    )
+
+    context = message_list_context(page.items)
+    relation = relation_context(user)
+    stamp = (
+        user_stamp(user),
+        sorted(relation.items()),
+        [(message_stamp(msg), msg.user.username, msg.user.image_url)
+         for msg in page.items],
+        sorted(context['liked_message_ids']),
+    )
+
+    return render_conditional(
+        'users/likes.html',
+        stamp,
+        user=user,
+        messages=page.items,
+        page=page,
+        **relation,
+        **context,
+    )
+
+
+@bp.get('/users/<int:user_id>/mentions')
+@replicas.read_only
+def show_mentions(user_id):
+    """Show messages that @mention this user."""
 
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
 
-@app.post('/users/follow/<int:follow_id>')
+    user = get_user_or_404(user_id)
+    page = paginate(
+        (Message
+         .query
+         .join(Mention, Mention.message_id == Message.id)
+         .join(Message.user)
+         .options(contains_eager(Message.user))
+         .filter(Mention.user_id == user.id, User.deleted_at.is_(None))),
+        (Mention.timestamp, Mention.message_id),
+        message_key,
+    )
+
+    context = message_list_context(page.items)
+    relation = relation_context(user)
+    stamp = (
+        user_stamp(user),
+        sorted(relation.items()),
+        [(message_stamp(msg), author_stamp(msg.user)) for msg in page.items],
+        sorted(context['liked_message_ids']),
+    )
+
+    return render_conditional(
+        'users/mentions.html',
+        stamp,
+        user=user,
+        messages=page.items,
+        page=page,
+        **relation,
+        **context,
+    )
+
+
+@bp.post('/users/follow/<int:follow_id>')
 def start_following(follow_id):
     """Add a follow for the currently-logged-in user.
 
@@ -234,17 +609,21 @@ def start_following(follow_id):
     form = g.csrf_form
 
     if not g.user or not form.validate_on_submit():
-        flash("Access unauthorized.", "danger")
-        return redirect("/")
+        return unauthorized()
+
+    followed_user = get_user_or_404(follow_id)
+
+    if Follow.add(g.user.id, followed_user.id):
+        counters.record_follow(g.user.id, followed_user.id)
+        timeline.add_follow(g.user.id, followed_user.id)
+        follow_graph.record_follow(g.user.id, followed_user.id)
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
     db.session.commit()
 
-    return redirect(f"/users/{g.user.id}/following")
+    return follow_response(followed_user.id, following=True)
 
 
-@app.post('/users/stop-following/<int:follow_id>')
+@bp.post('/users/stop-following/<int:follow_id>')
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user.
 
@@ -254,17 +633,38 @@ def stop_following(follow_id):
     form = g.csrf_form
 
     if not g.user or not form.validate_on_submit():
-        flash("Access unauthorized.", "danger")
-        return redirect("/")
+        return unauthorized()
+
+    if Follow.remove(g.user.id, follow_id):
+        counters.record_follow(g.user.id, follow_id, -1)
+        timeline.remove_follow(g.user.id, follow_id)
+        follow_graph.record_follow(g.user.id, follow_id, -1)
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.remove(followed_user)
     db.session.commit()
 
-    return redirect(f"/users/{g.user.id}/following")
+    return follow_response(follow_id, following=False)
+
+
+def follow_response(user_id, following):
+    """Respond to a follow or unfollow of `user_id`.
+
+    JSON clients get {"following", "followers_count"}; others are
+    redirected to the current user's following page.
+    """
+
+    if not wants_json():
+        return redirect(f"/users/{g.user.id}/following")
+
+    followers_count = db.session.scalar(
+        select(User.followers_count).where(User.id == user_id))
 
+    if followers_count is None:
+        return jsonify(error="No such user."), 404
 
-@app.route('/users/profile', methods=["GET", "POST"])
+    return jsonify(following=following, followers_count=followers_count)
+
+
+@bp.route('/users/profile', methods=["GET", "POST"])
 def edit_profile():
     """Update profile for current user."""
 
@@ -272,28 +672,36 @@ def edit_profile():
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    form = UserEditForm(obj=g.user)
+    user = g.user.load()
+    form = UserEditForm(obj=user)
 
     # check if password is valid
     if form.validate_on_submit():
-        if User.authenticate(g.user.username, form.password.data,):
+        try:
+            is_auth = user.check_password(form.password.data)
+        except HashingBusy:
+            flash(HASHING_BUSY_MESSAGE, 'danger')
+            return render_template("users/edit.html", form=form), 503
+
+        if is_auth:
             # process form, update db
-            g.user.username = form.username.data
-            g.user.email = form.email.data
-            g.user.image_url = form.image_url.data or User.image_url.default.arg
-            g.user.header_image_url = form.header_image_url.data or User.header_image_url.default.arg
-            g.user.bio = form.bio.data
-            g.user.location = form.location.data
+            user.username = form.username.data
+            user.email = form.email.data
+            user.image_url = form.image_url.data or User.image_url.default.arg
+            user.header_image_url = form.header_image_url.data or User.header_image_url.default.arg
+            user.bio = form.bio.data
+            user.location = form.location.data
 
             db.session.commit()
-            return redirect(f"/users/{g.user.id}")
+            identity_cache.invalidate(user.id)
+            return redirect(f"/users/{user.id}")
 
         flash("Invalid password.", "danger")
 
     return render_template("users/edit.html", form=form)
 
 
-@app.post('/users/delete')
+@bp.post('/users/delete')
 def delete_user():
     """Delete user.
 
@@ -306,10 +714,12 @@ def delete_user():
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
+    # only mark the user here; their rows are purged in the background
     do_logout()
-    Message.query.filter_by(user_id=g.user.id).delete()
-    db.session.delete(g.user)
+    mark_deleted(g.user.id)
     db.session.commit()
+    identity_cache.invalidate(g.user.id)
+    account_deleter.submit(g.user.id)
     flash("User succesfully deleted", "success")
 
     return redirect("/signup")
@@ -318,7 +728,7 @@ def delete_user():
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@bp.route('/messages/new', methods=["GET", "POST"])
 def add_message():
     """Add a message:
 
@@ -332,8 +742,12 @@ def add_message():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        db.session.flush()
+        counters.record_message(g.user.id)
+        timeline.fan_out_message(msg)
+        tags.index_message(msg)
         db.session.commit()
 
         return redirect(f"/users/{g.user.id}")
@@ -341,7 +755,8 @@ def add_message():
     return render_template('messages/create.html', form=form)
 
 
-@app.get('/messages/<int:message_id>')
+@bp.get('/messages/<int:message_id>')
+@replicas.read_only
 def show_message(message_id):
     """Show a message."""
 
@@ -350,10 +765,25 @@ def show_message(message_id):
         return redirect("/")
 
     msg = Message.query.get_or_404(message_id)
-    return render_template('messages/show.html', message=msg)
+    author = identity_cache.get(msg.user_id)
+    # the author is marked deleted, and their messages are going
+    if author is None:
+        abort(404)
+
+    stamp = (
+        message_stamp(msg),
+        author,
+        g.user.has_liked(msg),
+        g.user.is_following(author),
+    )
+
+    # message text never changes; everything on the page that can change
+    # is in the stamp, so this ETag can be strong
+    return render_conditional(
+        'messages/show.html', stamp, weak=False, message=msg)
 
 
-@app.post('/messages/<int:message_id>/delete')
+@bp.post('/messages/<int:message_id>/delete')
 def delete_message(message_id):
     """Delete a message.
 
@@ -371,82 +801,382 @@ def delete_message(message_id):
     if msg.user_id != g.user.id:
         flash("Unauthorized action.", "danger")
         return redirect(f"/users/{g.user.id}")
+    counters.remove_message(msg)
+    timeline.remove_message(msg)
+    tags.remove_message(msg)
     db.session.delete(msg)
     db.session.commit()
 
     return redirect(f"/users/{g.user.id}")
 
-@app.post('/messages/like/<int:message_id>')
+@bp.post('/messages/like/<int:message_id>')
 def like_message(message_id):
     """Like a message."""
 
     form = g.csrf_form
 
     if not g.user or not form.validate_on_submit():
-        flash("Access unauthorized.", "danger")
-        return redirect("/")
+        return unauthorized()
 
     msg = Message.query.get_or_404(message_id)
-    if msg.user == g.user:
-        flash("Unauthorized action.", "danger")
-        return redirect(request.referrer)
-    g.user.likes.append(msg)
+    if msg.user_id == g.user.id:
+        return unauthorized("Unauthorized action.", 403, request.referrer)
+
+    liked_at = Like.add(g.user.id, msg.id)
+    if liked_at:
+        counters.record_like(g.user.id, msg.id)
+        trending.record_like(msg.id, liked_at)
+
     db.session.commit()
 
-    return redirect(request.referrer)
+    return like_response(msg.id, liked=True)
 
 
-@app.post('/messages/unlike/<int:message_id>')
+@bp.post('/messages/unlike/<int:message_id>')
 def unlike_message(message_id):
     """Unlike a message."""
 
     form = g.csrf_form
 
     if not g.user or not form.validate_on_submit():
+        return unauthorized()
+
+    liked_at = Like.remove(g.user.id, message_id)
+    if liked_at:
+        counters.record_like(g.user.id, message_id, -1)
+        trending.record_unlike(message_id, liked_at)
+
+    db.session.commit()
+
+    return like_response(message_id, liked=False)
+
+
+def like_response(message_id, liked):
+    """Respond to a like or unlike of `message_id`.
+
+    JSON clients get {"liked", "likes_count"}; others are redirected back.
+    """
+
+    if not wants_json():
+        return redirect(request.referrer)
+
+    msg = db.session.get(Message, message_id)
+
+    if msg is None:
+        return jsonify(error="No such message."), 404
+
+    return jsonify(liked=liked, likes_count=likes_count(msg))
+
+
+@bp.get('/trending')
+@replicas.read_only
+def show_trending():
+    """Show the messages most liked lately (see trending.py)."""
+
+    if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    msg = Message.query.get_or_404(message_id)
-    g.user.likes.remove(msg)
-    db.session.commit()
+    message_ids = trending.top()
+    rank = {message_id: n for n, message_id in enumerate(message_ids)}
+
+    messages = (Message.query
+                .join(Message.user)
+                .options(joinedload(Message.user))
+                .filter(Message.id.in_(message_ids), User.deleted_at.is_(None))
+                .all())
+    messages.sort(key=lambda msg: rank[msg.id])
+
+    context = message_list_context(messages)
+    stamp = (
+        [(message_stamp(msg), msg.user.username, msg.user.image_url)
+         for msg in messages],
+        sorted(context['liked_message_ids']),
+    )
+
+    return render_conditional(
+        'messages/trending.html',
+        stamp,
+        messages=messages,
+        **context,
+    )
+
+
+@bp.get('/messages/search')
+@replicas.read_only
+def search_messages():
+    """Search message text for 'q', optionally only by user 'author'.
+
+    Best matches first, with the matching words highlighted. JSON clients
+    get {"messages": [{"id", "text", "html", "timestamp", "likes_count",
+    "user": {"id", "username", "image_url"}}, ...], "older", "newer"},
+    where "older" and "newer" are the URLs of the neighbouring pages.
+    """
+
+    if not g.user:
+        return unauthorized()
+
+    text = search.normalize_query(request.args.get('q'))
+    author_name = (request.args.get('author') or "").strip().lstrip("@")
+
+    author = None
+    if author_name:
+        author = User.query.filter_by(
+            username=author_name, deleted_at=None).first()
+
+    if not text or (author_name and author is None):
+        page = Page([])
+    else:
+        query, columns = search.search_messages(text, author and author.id)
+        page = paginate(query, columns, lambda row: (row.rank, row.id))
+
+    message_ids = [row.id for row in page.items]
+    order = {message_id: n for n, message_id in enumerate(message_ids)}
+
+    messages = (Message.query
+                .options(selectinload(Message.user))
+                .filter(Message.id.in_(message_ids))
+                .all())
+    messages.sort(key=lambda msg: order[msg.id])
+
+    highlighted = search.highlight_messages(message_ids, text)
+    context = message_list_context(messages)
+
+    if wants_json():
+        return jsonify(
+            messages=[
+                {
+                    "id": msg.id,
+                    "text": msg.text,
+                    "html": highlighted[msg.id],
+                    "timestamp": msg.timestamp.isoformat(),
+                    "likes_count": likes_count(msg),
+                    "user": {
+                        "id": msg.user.id,
+                        "username": msg.user.username,
+                        "image_url": msg.user.image_url,
+                    },
+                }
+                for msg in messages
+            ],
+            older=page.older and page_url(before=page.older),
+            newer=page.newer and page_url(after=page.newer),
+        )
 
-    return redirect(request.referrer)
+    stamp = (
+        [(message_stamp(msg), author_stamp(msg.user)) for msg in messages],
+        sorted(context['liked_message_ids']),
+    )
+
+    return render_conditional(
+        'messages/search.html',
+        stamp,
+        q=text,
+        author=author_name,
+        messages=messages,
+        highlighted=highlighted,
+        page=page,
+        **context,
+    )
+
+
+@bp.get('/tags/<tag>')
+@replicas.read_only
+def show_tag(tag):
+    """Show messages with #tag, newest first."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
 
+    name = tag.casefold()
+    hashtag_id = db.session.scalar(
+        select(Hashtag.id).where(Hashtag.name == name))
+
+    page = paginate(
+        (Message
+         .query
+         .join(MessageHashtag, MessageHashtag.message_id == Message.id)
+         .join(Message.user)
+         .options(contains_eager(Message.user))
+         .filter(MessageHashtag.hashtag_id == hashtag_id,
+                 User.deleted_at.is_(None))),
+        (MessageHashtag.timestamp, MessageHashtag.message_id),
+        message_key,
+    )
+
+    context = message_list_context(page.items)
+    stamp = (
+        [(message_stamp(msg), author_stamp(msg.user)) for msg in page.items],
+        sorted(context['liked_message_ids']),
+    )
+
+    return render_conditional(
+        'messages/tag.html',
+        stamp,
+        tag=name,
+        messages=page.items,
+        page=page,
+        **context,
+    )
 
 
 ##############################################################################
 # Homepage and error pages
 
 
-@app.get('/')
+@bp.get('/')
+@page_cache.anonymous
+@replicas.read_only
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of self & followed_users
+    - logged in: most recent messages of self & followed_users, one page
+      at a time
     """
 
     if g.user:
-        following_or_me = [u.id for u in g.user.following] + [g.user.id]
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(following_or_me))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
-        return render_template('home.html', messages=messages)
+        before, after = get_cursors((Message.timestamp, Message.id))
+        per_page = get_page_size()
+
+        messages = timeline.get_timeline(
+            g.user.id, per_page + 1, before, after)
+        page = make_page(messages, per_page, message_key, before, after)
+
+        context = message_list_context(page.items)
+        suggestions = suggestions_for(g.user.id)
+        stamp = (
+            user_stamp(g.user.load()),
+            [(message_stamp(msg), msg.user.username, msg.user.image_url)
+             for msg in page.items],
+            sorted(context['liked_message_ids']),
+            [author_stamp(suggested) for suggested in suggestions],
+        )
+
+        return render_conditional(
+            'home.html',
+            stamp,
+            messages=page.items,
+            page=page,
+            suggestions=suggestions,
+            **context,
+        )
 
     else:
         # TODO: what forms does the home-anon need?
         return render_template('home-anon.html')
 
 
-@app.after_request
+@bp.after_app_request
 def add_header(response):
-    """Add non-caching headers on every request."""
+    """Add caching headers to responses that haven't set a policy."""
 
     # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-    response.cache_control.no_store = True
-    return response
+    return add_cache_headers(response)
+
+
+##############################################################################
+# Maintenance commands
+
+
+@bp.cli.command('create-tables')
+def create_tables_command():
+    """Create any missing tables."""
+
+    db.create_all()
+    print("All tables created successfully.")
+
+
+@bp.cli.command('rebuild-timelines')
+def rebuild_timelines_command():
+    """Rebuild every home timeline from the follows and messages tables."""
+
+    count = timeline.rebuild_timelines()
+    db.session.commit()
+    print(f"Rebuilt timelines with {count} entries.")
+
+
+@bp.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute denormalized counters and report any that had drifted."""
+
+    # so that the recomputed counts aren't then changed again by it
+    like_buffer.flush()
+
+    drifted = counters.reconcile_counters()
+    db.session.commit()
+
+    for name, count in drifted.items():
+        print(f"{name}: {count} rows repaired")
+
+
+@bp.cli.command('purge-deleted-users')
+def purge_deleted_users_command():
+    """Delete the data of users who deleted their accounts."""
+
+    def progress(user_id, step, deleted):
+        print(f"user {user_id}: {deleted} {step} deleted")
+
+    user_ids = purge_deleted_users(
+        current_app.config['ACCOUNT_DELETION_CHUNK_SIZE'], progress)
+    print(f"{len(user_ids)} users purged")
+
+
+@bp.cli.command('rebuild-trending')
+def rebuild_trending_command():
+    """Recompute the trending ranking from the likes table."""
+
+    scored = trending.rebuild()
+    print(f"{scored} messages scored")
+
+
+@bp.cli.command('build-follow-graph')
+def build_follow_graph_command():
+    """Write a fresh follow graph snapshot to FOLLOW_GRAPH_PATH."""
+
+    if not follow_graph.path:
+        raise click.UsageError("FOLLOW_GRAPH_PATH isn't set")
+
+    follows = follow_graph.rebuild()
+    if follows is None:
+        print("another process is already building it")
+    else:
+        print(f"{follows} follows written")
+
+
+@bp.cli.command('build-recommendations')
+@click.option('--limit', default=20, help="Suggestions kept per user.")
+@click.option('--chunk-size', default=5000, help="Users scored at a time.")
+def build_recommendations_command(limit, chunk_size):
+    """Recompute who-to-follow suggestions from the follow graph."""
+
+    def progress(done, total):
+        print(f"{done}/{total} users")
+
+    stored = build_recommendations(limit, chunk_size, progress)
+    print(f"{stored} recommendations stored")
+
+
+@bp.cli.command('backfill-tags')
+@click.option('--chunk-size', default=1000, help="Messages indexed at a time.")
+def backfill_tags_command(chunk_size):
+    """Index the hashtags and mentions of every existing message."""
+
+    def progress(last_id, hashtags, mentions):
+        print(f"up to message {last_id}: {hashtags} hashtags,"
+              f" {mentions} mentions")
+
+    hashtags, mentions = tags.backfill_tags(chunk_size, progress)
+    print(f"{hashtags} hashtags and {mentions} mentions indexed")
+
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static files into static/build/."""
+
+    manifest = build_assets(current_app.static_folder)
+    static_assets.load_manifest()
+    print(f"Built {len(manifest)} static assets.")
 
 # TODO: deal with deleting liked messages & users who have likes
\ No newline at end of file
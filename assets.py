@@ -0,0 +1,192 @@
+"""Fingerprinted, precompressed static assets.
+
+`flask build-assets` copies every file in static/ into static/build/ under
+a name containing a hash of its contents (style.css -> style.3f2a9c1b7e04.css),
+writes .gz and .br variants of text files next to them, and records the
+names in static/build/manifest.json.
+
+Templates link to assets with static_url('stylesheets/style.css'). Since a
+fingerprinted file never changes, it's served with a one-year immutable
+Cache-Control, and the precompressed variant the browser accepts is sent
+straight from disk rather than compressed per request.
+
+Without a build (e.g. in development) static_url falls back to /static/.
+"""
+
+import gzip
+import json
+import mimetypes
+import os
+import re
+from hashlib import sha256
+
+import brotli
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+COMPRESSIBLE_TYPES = {
+    '.css', '.js', '.json', '.svg', '.ico', '.txt', '.html', '.map', '.xml',
+}
+
+# url("/static/...") references inside CSS files
+CSS_URL = re.compile(r"""url\((["']?)/static/([^"')]+)\1\)""")
+
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def fingerprint(path, content):
+    """Return `path` with a hash of `content` before its extension."""
+
+    root, ext = os.path.splitext(path)
+    return f"{root}.{sha256(content).hexdigest()[:12]}{ext}"
+
+
+def compress_variants(content, gzip_level=9, brotli_quality=11):
+    """Return {suffix: bytes} of compressed variants smaller than `content`."""
+
+    variants = {
+        '.gz': gzip.compress(content, gzip_level, mtime=0),
+        '.br': brotli.compress(content, quality=brotli_quality),
+    }
+
+    return {
+        suffix: data for suffix, data in variants.items()
+        if len(data) < len(content)
+    }
+
+
+def build_assets(static_folder):
+    """Build fingerprinted and compressed assets into static/build/.
+
+    Returns the manifest, a dict of source path -> fingerprinted path.
+    """
+
+    out_folder = os.path.join(static_folder, BUILD_DIR)
+    sources = []
+
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        # don't fingerprint the previous build
+        if dirpath == static_folder and BUILD_DIR in dirnames:
+            dirnames.remove(BUILD_DIR)
+
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            sources.append(os.path.relpath(full_path, static_folder))
+
+    # CSS refers to other assets, so fingerprint those first
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+    manifest = {}
+
+    for path in sources:
+        with open(os.path.join(static_folder, path), 'rb') as file:
+            content = file.read()
+
+        if path.endswith('.css'):
+            content = CSS_URL.sub(
+                lambda match: 'url({0}/static/{1}/{2}{0})'.format(
+                    match.group(1),
+                    BUILD_DIR,
+                    manifest.get(match.group(2), match.group(2)),
+                ),
+                content.decode('UTF-8'),
+            ).encode('UTF-8')
+
+        built_path = fingerprint(path, content).replace(os.sep, '/')
+        manifest[path.replace(os.sep, '/')] = built_path
+
+        out_path = os.path.join(out_folder, built_path)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+        with open(out_path, 'wb') as file:
+            file.write(content)
+
+        if os.path.splitext(path)[1].lower() in COMPRESSIBLE_TYPES:
+            for suffix, data in compress_variants(content).items():
+                with open(out_path + suffix, 'wb') as file:
+                    file.write(data)
+
+    with open(os.path.join(out_folder, MANIFEST_NAME), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+    return manifest
+
+
+class StaticAssets:
+    """Serves built assets and provides static_url() to templates."""
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.build_folder = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.build_folder = os.path.join(app.static_folder, BUILD_DIR)
+        self.load_manifest()
+
+        app.add_url_rule(
+            f"{app.static_url_path}/{BUILD_DIR}/<path:filename>",
+            endpoint='built_static',
+            view_func=self.serve,
+        )
+        app.jinja_env.globals['static_url'] = self.url
+
+    def load_manifest(self):
+        """(Re)load the manifest written by build_assets, if there is one."""
+
+        try:
+            with open(os.path.join(self.build_folder, MANIFEST_NAME)) as file:
+                self.manifest = json.load(file)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def url(self, path):
+        """URL for static file `path`, fingerprinted if it has been built."""
+
+        built_path = self.manifest.get(path)
+
+        if built_path is None:
+            return f"/static/{path}"
+
+        return f"/static/{BUILD_DIR}/{built_path}"
+
+    def serve(self, filename):
+        """Send a built asset, precompressed if the client accepts it."""
+
+        path = safe_join(self.build_folder, filename)
+
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0]
+
+        suffixes = {
+            name: suffix
+            for name, suffix in ENCODINGS
+            if os.path.isfile(path + suffix)
+        }
+        encoding = request.accept_encodings.best_match(list(suffixes))
+
+        if encoding:
+            path += suffixes[encoding]
+
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            conditional=True,
+            max_age=IMMUTABLE_MAX_AGE,
+        )
+
+        if encoding:
+            response.content_encoding = encoding
+
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+
+        return response
@@ -0,0 +1,83 @@
+"""Benchmark response compression levels on Warbler's own pages.
+
+Run from the project root, against a seeded database, like:
+
+    python -m benchmarks.bench_compression [--user-id 1] [--repeat 20]
+
+Renders the home timeline, the user list and a profile as the given user,
+then prints compressed size and CPU time per response at each gzip level
+(and brotli quality, if installed), to help pick COMPRESS_LEVEL and
+COMPRESS_BROTLI_QUALITY.
+"""
+
+import argparse
+import time
+
+from app import create_app, CURR_USER_KEY
+from compression import BrotliCompressor, brotli, gzip_compressor
+from models import User
+
+GZIP_LEVELS = [1, 4, 6, 9]
+BROTLI_QUALITIES = [1, 4, 6, 11]
+
+
+def fetch_pages(app, user_id):
+    """Return {url: uncompressed body} for the pages to benchmark."""
+
+    client = app.test_client()
+
+    with client.session_transaction() as session:
+        session[CURR_USER_KEY] = user_id
+
+    urls = ['/', '/users?limit=100', f'/users/{user_id}?limit=100']
+    return {url: client.get(url).get_data() for url in urls}
+
+
+def time_compressor(make_compressor, body, repeat):
+    """Return (compressed size, seconds per compression)."""
+
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        compressor = make_compressor()
+        data = compressor.compress(body) + compressor.flush()
+
+    return len(data), (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        user_id = args.user_id or User.query.order_by(User.id).first().id
+
+    pages = fetch_pages(app, user_id)
+
+    settings = [(f"gzip-{level}", lambda level=level: gzip_compressor(level))
+                for level in GZIP_LEVELS]
+    if brotli:
+        settings += [
+            (f"br-{quality}", lambda quality=quality: BrotliCompressor(quality))
+            for quality in BROTLI_QUALITIES
+        ]
+
+    print(f"{'page':<24} {'setting':>8} {'bytes':>8} {'ratio':>6} {'ms':>7}")
+
+    for url, body in pages.items():
+        print(f"{url:<24} {'none':>8} {len(body):>8}")
+
+        for name, make_compressor in settings:
+            size, seconds = time_compressor(make_compressor, body, args.repeat)
+            print(
+                f"{'':<24} {name:>8} {size:>8} {len(body) / size:>6.1f}"
+                f" {seconds * 1000:>7.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark password hashing throughput at different bcrypt costs.
+
+Run from the project root like:
+
+    python -m benchmarks.bench_hashing [--hashes 16] [--workers 1 2 4]
+
+For each cost, prints single-hash latency and hashes per second through
+PasswordHasher with different pool sizes, to help pick BCRYPT_LOG_ROUNDS
+and PASSWORD_HASH_WORKERS for the hardware.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hashing import PasswordHasher
+
+PASSWORD = "correct horse battery staple"
+
+
+def time_hashes(hasher, hashes, concurrency):
+    """Return seconds taken to hash `hashes` passwords, `concurrency` at once."""
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as callers:
+        list(callers.map(lambda _: hasher.hash(PASSWORD), range(hashes)))
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--hashes", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"{'cost':>4} {'workers':>7} {'ms/hash':>8} {'hashes/s':>9}")
+
+    for rounds in args.rounds:
+        for workers in args.workers:
+            hasher = PasswordHasher(
+                log_rounds=rounds,
+                workers=workers,
+                max_pending=args.hashes,
+            )
+            hasher.hash(PASSWORD)
+
+            elapsed = time_hashes(hasher, args.hashes, args.hashes)
+            latency = time_hashes(hasher, 1, 1)
+
+            print(
+                f"{rounds:>4} {workers:>7} {latency * 1000:>8.1f}"
+                f" {args.hashes / elapsed:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
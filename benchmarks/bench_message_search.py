@@ -0,0 +1,142 @@
+"""Benchmark message search latency against a large seeded corpus.
+
+Run from the project root, with DATABASE_URL pointing at a scratch
+database (it's seeded with users and messages), like:
+
+    python -m benchmarks.bench_message_search --seed [--messages 1000000]
+        [--users 10000] [--runs 20]
+
+--seed creates the tables and adds the users and messages first; leave it
+off to rerun against an already seeded database. Message words are drawn
+with Zipf-like frequencies from a fixed vocabulary, so searches range from
+terms in a large share of messages to terms in a handful. Each search is
+timed for its first page, the page after it, and limited to one author;
+times include ranking and highlighting, but not rendering.
+"""
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import insert, text
+
+from app import create_app
+from models import db, Message, User
+from pagination import DEFAULT_PAGE_SIZE, apply_keyset, make_page
+import search
+
+VOCABULARY_SIZE = 5000
+
+# word ranks are cubed, so low ranks ("w1", "w2", ...) are much commoner
+SEED_MESSAGES = """
+INSERT INTO messages (text, user_id, timestamp)
+SELECT
+    (SELECT string_agg(
+                'w' || (1 + floor(power(random(), 3) * :vocabulary))::int,
+                ' ')
+     FROM generate_series(1, 6 + n % 7)),
+    (SELECT min(id) FROM users) + n % :users,
+    now() - n * interval '1 second'
+FROM generate_series(1, :messages) AS n
+"""
+
+SEARCHES = {
+    'common word': "w1",
+    'mid word': "w40",
+    'rare word': "w4000",
+    'two words': "w2 w30",
+    'phrase': '"w1 w2"',
+}
+
+
+def seed(users, messages):
+    db.create_all()
+    db.session.execute(insert(User), [
+        {'email': f'bench{n}@email.com', 'username': f'bench{n}',
+         'password': 'x'}
+        for n in range(users)
+    ])
+    db.session.execute(text(SEED_MESSAGES), {
+        'users': users, 'messages': messages, 'vocabulary': VOCABULARY_SIZE})
+    db.session.commit()
+
+    # as autovacuum would: merges the GIN index's pending entries
+    with db.engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql("VACUUM ANALYZE")
+
+
+def search_page(text, cursor=None, author_id=None):
+    """Fetch, rank and highlight one page of results; return the Page."""
+
+    query, columns = search.search_messages(text, author_id)
+    rows = apply_keyset(
+        query, columns, before=cursor, limit=DEFAULT_PAGE_SIZE + 1).all()
+    page = make_page(
+        rows, DEFAULT_PAGE_SIZE, lambda row: (row.rank, row.id), cursor)
+
+    message_ids = [row.id for row in page.items]
+    Message.query.filter(Message.id.in_(message_ids)).all()
+    search.highlight_messages(message_ids, text)
+    # keep the session from growing over the runs
+    db.session.expunge_all()
+
+    return page
+
+
+def time_ms(fn, runs):
+    """Return (median, max) milliseconds of `runs` calls of `fn`."""
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(times), max(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--seed", action="store_true")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    app.app_context().push()
+
+    if args.seed:
+        start = time.perf_counter()
+        seed(args.users, args.messages)
+        print(f"seeded in {time.perf_counter() - start:.1f}s")
+
+    total = db.session.query(Message.id).count()
+    author_id = db.session.query(User.id).order_by(User.id).limit(1).scalar()
+    print(f"{total} messages")
+    print(f"{'search':<12} {'ranked':>8} {'page':<7} {'median ms':>9}"
+          f" {'max ms':>7}")
+
+    for name, query in SEARCHES.items():
+        matches = search.search_messages(query)[0].count()
+
+        # the cursor for the page after the first
+        page = search_page(query)
+        cursor = page.older and (page.items[-1].rank, page.items[-1].id)
+
+        scenarios = {
+            'first': lambda: search_page(query),
+            'second': lambda: search_page(query, cursor),
+            'author': lambda: search_page(query, author_id=author_id),
+        }
+        for scenario, fn in scenarios.items():
+            if scenario == 'second' and cursor is None:
+                continue
+            median, slowest = time_ms(fn, args.runs)
+            print(f"{name:<12} {matches:>8} {scenario:<7} {median:>9.1f}"
+                  f" {slowest:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
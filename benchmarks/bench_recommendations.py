@@ -0,0 +1,80 @@
+"""Benchmark the who-to-follow job's scoring on a synthetic follow graph.
+
+Run from the project root (needs numpy and scipy), like:
+
+    python -m benchmarks.bench_recommendations [--users 100000]
+        [--follows-per-user 20] [--chunk-size 1000 5000 20000]
+
+Builds a random graph where a few users are followed by many (followed
+users are drawn with Zipf-like popularity), then times building the
+adjacency matrix and scoring every user at each chunk size. The database
+isn't touched, so this is the cost of the numpy/scipy part alone.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from recommendations import (
+    DEFAULT_LIMIT, build_adjacency, top_n, two_hop_scores)
+
+
+def make_follows(users, follows_per_user, seed=0):
+    """Return (user ids, (follower, followed) rows) of a random graph."""
+
+    rng = np.random.default_rng(seed)
+    user_ids = np.arange(1, users + 1, dtype=np.int64)
+
+    popularity = 1 / np.arange(1, users + 1)
+    popularity /= popularity.sum()
+
+    followers = np.repeat(user_ids, follows_per_user)
+    followed = rng.choice(user_ids, size=len(followers), p=popularity)
+
+    follows = np.unique(np.column_stack([followers, followed]), axis=0)
+    return user_ids, follows[follows[:, 0] != follows[:, 1]]
+
+
+def time_scoring(adjacency, chunk_size, limit):
+    """Return (seconds, recommendations, largest chunk's nonzeros)."""
+
+    n = adjacency.shape[0]
+    stored = largest = 0
+
+    start_time = time.perf_counter()
+
+    for start in range(0, n, chunk_size):
+        scores = two_hop_scores(adjacency, start, min(start + chunk_size, n))
+        largest = max(largest, scores.nnz)
+        stored += len(top_n(scores, limit)[0])
+
+    return time.perf_counter() - start_time, stored, largest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--follows-per-user", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument(
+        "--chunk-size", type=int, nargs="+", default=[1000, 5000, 20000])
+    args = parser.parse_args()
+
+    user_ids, follows = make_follows(args.users, args.follows_per_user)
+
+    start = time.perf_counter()
+    adjacency = build_adjacency(user_ids, follows)
+    print(f"{len(user_ids)} users, {adjacency.nnz} follows;"
+          f" adjacency built in {time.perf_counter() - start:.2f}s")
+
+    print(f"{'chunk size':>10} {'seconds':>8} {'stored':>9} {'peak nnz':>10}")
+
+    for chunk_size in args.chunk_size:
+        seconds, stored, largest = time_scoring(
+            adjacency, chunk_size, args.limit)
+        print(f"{chunk_size:>10} {seconds:>8.2f} {stored:>9} {largest:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark how long it takes a fresh process to build the app.
+
+Run from the project root, with DATABASE_URL and SECRET_KEY set, like:
+
+    python -m benchmarks.bench_startup [--runs 10]
+
+Each measurement is a new Python process importing app and calling
+create_app, so it includes imports, as a gunicorn worker boot would. The
+"boot-time DDL" row also runs db.create_all() and installs the debug
+toolbar, which is what every import of app.py used to do.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+SCENARIOS = {
+    'production': "create_app('production')",
+    'development': "create_app('development')",
+    'testing': "create_app('testing')",
+    'boot-time DDL': (
+        "app = create_app('development')\n"
+        "with app.app_context():\n"
+        "    db.create_all()"
+    ),
+}
+
+SCRIPT = """\
+import time
+start = time.perf_counter()
+from app import create_app
+from models import db
+{scenario}
+print(time.perf_counter() - start)
+"""
+
+
+def time_startup(scenario, runs):
+    """Return the seconds each of `runs` fresh processes took to start."""
+
+    script = SCRIPT.format(scenario=scenario)
+
+    return [
+        float(subprocess.run(
+            [sys.executable, "-c", script],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()[-1])
+        for _ in range(runs)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<14} {'median ms':>9} {'min ms':>7}")
+
+    for name, scenario in SCENARIOS.items():
+        times = time_startup(scenario, args.runs)
+        print(
+            f"{name:<14} {statistics.median(times) * 1000:>9.0f}"
+            f" {min(times) * 1000:>7.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Response compression for Warbler's pages and JSON.
+
+Compress brotli-compresses (or gzips) text responses for clients that
+accept it. Small bodies, responses that are already encoded (like the
+precompressed built assets) and files sent straight from disk are left
+alone. Streamed responses are compressed chunk
+by chunk as they're generated, flushing after each chunk so the client
+still sees output as it's produced.
+
+Compression costs CPU for every response; COMPRESS_LEVEL (gzip, 1-9) and
+COMPRESS_BROTLI_QUALITY (0-11) trade that against bytes sent. See
+benchmarks/bench_compression.py for numbers on our own pages. A
+COMPRESS_LEVEL of 0 turns compression off.
+"""
+
+import zlib
+
+import brotli
+from flask import request
+
+DEFAULT_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 4
+DEFAULT_MIN_SIZE = 500
+DEFAULT_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+}
+
+
+def gzip_compressor(level):
+    """Return a zlib compressobj that writes gzip format."""
+
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class BrotliCompressor:
+    """Adapts brotli.Compressor to the compressobj interface."""
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self, mode=None):
+        if mode == zlib.Z_SYNC_FLUSH:
+            return self._compressor.flush()
+        return self._compressor.finish()
+
+
+class Compress:
+    """Compresses responses in an after_request hook."""
+
+    def __init__(self, app=None):
+        self.level = DEFAULT_LEVEL
+        self.brotli_quality = DEFAULT_BROTLI_QUALITY
+        self.min_size = DEFAULT_MIN_SIZE
+        self.mimetypes = DEFAULT_MIMETYPES
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read settings from `app`'s config and register the hook.
+
+        Call before other extensions that rewrite response bodies (like
+        the debug toolbar), so that their hooks run first.
+        """
+
+        config = app.config
+        self.level = config.get('COMPRESS_LEVEL', self.level)
+        self.brotli_quality = config.get(
+            'COMPRESS_BROTLI_QUALITY', self.brotli_quality)
+        self.min_size = config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.mimetypes = config.get('COMPRESS_MIMETYPES', self.mimetypes)
+
+        app.after_request(self.compress_response)
+
+    def choose_encoding(self):
+        """Return the best encoding the client accepts, or None."""
+
+        return request.accept_encodings.best_match(['br', 'gzip'])
+
+    def compressor(self, encoding):
+        if encoding == 'br':
+            return BrotliCompressor(self.brotli_quality)
+        return gzip_compressor(self.level)
+
+    def should_compress(self, response):
+        if (response.mimetype not in self.mimetypes
+                or response.status_code < 200
+                or response.status_code in (204, 206, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or request.method == 'HEAD'):
+            return False
+
+        if response.is_streamed:
+            return True
+
+        return (response.content_length or 0) >= self.min_size
+
+    def compress_response(self, response):
+        """Compress `response` if it's worth it and the client accepts it."""
+
+        if not self.should_compress(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding()
+
+        if encoding is None or self.level == 0:
+            return response
+
+        compressor = self.compressor(encoding)
+
+        if response.is_streamed:
+            response.response = self.compress_stream(
+                compressor, response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = compressor.compress(response.get_data())
+            response.set_data(body + compressor.flush())
+
+        response.content_encoding = encoding
+
+        # the compressed body is a different byte sequence, so an ETag can
+        # only still claim semantic equivalence
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+    @staticmethod
+    def compress_stream(compressor, chunks):
+        """Yield compressed `chunks`, flushing after each one."""
+
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('UTF-8')
+                if chunk:
+                    yield (compressor.compress(chunk)
+                           + compressor.flush(zlib.Z_SYNC_FLUSH))
+            yield compressor.flush()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
@@ -0,0 +1,142 @@
+"""Configuration profiles for create_app.
+
+Settings come from the environment (and .env). Pick a profile by passing
+its name to create_app, or with the WARBLER_CONFIG environment variable:
+
+- production (the default): no debug toolbar
+- development: debug mode and the debug toolbar
+- testing: the test database, no CSRF and cheap password hashing
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+from account_deletion import (
+    DEFAULT_CHUNK_SIZE as DEFAULT_DELETION_CHUNK_SIZE,
+    DEFAULT_WORKERS as DEFAULT_DELETION_WORKERS)
+from compression import DEFAULT_BROTLI_QUALITY, DEFAULT_LEVEL
+from follow_graph import (
+    DEFAULT_CHECK_INTERVAL as DEFAULT_FOLLOW_GRAPH_CHECK_INTERVAL,
+    DEFAULT_REBUILD_INTERVAL as DEFAULT_FOLLOW_GRAPH_REBUILD_INTERVAL)
+from hashing import DEFAULT_LOG_ROUNDS, DEFAULT_MAX_PENDING, DEFAULT_WORKERS
+from identity import (
+    DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL, default_versions_path)
+from like_buffer import DEFAULT_FLUSH_INTERVAL, DEFAULT_FLUSH_SIZE
+from page_cache import DEFAULT_PAGE_CACHE_TTL
+from pagination import DEFAULT_PAGE_SIZE
+from replicas import DEFAULT_READ_YOUR_WRITES_SECONDS
+from timeline import DEFAULT_FANOUT_LIMIT
+from trending import (
+    DEFAULT_HALF_LIFE, DEFAULT_REBUILD_INTERVAL, DEFAULT_SIZE, DEFAULT_WINDOW)
+
+load_dotenv()
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+    SQLALCHEMY_ECHO = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 30 * 60)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') != '0',
+    }
+
+    # comma-separated read replica URLs; see replicas.py
+    SQLALCHEMY_REPLICA_URIS = [
+        url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+        if url
+    ]
+    READ_YOUR_WRITES_SECONDS = float(os.environ.get(
+        'READ_YOUR_WRITES_SECONDS', DEFAULT_READ_YOUR_WRITES_SECONDS))
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+
+    DEBUG_TB_ENABLED = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = True
+
+    TIMELINE_FANOUT_LIMIT = int(
+        os.environ.get('TIMELINE_FANOUT_LIMIT', DEFAULT_FANOUT_LIMIT))
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE', DEFAULT_PAGE_SIZE))
+    TYPEAHEAD_LIMIT = 10
+    BCRYPT_LOG_ROUNDS = int(
+        os.environ.get('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS))
+    PASSWORD_HASH_WORKERS = int(
+        os.environ.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS))
+    PASSWORD_HASH_MAX_PENDING = int(
+        os.environ.get('PASSWORD_HASH_MAX_PENDING', DEFAULT_MAX_PENDING))
+    SEND_FILE_MAX_AGE_DEFAULT = int(
+        os.environ.get('STATIC_MAX_AGE', 24 * 60 * 60))
+    IDENTITY_CACHE_SIZE = int(
+        os.environ.get('IDENTITY_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+    IDENTITY_CACHE_TTL = float(
+        os.environ.get('IDENTITY_CACHE_TTL', DEFAULT_CACHE_TTL))
+    IDENTITY_VERSIONS_PATH = os.environ.get(
+        'IDENTITY_VERSIONS_PATH', default_versions_path())
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', DEFAULT_LEVEL))
+    COMPRESS_BROTLI_QUALITY = int(
+        os.environ.get('COMPRESS_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY))
+    FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL')
+    PAGE_CACHE_TTL = int(
+        os.environ.get('PAGE_CACHE_TTL', DEFAULT_PAGE_CACHE_TTL))
+    PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR')
+    ACCOUNT_DELETION_WORKERS = int(os.environ.get(
+        'ACCOUNT_DELETION_WORKERS', DEFAULT_DELETION_WORKERS))
+    ACCOUNT_DELETION_CHUNK_SIZE = int(os.environ.get(
+        'ACCOUNT_DELETION_CHUNK_SIZE', DEFAULT_DELETION_CHUNK_SIZE))
+    LIKE_BUFFER_URL = os.environ.get('LIKE_BUFFER_URL')
+    LIKE_BUFFER_INTERVAL = float(
+        os.environ.get('LIKE_BUFFER_INTERVAL', DEFAULT_FLUSH_INTERVAL))
+    LIKE_BUFFER_FLUSH_SIZE = int(
+        os.environ.get('LIKE_BUFFER_FLUSH_SIZE', DEFAULT_FLUSH_SIZE))
+    TRENDING_URL = os.environ.get('TRENDING_URL')
+    TRENDING_SIZE = int(os.environ.get('TRENDING_SIZE', DEFAULT_SIZE))
+    TRENDING_WINDOW = int(os.environ.get('TRENDING_WINDOW', DEFAULT_WINDOW))
+    TRENDING_HALF_LIFE = int(
+        os.environ.get('TRENDING_HALF_LIFE', DEFAULT_HALF_LIFE))
+    TRENDING_REBUILD_INTERVAL = int(os.environ.get(
+        'TRENDING_REBUILD_INTERVAL', DEFAULT_REBUILD_INTERVAL))
+    FOLLOW_GRAPH_PATH = os.environ.get('FOLLOW_GRAPH_PATH')
+    FOLLOW_GRAPH_REBUILD_INTERVAL = int(os.environ.get(
+        'FOLLOW_GRAPH_REBUILD_INTERVAL', DEFAULT_FOLLOW_GRAPH_REBUILD_INTERVAL))
+    FOLLOW_GRAPH_CHECK_INTERVAL = float(os.environ.get(
+        'FOLLOW_GRAPH_CHECK_INTERVAL', DEFAULT_FOLLOW_GRAPH_CHECK_INTERVAL))
+
+
+class ProductionConfig(Config):
+    pass
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    DEBUG_TB_ENABLED = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', 'postgresql:///warbler_test')
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'testing')
+    SQLALCHEMY_REPLICA_URIS = []
+    WTF_CSRF_ENABLED = False
+    BCRYPT_LOG_ROUNDS = 4
+    FRAGMENT_CACHE_URL = None
+    PAGE_CACHE_DIR = None
+    # tests purge deleted users themselves
+    ACCOUNT_DELETION_WORKERS = 0
+    # like counts written in the request, so tests can read them back
+    LIKE_BUFFER_URL = None
+    LIKE_BUFFER_INTERVAL = 0
+    TRENDING_URL = None
+    TRENDING_REBUILD_INTERVAL = 0
+    FOLLOW_GRAPH_PATH = None
+
+
+PROFILES = {
+    'production': ProductionConfig,
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+}
@@ -0,0 +1,137 @@
+"""Denormalized counters on User and Message.
+
+Profile headers and like buttons read counts from columns on the row
+instead of loading whole collections. The routes that add or remove
+messages, follows and likes update these counts in the same transaction,
+using `col = col + delta` so concurrent requests don't lose updates.
+Messages' like counts may instead be written behind (see like_buffer.py).
+
+`reconcile_counters` recomputes every counter from the source tables to
+repair any drift.
+"""
+
+from flask import current_app
+from sqlalchemy import func, select, update
+
+from models import db, Follow, Like, Message, User
+
+
+def bump(model, ids, **deltas):
+    """Add `deltas` (column name -> amount) to the rows of `model` in `ids`.
+
+    `ids` is a single id, a list of ids, or a select of ids.
+    """
+
+    if isinstance(ids, int):
+        ids = [ids]
+
+    db.session.execute(
+        update(model)
+        .where(model.id.in_(ids))
+        .values({
+            name: getattr(model, name) + delta
+            for name, delta in deltas.items()
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+def record_message(user_id, delta=1):
+    """Count a message added (or removed, with delta=-1) by `user_id`."""
+
+    bump(User, user_id, messages_count=delta)
+
+
+def record_follow(follower_id, followed_id, delta=1):
+    """Count a follow added (or removed, with delta=-1)."""
+
+    bump(User, follower_id, following_count=delta)
+    bump(User, followed_id, followers_count=delta)
+
+
+def record_like(user_id, message_id, delta=1):
+    """Count a like added (or removed, with delta=-1).
+
+    The message's count goes through the app's like buffer, if it has one
+    (see like_buffer.py).
+    """
+
+    bump(User, user_id, likes_count=delta)
+
+    like_buffer = current_app.extensions.get('like_buffer')
+    if like_buffer is not None:
+        like_buffer.record(message_id, delta)
+    else:
+        bump(Message, message_id, likes_count=delta)
+
+
+def remove_message(msg):
+    """Uncount message `msg` and the likes that deleting it will cascade.
+
+    Call before deleting the message.
+    """
+
+    record_message(msg.user_id, -1)
+    bump(
+        User,
+        select(Like.user_id).where(Like.message_id == msg.id),
+        likes_count=-1,
+    )
+
+
+def reconcile_counters():
+    """Recompute every counter from the source tables.
+
+    Returns a dict of counter name -> number of rows that had drifted.
+    """
+
+    counters = {
+        'users.messages_count': (
+            User,
+            User.messages_count,
+            select(func.count())
+            .where(Message.user_id == User.id)
+            .scalar_subquery(),
+        ),
+        'users.followers_count': (
+            User,
+            User.followers_count,
+            select(func.count())
+            .where(Follow.user_being_followed_id == User.id)
+            .scalar_subquery(),
+        ),
+        'users.following_count': (
+            User,
+            User.following_count,
+            select(func.count())
+            .where(Follow.user_following_id == User.id)
+            .scalar_subquery(),
+        ),
+        'users.likes_count': (
+            User,
+            User.likes_count,
+            select(func.count())
+            .where(Like.user_id == User.id)
+            .scalar_subquery(),
+        ),
+        'messages.likes_count': (
+            Message,
+            Message.likes_count,
+            select(func.count())
+            .where(Like.message_id == Message.id)
+            .scalar_subquery(),
+        ),
+    }
+
+    drifted = {}
+
+    for name, (model, column, actual) in counters.items():
+        result = db.session.execute(
+            update(model)
+            .where(column != actual)
+            .values({column.key: actual})
+            .execution_options(synchronize_session=False)
+        )
+        drifted[name] = result.rowcount
+
+    return drifted
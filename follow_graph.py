@@ -0,0 +1,463 @@
+"""A memory-mapped snapshot of who follows whom.
+
+Follow buttons, "follows you" and "followed by people you follow" ask the
+same few questions of the follows table on nearly every page. With
+FOLLOW_GRAPH_PATH set, they're answered from a snapshot file instead:
+
+- a header, then two compressed sparse row (CSR) graphs of int32s: for
+  each user id, an offset into a sorted array of the users they follow,
+  and the same for the users following them;
+- every worker process maps the file read-only, so the operating system
+  keeps one copy in memory for all of them;
+- "does a follow b" is a binary search in a's row, and intersections walk
+  the shorter row, binary-searching the longer.
+
+Follows and unfollows since the snapshot are appended, once committed, to
+a small log file next to it. Every worker replays the log into an
+in-memory overlay that takes precedence over the snapshot. Every
+FOLLOW_GRAPH_REBUILD_INTERVAL seconds one process on the host (holding a
+lock file) writes a fresh snapshot, and `flask build-follow-graph` does the
+same on demand. Each snapshot has its own log and records how far the
+previous one had got, so that follows made during a rebuild aren't lost.
+
+The files are per host. Without FOLLOW_GRAPH_PATH, or if several hosts
+serve the site, leave it unset and the questions go to the database.
+"""
+
+import bisect
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+
+from sqlalchemy import event, func, select
+
+from models import db, Follow, User
+from replicas import RoutingSession
+
+DEFAULT_REBUILD_INTERVAL = 5 * 60
+DEFAULT_CHECK_INTERVAL = 1.0
+
+MAGIC = b'WFG1'
+# magic, generation, rows (max user id + 1), edges, previous log offset
+HEADER = struct.Struct('<4sIIIQ')
+# follower id, followed id, 1 for a follow or -1 for an unfollow
+LOG_RECORD = struct.Struct('<iii')
+
+# rows fetched from the database at a time
+FETCH_SIZE = 100000
+
+
+def log_path(path, generation):
+    return f'{path}.log.{generation}'
+
+
+def read_generation(path):
+    """Return the generation of the snapshot at `path`, or 0 if none."""
+
+    try:
+        with open(path, 'rb') as file:
+            magic, generation, *rest = HEADER.unpack(file.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return 0
+
+    return generation if magic == MAGIC else 0
+
+
+def build_csr(rows, edges):
+    """Return (offsets, neighbors) arrays from (row, neighbor) pairs.
+
+    `edges` must be sorted by row, then neighbor.
+    """
+
+    counts = array('i', bytes(4 * (rows + 1)))
+    neighbors = array('i')
+
+    for row, neighbor in edges:
+        counts[row + 1] += 1
+        neighbors.append(neighbor)
+
+    for row in range(rows):
+        counts[row + 1] += counts[row]
+
+    return counts, neighbors
+
+
+def write_snapshot(path):
+    """Write a new snapshot of the follows table to `path`.
+
+    Returns the number of follows in it. Call with the rebuild lock held.
+    """
+
+    generation = read_generation(path)
+
+    # follows logged from here on may or may not make it into the snapshot;
+    # readers replay them either way
+    try:
+        log_offset = os.path.getsize(log_path(path, generation))
+    except FileNotFoundError:
+        log_offset = 0
+
+    rows = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+
+    def fetch(row, neighbor):
+        return db.session.execute(
+            select(row, neighbor)
+            .order_by(row, neighbor)
+            .execution_options(yield_per=FETCH_SIZE)
+        )
+
+    out_offsets, out_neighbors = build_csr(rows, fetch(
+        Follow.user_following_id, Follow.user_being_followed_id))
+    in_offsets, in_neighbors = build_csr(rows, fetch(
+        Follow.user_being_followed_id, Follow.user_following_id))
+
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.follow-graph-')
+
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(HEADER.pack(
+                MAGIC, generation + 1, rows, len(out_neighbors), log_offset))
+            for part in (out_offsets, out_neighbors, in_offsets, in_neighbors):
+                part.tofile(file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    # nobody replays logs older than the previous snapshot's
+    stale = log_path(path, generation - 1)
+    if generation and os.path.exists(stale):
+        os.unlink(stale)
+
+    return len(out_neighbors)
+
+
+class Snapshot:
+    """A mapped snapshot file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+
+        magic, self.generation, rows, edges, self.previous_log_offset = (
+            HEADER.unpack_from(self._mmap))
+        if magic != MAGIC:
+            raise ValueError(f"{path} isn't a follow graph snapshot")
+
+        ints = memoryview(self._mmap)[HEADER.size:].cast('i')
+        self.rows = rows
+        self._out_offsets = ints[:rows + 1]
+        self._out = ints[rows + 1:rows + 1 + edges]
+        start = rows + 1 + edges
+        self._in_offsets = ints[start:start + rows + 1]
+        self._in = ints[start + rows + 1:start + rows + 1 + edges]
+
+    def _row(self, offsets, neighbors, user_id):
+        """Return (neighbors, lo, hi): user_id's row is neighbors[lo:hi]."""
+
+        if not 0 <= user_id < self.rows:
+            return neighbors, 0, 0
+
+        return neighbors, offsets[user_id], offsets[user_id + 1]
+
+    def following(self, user_id):
+        return self._row(self._out_offsets, self._out, user_id)
+
+    def followers(self, user_id):
+        return self._row(self._in_offsets, self._in, user_id)
+
+
+def contains(row, value):
+    """Is `value` in sorted row (neighbors, lo, hi)?"""
+
+    neighbors, lo, hi = row
+    i = bisect.bisect_left(neighbors, value, lo, hi)
+    return i < hi and neighbors[i] == value
+
+
+def intersect(a, b):
+    """Return the sorted values in both sorted rows `a` and `b`."""
+
+    if a[2] - a[1] > b[2] - b[1]:
+        a, b = b, a
+
+    neighbors, lo, hi = a
+    return [value for value in neighbors[lo:hi] if contains(b, value)]
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def log_committed_follows(db_session):
+    """Log the follows and unfollows of a transaction that committed."""
+
+    for graph, follower_id, followed_id, op in db_session.info.pop(
+            'follow_graph', ()):
+        graph.log(follower_id, followed_id, op)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def drop_rolled_back_follows(db_session):
+    db_session.info.pop('follow_graph', None)
+
+
+class FollowGraph:
+    """Answers follow questions from the snapshot, or the database."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.path = None
+        self.rebuild_interval = DEFAULT_REBUILD_INTERVAL
+        self.check_interval = DEFAULT_CHECK_INTERVAL
+        self._snapshot = None
+        self._checked = 0
+        # (follower, followed) -> whether they follow, since the snapshot
+        self._overlay = {}
+        self._log_offsets = {}
+        self._lock = threading.RLock()
+        self._rebuilder_pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read settings from `app`'s config."""
+
+        config = app.config
+        self.app = app
+        self.path = config.get('FOLLOW_GRAPH_PATH')
+        self.rebuild_interval = config.get(
+            'FOLLOW_GRAPH_REBUILD_INTERVAL', self.rebuild_interval)
+        self.check_interval = config.get(
+            'FOLLOW_GRAPH_CHECK_INTERVAL', self.check_interval)
+
+        app.extensions['follow_graph'] = self
+
+    # Keeping up to date
+
+    def record_follow(self, follower_id, followed_id, op=1):
+        """Log a follow (or, with op=-1, unfollow) once it's committed."""
+
+        if self.path:
+            db.session.info.setdefault('follow_graph', []).append(
+                (self, follower_id, followed_id, op))
+
+    def log(self, follower_id, followed_id, op):
+        """Append a committed follow or unfollow to the current log."""
+
+        snapshot = self._current()
+        generation = snapshot.generation if snapshot else 0
+
+        fd = os.open(
+            log_path(self.path, generation),
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+            0o644,
+        )
+        try:
+            os.write(fd, LOG_RECORD.pack(follower_id, followed_id, op))
+        finally:
+            os.close(fd)
+
+        with self._lock:
+            self._overlay[(follower_id, followed_id)] = op > 0
+
+    def _current(self):
+        """Return the current Snapshot (or None), remapping and replaying
+        logs at most every check_interval seconds.
+        """
+
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._snapshot
+
+        with self._lock:
+            self._checked = now
+            self._start_rebuilder()
+
+            try:
+                stat = os.stat(self.path)
+                identity = (stat.st_ino, stat.st_mtime_ns)
+            except FileNotFoundError:
+                identity = None
+
+            if identity is None:
+                # removed: back to the database
+                self._snapshot = None
+                self._overlay = {}
+                self._log_offsets = {}
+            elif (self._snapshot is None
+                    or self._snapshot.identity != identity):
+                snapshot = Snapshot(self.path)
+                self._snapshot = snapshot
+                self._overlay = {}
+                self._log_offsets = {
+                    log_path(self.path, snapshot.generation - 1):
+                        snapshot.previous_log_offset,
+                    log_path(self.path, snapshot.generation): 0,
+                }
+
+            for path, offset in self._log_offsets.items():
+                self._log_offsets[path] = self._replay(path, offset)
+
+            return self._snapshot
+
+    def _replay(self, path, offset):
+        """Apply log records after `offset` to the overlay; return the end."""
+
+        try:
+            with open(path, 'rb') as file:
+                file.seek(offset)
+                data = file.read()
+        except FileNotFoundError:
+            return offset
+
+        whole = len(data) - len(data) % LOG_RECORD.size
+        for follower_id, followed_id, op in LOG_RECORD.iter_unpack(
+                data[:whole]):
+            self._overlay[(follower_id, followed_id)] = op > 0
+
+        return offset + whole
+
+    def rebuild(self):
+        """Write a fresh snapshot, unless another process is already.
+
+        Returns the number of follows written, or None if skipped.
+        """
+
+        with open(self.path + '.lock', 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+
+            try:
+                return write_snapshot(self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _start_rebuilder(self):
+        """Start this process's rebuild thread, if it hasn't one yet.
+
+        Threads don't survive fork, so each worker process starts its own.
+        """
+
+        if not self.rebuild_interval or self._rebuilder_pid == os.getpid():
+            return
+
+        threading.Thread(
+            target=self._run_rebuilder, name='follow-graph', daemon=True,
+        ).start()
+        self._rebuilder_pid = os.getpid()
+
+    def _run_rebuilder(self):
+        while True:
+            time.sleep(self.rebuild_interval)
+
+            # only one process needs to; the rest skip until the next time
+            try:
+                age = time.time() - os.path.getmtime(self.path)
+            except FileNotFoundError:
+                age = self.rebuild_interval
+            if age < self.rebuild_interval:
+                continue
+
+            with self.app.app_context():
+                try:
+                    self.rebuild()
+                except Exception:
+                    self.app.logger.exception("rebuilding follow graph failed")
+
+    # Questions
+
+    def _overlaid(self, snapshot, follower_id, followed_id):
+        """Does `follower_id` follow `followed_id`, by the snapshot + log?"""
+
+        followed = self._overlay.get((follower_id, followed_id))
+        if followed is not None:
+            return followed
+
+        return contains(snapshot.following(follower_id), followed_id)
+
+    def is_following(self, follower_id, followed_id):
+        """Does `follower_id` follow `followed_id`?"""
+
+        snapshot = self._snapshot_or_none()
+        if snapshot is None:
+            return db.session.query(
+                Follow.query.filter_by(
+                    user_following_id=follower_id,
+                    user_being_followed_id=followed_id,
+                ).exists()
+            ).scalar()
+
+        return self._overlaid(snapshot, follower_id, followed_id)
+
+    def following_among(self, follower_id, user_ids):
+        """Return the set of `user_ids` that `follower_id` follows."""
+
+        if not user_ids:
+            return set()
+
+        snapshot = self._snapshot_or_none()
+        if snapshot is None:
+            return set(db.session.scalars(
+                select(Follow.user_being_followed_id)
+                .where(Follow.user_following_id == follower_id)
+                .where(Follow.user_being_followed_id.in_(user_ids))
+            ))
+
+        return {
+            user_id for user_id in user_ids
+            if self._overlaid(snapshot, follower_id, user_id)
+        }
+
+    def followers_known_to(self, viewer_id, user_id):
+        """Return ids of the users `viewer_id` follows who follow `user_id`."""
+
+        snapshot = self._snapshot_or_none()
+        if snapshot is None:
+            return list(db.session.scalars(
+                select(Follow.user_following_id)
+                .where(Follow.user_being_followed_id == user_id)
+                .where(Follow.user_following_id.in_(
+                    select(Follow.user_being_followed_id)
+                    .where(Follow.user_following_id == viewer_id)))
+                .order_by(Follow.user_following_id)
+            ))
+
+        known = set(intersect(
+            snapshot.following(viewer_id), snapshot.followers(user_id)))
+
+        # recheck anyone whose follows of the viewer or by the user changed
+        with self._lock:
+            changed = list(self._overlay)
+
+        for follower_id, followed_id in changed:
+            if follower_id == viewer_id:
+                candidate = followed_id
+            elif followed_id == user_id:
+                candidate = follower_id
+            else:
+                continue
+
+            if (self._overlaid(snapshot, viewer_id, candidate)
+                    and self._overlaid(snapshot, candidate, user_id)):
+                known.add(candidate)
+            else:
+                known.discard(candidate)
+
+        known.discard(viewer_id)
+        return sorted(known)
+
+    def _snapshot_or_none(self):
+        if not self.path:
+            return None
+
+        return self._current()
@@ -0,0 +1,164 @@
+"""Cached template fragments.
+
+Templates wrap markup that's expensive to re-render and the same for every
+viewer in a cache tag:
+
+    {% cache ('user-card', author_stamp(user)), 600 %}
+      ...
+    {% endcache %}
+
+The key is any repr-able value; build it from the entity's id and a
+version stamp of everything the fragment shows (see http_cache), so that a
+change to the entity changes the key rather than needing an invalidation.
+The TTL (seconds) is optional. Anything that depends on the viewer, such
+as like and follow buttons or CSRF tokens, must stay outside the tag.
+
+Fragments are kept in a per-process LRU store, or in Redis when
+FRAGMENT_CACHE_URL is set (and the redis package is installed), so that
+workers and hosts share them.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from http_cache import make_etag
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 600
+
+
+class LRUStore:
+    """In-process LRU + TTL store for rendered fragments."""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the fragment stored under `key`, or None."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store `value` under `key` for `ttl` seconds."""
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisStore:
+    """Fragment store shared by every process using the same Redis."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "FRAGMENT_CACHE_URL is set but redis isn't installed")
+
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._redis.get(key)
+        return None if value is None else value.decode('UTF-8')
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, value.encode('UTF-8'), ex=max(int(ttl), 1))
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the {% cache key[, ttl] %}...{% endcache %} tag."""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        return nodes.CallBlock(
+            self.call_method('_render', args), [], [], body,
+        ).set_lineno(lineno)
+
+    def _render(self, key, ttl, caller):
+        cache = self.environment.fragment_cache
+
+        if cache is None:
+            return caller()
+
+        return cache.get_or_render(key, ttl, caller)
+
+
+class FragmentCache:
+    """Renders template fragments through a pluggable store."""
+
+    prefix = 'fragment:'
+
+    def __init__(self, app=None, store=None):
+        self.store = store
+        self.default_ttl = DEFAULT_CACHE_TTL
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick a store from `app`'s config and enable the cache tag."""
+
+        config = app.config
+        self.default_ttl = config.get('FRAGMENT_CACHE_TTL', self.default_ttl)
+
+        if self.store is None:
+            if config.get('FRAGMENT_CACHE_URL'):
+                self.store = RedisStore(config['FRAGMENT_CACHE_URL'])
+            else:
+                self.store = LRUStore(
+                    config.get('FRAGMENT_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+    def get_or_render(self, key, ttl, render):
+        """Return the cached fragment for `key`, rendering it on a miss."""
+
+        store_key = self.prefix + make_etag(key)
+        fragment = self.store.get(store_key)
+
+        if fragment is None:
+            fragment = str(render())
+            self.store.set(store_key, fragment, ttl or self.default_ttl)
+
+        return Markup(fragment)
@@ -0,0 +1,121 @@
+"""Password hashing for Warbler.
+
+bcrypt is deliberately slow, and a burst of logins can tie up every
+request worker hashing. PasswordHasher runs bcrypt in a small thread pool
+(bcrypt releases the GIL while it works) and refuses new work with
+HashingBusy once too much is queued, so a burst fails fast instead of
+stalling the whole worker.
+
+The work factor comes from BCRYPT_LOG_ROUNDS. Hashes made with a
+different cost are upgraded the next time their owner logs in.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import bcrypt
+
+DEFAULT_LOG_ROUNDS = 12
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 16
+DEFAULT_TIMEOUT = 10
+
+
+class HashingBusy(Exception):
+    """Too many passwords are already waiting to be hashed, or waited too
+    long."""
+
+
+class PasswordHasher:
+    """Hashes and checks passwords with bcrypt in a bounded thread pool."""
+
+    def __init__(
+            self,
+            log_rounds=DEFAULT_LOG_ROUNDS,
+            workers=DEFAULT_WORKERS,
+            max_pending=DEFAULT_MAX_PENDING,
+            timeout=DEFAULT_TIMEOUT):
+        self.log_rounds = log_rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._executor_pid = None
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def init_app(self, app):
+        """Read settings from `app`'s config."""
+
+        config = app.config
+        self.log_rounds = config.get('BCRYPT_LOG_ROUNDS', self.log_rounds)
+        self.workers = config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = config.get(
+            'PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.timeout = config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+
+    def _get_executor(self):
+        """Return this process's thread pool.
+
+        Threads don't survive fork, so each worker process starts its own.
+        """
+
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='bcrypt',
+            )
+            self._executor_pid = os.getpid()
+
+        return self._executor
+
+    def _run(self, fn, *args):
+        """Run `fn(*args)` in the pool and wait for the result.
+
+        Raises HashingBusy if max_pending calls are already queued or
+        running, or if the result takes longer than `timeout` seconds.
+        """
+
+        if not self._pending.acquire(blocking=False):
+            raise HashingBusy()
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+
+        future.add_done_callback(lambda future: self._pending.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # if it hasn't started, don't bother
+            future.cancel()
+            raise HashingBusy()
+
+    def hash(self, password):
+        """Return a bcrypt hash of `password` at the configured cost."""
+
+        salt = bcrypt.gensalt(rounds=self.log_rounds)
+        hashed = self._run(bcrypt.hashpw, password.encode('UTF-8'), salt)
+        return hashed.decode('UTF-8')
+
+    def check(self, hashed, password):
+        """Does `password` match bcrypt hash `hashed`?"""
+
+        return self._run(
+            bcrypt.checkpw,
+            password.encode('UTF-8'),
+            hashed.encode('UTF-8'),
+        )
+
+    def needs_rehash(self, hashed):
+        """Was `hashed` made with a different cost than the configured one?"""
+
+        # bcrypt hashes look like $2b$12$<salt and hash>
+        try:
+            return int(hashed.split('$')[2]) != self.log_rounds
+        except (IndexError, ValueError):
+            return True
@@ -0,0 +1,128 @@
+"""HTTP caching for Warbler's pages.
+
+Pages are sent with an ETag built from cheap version stamps of what they
+show: row ids, counters and the viewer's identity, all of which the view
+has already loaded. If the browser's If-None-Match already has that ETag,
+the view answers 304 Not Modified without rendering the template.
+
+Pages are per-viewer, so they're marked private and must be revalidated
+on every use (no-cache). Responses with no policy of their own (redirects,
+forms, error pages) stay no-store.
+"""
+
+import time
+from hashlib import sha1
+
+from flask import (
+    current_app, g, make_response, render_template, request, session)
+from flask_wtf.csrf import generate_csrf
+
+from like_buffer import likes_count
+
+
+def make_etag(*parts):
+    """Return an ETag value for the version stamps in `parts`."""
+
+    return sha1(repr(parts).encode()).hexdigest()
+
+
+def csrf_epoch():
+    """A number that changes twice per CSRF token lifetime.
+
+    Pages embed CSRF tokens, so a cached copy must not outlive them.
+    """
+
+    time_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT') or 3600
+    return int(time.time() // (time_limit / 2))
+
+
+def csrf_secret_stamp():
+    """A hash of the session's CSRF secret, which pages' tokens come from.
+
+    A new session (say, logging in again) gets a new secret, and tokens in
+    pages cached under the old one no longer validate.
+    """
+
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        # the page will make one if the session hasn't one yet
+        generate_csrf()
+
+    field_name = current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token')
+    secret = session.get(field_name)
+
+    return sha1(secret.encode()).hexdigest() if secret else None
+
+
+def viewer_stamp():
+    """Version stamp for the viewer-specific parts of every page."""
+
+    principal = g.user.principal if g.user else None
+    return (principal, csrf_epoch(), csrf_secret_stamp())
+
+
+def user_stamp(user):
+    """Version stamp for how `user` appears on a page."""
+
+    return (
+        user.id,
+        user.username,
+        user.image_url,
+        user.header_image_url,
+        user.bio,
+        user.location,
+        user.messages_count,
+        user.following_count,
+        user.followers_count,
+        user.likes_count,
+    )
+
+
+def author_stamp(user):
+    """Version stamp for `user` as shown next to their messages."""
+
+    return (user.id, user.username, user.image_url)
+
+
+def message_stamp(msg):
+    """Version stamp for how `msg` appears on a page (author excluded)."""
+
+    return (msg.id, msg.user_id, likes_count(msg))
+
+
+def render_conditional(template, stamp, weak=True, **context):
+    """Render `template` with `context`, or 304 if the client is current.
+
+    `stamp` must change whenever the rendered page would; the request path
+    and the viewer are added automatically. Use weak=False only where the
+    page is byte-for-byte determined by the stamp.
+    """
+
+    etag = make_etag(template, request.full_path, viewer_stamp(), stamp)
+
+    # flashed messages are rendered into the page but aren't in the stamp
+    if not session.get('_flashes') and request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(render_template(template, **context))
+
+    response.set_etag(etag, weak=weak)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+
+    return response
+
+
+def add_cache_headers(response):
+    """Default caching policy, for responses that didn't set their own.
+
+    Static files may be cached (and are revalidated by their ETag and
+    Last-Modified); everything else is no-store.
+    """
+
+    if request.endpoint == 'static':
+        response.cache_control.public = True
+    elif not response.cache_control:
+        response.cache_control.no_store = True
+
+    return response
@@ -0,0 +1,201 @@
+"""Cached identity of the logged-in user.
+
+Every request from a logged-in user needs to know who they are, but most
+only need their id, username and avatar. Those are kept in a per-process
+LRU cache with a TTL, so the before_request hook doesn't hit the database.
+
+Each cached entry carries a version stamp. Versions live in a small
+memory-mapped file shared by every worker process on the host; bumping a
+user's version (after a profile edit or account deletion) makes every
+worker reload that user on its next request. The TTL bounds staleness
+when workers don't share the file (e.g. across hosts).
+"""
+
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+
+from models import db, User
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 60
+DEFAULT_VERSION_SLOTS = 65536
+
+Principal = namedtuple('Principal', ['id', 'username', 'image_url', 'version'])
+
+
+class VersionTable:
+    """Per-user version counters in a file shared by all worker processes.
+
+    Users hash into a fixed number of slots, so two users can share a slot;
+    that only causes an extra reload, never a stale read.
+    """
+
+    def __init__(self, path, slots=DEFAULT_VERSION_SLOTS):
+        size = slots * 4
+
+        with open(path, 'a+b') as file:
+            if os.path.getsize(path) < size:
+                file.truncate(size)
+            self._mmap = mmap.mmap(file.fileno(), size)
+
+        self._versions = memoryview(self._mmap).cast('I')
+        self.slots = slots
+
+    def get(self, user_id):
+        """Return the current version for `user_id`."""
+
+        return self._versions[user_id % self.slots]
+
+    def bump(self, user_id):
+        """Change the version for `user_id`, invalidating cached copies."""
+
+        slot = user_id % self.slots
+        self._versions[slot] = (self._versions[slot] + 1) & 0xFFFFFFFF
+
+
+class IdentityCache:
+    """LRU + TTL cache of Principals, keyed by user id."""
+
+    def __init__(
+            self,
+            versions=None,
+            maxsize=DEFAULT_CACHE_SIZE,
+            ttl=DEFAULT_CACHE_TTL):
+        self.versions = versions
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read settings from `app`'s config and open the version file."""
+
+        config = app.config
+        self.maxsize = config.get('IDENTITY_CACHE_SIZE', self.maxsize)
+        self.ttl = config.get('IDENTITY_CACHE_TTL', self.ttl)
+        self.versions = VersionTable(
+            config.get('IDENTITY_VERSIONS_PATH') or default_versions_path())
+
+    def get(self, user_id):
+        """Return the Principal for `user_id`, or None if there's no such user.
+
+        Loads from the database only on a miss, expiry or version change.
+        """
+
+        version = self.versions.get(user_id)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry:
+                principal, expires = entry
+                if principal.version == version and expires > now:
+                    self._entries.move_to_end(user_id)
+                    return principal
+
+        row = (db.session
+               .query(User.id, User.username, User.image_url)
+               .filter(User.id == user_id, User.deleted_at.is_(None))
+               .one_or_none())
+
+        if row is None:
+            self.discard(user_id)
+            return None
+
+        principal = Principal(*row, version=version)
+
+        with self._lock:
+            self._entries[user_id] = (principal, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return principal
+
+    def discard(self, user_id):
+        """Drop `user_id` from this process's cache."""
+
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def invalidate(self, user_id):
+        """Invalidate `user_id` in every worker process.
+
+        Call after committing a change to the user's identity fields.
+        """
+
+        self.versions.bump(user_id)
+        self.discard(user_id)
+
+
+def default_versions_path():
+    """Path of the shared version file used when none is configured."""
+
+    return os.path.join(tempfile.gettempdir(), 'warbler-identity-versions')
+
+
+class CurrentUser:
+    """The logged-in user, for g.user.
+
+    id, username and image_url come from the cached Principal. Anything
+    else loads the full User from the database the first time it's used.
+    """
+
+    def __init__(self, principal):
+        self.principal = principal
+        self._user = None
+
+    @property
+    def id(self):
+        return self.principal.id
+
+    @property
+    def username(self):
+        return self.principal.username
+
+    @property
+    def image_url(self):
+        return self.principal.image_url
+
+    def load(self):
+        """Return the full User, loading it on first use."""
+
+        if self._user is None:
+            self._user = db.session.get(User, self.principal.id)
+        return self._user
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    # These only need the user's id, so they don't load the User. Follow
+    # questions go to the follow graph, which may answer from its snapshot.
+
+    def is_following(self, other_user):
+        return current_app.extensions['follow_graph'].is_following(
+            self.id, other_user.id)
+
+    def is_followed_by(self, other_user):
+        return current_app.extensions['follow_graph'].is_following(
+            other_user.id, self.id)
+
+    def following_ids_among(self, user_ids):
+        return current_app.extensions['follow_graph'].following_among(
+            self.id, user_ids)
+
+    def followers_known_to_me(self, other_user):
+        """Return ids of the users I follow who follow `other_user`."""
+
+        return current_app.extensions['follow_graph'].followers_known_to(
+            self.id, other_user.id)
+
+    liked_message_ids = User.liked_message_ids
+    has_liked = User.has_liked
+
+    def __repr__(self):
+        return f"<CurrentUser #{self.id}: {self.username}>"
@@ -0,0 +1,299 @@
+"""Write-behind like counts for messages.
+
+Every like of a popular message used to update that message's row in the
+liking request's transaction, so concurrent likes of a viral message
+queued up on its row lock. Instead, LikeBuffer collects each message's
+likes_count changes once their transactions commit and a background
+thread writes them in one batch of UPDATEs every LIKE_BUFFER_INTERVAL
+seconds, or sooner once LIKE_BUFFER_FLUSH_SIZE messages are waiting.
+
+Pending changes are kept per process, or in Redis when LIKE_BUFFER_URL is
+set (and the redis package is installed), so that workers and hosts share
+one buffer. Pages show counts through likes_count(msg), which adds the
+pending change to the stored count. Whatever is left is written when the
+process exits; changes lost to a crash are repaired by
+`flask reconcile-counters`.
+
+With LIKE_BUFFER_INTERVAL set to 0, counts are updated in the request's
+transaction as before.
+"""
+
+import atexit
+import os
+import threading
+
+from flask import current_app, g
+from sqlalchemy import bindparam, event, update
+
+import counters
+from models import db, Message
+from replicas import RoutingSession
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_FLUSH_SIZE = 1000
+
+
+class LocalDeltas:
+    """Pending likes_count changes, for this process only."""
+
+    def __init__(self):
+        self._deltas = {}
+        self._flushing = {}
+        self._lock = threading.Lock()
+
+    def add(self, message_id, delta):
+        """Add `delta` to `message_id`'s change; return how many are pending."""
+
+        with self._lock:
+            delta += self._deltas.get(message_id, 0)
+            if delta:
+                self._deltas[message_id] = delta
+            else:
+                self._deltas.pop(message_id, None)
+
+            return len(self._deltas)
+
+    def get_many(self, message_ids):
+        """Return {message id: pending change} for `message_ids`.
+
+        Includes changes that are being written right now.
+        """
+
+        with self._lock:
+            return {
+                message_id: (self._deltas.get(message_id, 0)
+                             + self._flushing.get(message_id, 0))
+                for message_id in message_ids
+            }
+
+    def drain(self):
+        """Take every pending change, to be written."""
+
+        with self._lock:
+            self._flushing, self._deltas = self._deltas, {}
+            return dict(self._flushing)
+
+    def done(self):
+        """The drained changes have been written."""
+
+        with self._lock:
+            self._flushing = {}
+
+    def restore(self, deltas):
+        """The drained changes couldn't be written; put them back."""
+
+        with self._lock:
+            self._flushing = {}
+            for message_id, delta in deltas.items():
+                self._deltas[message_id] = (
+                    self._deltas.get(message_id, 0) + delta)
+
+
+class RedisDeltas:
+    """Pending likes_count changes shared by every process using one Redis.
+
+    Changes being written by some process aren't visible to reads until
+    they land in the database, a fraction of a second later.
+    """
+
+    key = 'like-deltas'
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "LIKE_BUFFER_URL is set but redis isn't installed")
+
+        self._redis = redis.Redis.from_url(url)
+
+    def add(self, message_id, delta):
+        pipe = self._redis.pipeline()
+        pipe.hincrby(self.key, message_id, delta)
+        pipe.hlen(self.key)
+        return pipe.execute()[1]
+
+    def get_many(self, message_ids):
+        if not message_ids:
+            return {}
+
+        values = self._redis.hmget(self.key, list(message_ids))
+        return {
+            message_id: int(value or 0)
+            for message_id, value in zip(message_ids, values)
+        }
+
+    def drain(self):
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hgetall(self.key)
+        pipe.delete(self.key)
+        deltas = pipe.execute()[0]
+
+        return {
+            int(message_id): int(delta)
+            for message_id, delta in deltas.items()
+            if int(delta)
+        }
+
+    def done(self):
+        pass
+
+    def restore(self, deltas):
+        pipe = self._redis.pipeline()
+        for message_id, delta in deltas.items():
+            pipe.hincrby(self.key, message_id, delta)
+        pipe.execute()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def add_committed_likes(db_session):
+    """Buffer the like count changes of a transaction that committed."""
+
+    for like_buffer, message_id, delta in db_session.info.pop('like_deltas', ()):
+        like_buffer.add(message_id, delta)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def drop_rolled_back_likes(db_session):
+    db_session.info.pop('like_deltas', None)
+
+
+def likes_count(msg):
+    """Return `msg`'s like count, including changes not yet written."""
+
+    like_buffer = current_app.extensions.get('like_buffer')
+
+    if like_buffer is None:
+        return msg.likes_count
+
+    return msg.likes_count + like_buffer.pending(msg.id)
+
+
+class LikeBuffer:
+    """Buffers changes to Message.likes_count and writes them in batches."""
+
+    def __init__(self, app=None, store=None):
+        self.app = None
+        self.store = store
+        self.interval = DEFAULT_FLUSH_INTERVAL
+        self.flush_size = DEFAULT_FLUSH_SIZE
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = None
+        self._flusher_pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick a store from `app`'s config and add likes_count to templates."""
+
+        config = app.config
+        self.app = app
+        self.interval = config.get('LIKE_BUFFER_INTERVAL', self.interval)
+        self.flush_size = config.get('LIKE_BUFFER_FLUSH_SIZE', self.flush_size)
+
+        if self.store is None:
+            if config.get('LIKE_BUFFER_URL'):
+                self.store = RedisDeltas(config['LIKE_BUFFER_URL'])
+            else:
+                self.store = LocalDeltas()
+
+        app.extensions['like_buffer'] = self
+        app.jinja_env.globals['likes_count'] = likes_count
+
+    def record(self, message_id, delta):
+        """Count a like of `message_id` added (or removed, with delta=-1).
+
+        The change is buffered when the current transaction commits.
+        """
+
+        if not self.interval:
+            counters.bump(Message, message_id, likes_count=delta)
+            return
+
+        db.session.info.setdefault('like_deltas', []).append(
+            (self, message_id, delta))
+
+    def add(self, message_id, delta):
+        """Buffer a committed change to `message_id`'s like count."""
+
+        pending = self.store.add(message_id, delta)
+        self._start_flusher()
+
+        if pending >= self.flush_size:
+            self._wake.set()
+
+    def preload(self, message_ids):
+        """Fetch the pending changes of `message_ids` for this request."""
+
+        g.like_deltas = self.store.get_many(message_ids)
+
+    def pending(self, message_id):
+        """Return the pending change to `message_id`'s like count."""
+
+        deltas = g.get('like_deltas') or {}
+
+        if message_id in deltas:
+            return deltas[message_id]
+
+        return self.store.get_many([message_id])[message_id]
+
+    def flush(self):
+        """Write every pending change; return how many messages were updated."""
+
+        with self._flush_lock:
+            deltas = self.store.drain()
+
+            if not deltas:
+                return 0
+
+            messages = Message.__table__
+            stmt = (update(messages)
+                    .where(messages.c.id == bindparam('message_id'))
+                    .values(likes_count=(
+                        messages.c.likes_count + bindparam('delta'))))
+
+            # in id order, so concurrent flushes lock rows in the same order
+            params = [
+                {'message_id': message_id, 'delta': delta}
+                for message_id, delta in sorted(deltas.items())
+            ]
+
+            try:
+                with self.app.app_context():
+                    db.session.execute(stmt, params)
+                    db.session.commit()
+            except BaseException:
+                self.store.restore(deltas)
+                raise
+
+            self.store.done()
+            return len(deltas)
+
+    def _start_flusher(self):
+        """Start this process's flusher thread, if it hasn't one yet.
+
+        Threads don't survive fork, so each worker process starts its own.
+        """
+
+        with self._start_lock:
+            if self._flusher_pid == os.getpid():
+                return
+
+            self._wake = threading.Event()
+            threading.Thread(
+                target=self._run_flusher, name='like-buffer', daemon=True,
+            ).start()
+            atexit.register(self.flush)
+            self._flusher_pid = os.getpid()
+
+    def _run_flusher(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("writing like counts failed")
@@ -0,0 +1,12 @@
+-- Denormalized counters on users and messages.
+--
+-- Run against an existing database, then fill the counters with:
+--
+--    flask reconcile-counters
+
+ALTER TABLE users ADD COLUMN messages_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN followers_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN following_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN likes_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE messages ADD COLUMN likes_count INTEGER NOT NULL DEFAULT 0;
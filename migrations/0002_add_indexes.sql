@@ -0,0 +1,25 @@
+-- Secondary indexes for the hot query shapes.
+--
+-- CONCURRENTLY builds without blocking writes; run this file outside of a
+-- transaction (e.g. psql -f, not inside BEGIN/COMMIT).
+
+-- Profile pages and the timeline pull path: one user's messages, newest first.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_user_id_timestamp
+    ON messages (user_id, timestamp DESC, id DESC);
+
+-- "Following" lists and timeline fan-in: the PK leads with the followed user.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_follows_user_following_id
+    ON follows (user_following_id, user_being_followed_id);
+
+-- A user's likes: the PK leads with message_id.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_likes_user_id
+    ON likes (user_id, message_id);
+
+-- Keyset paging on the home timeline needs message_id as a tie-breaker.
+DROP INDEX CONCURRENTLY IF EXISTS ix_timeline_entries_user_id_timestamp;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_timeline_entries_user_id_timestamp
+    ON timeline_entries (user_id, timestamp DESC, message_id DESC);
+
+-- Removing a deleted message from every timeline.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_timeline_entries_message_id
+    ON timeline_entries (message_id);
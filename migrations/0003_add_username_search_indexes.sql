@@ -0,0 +1,13 @@
+-- Indexes for username search (see search.py).
+--
+-- Run outside of a transaction; CONCURRENTLY can't run inside one.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Substring matches: lower(username) LIKE '%term%'.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_lower_trgm
+    ON users USING gin (lower(username) gin_trgm_ops);
+
+-- Prefix matches for short terms: lower(username) LIKE 'term%'.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_lower_prefix
+    ON users (lower(username) text_pattern_ops);
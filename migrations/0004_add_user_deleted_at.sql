@@ -0,0 +1,4 @@
+-- Users who have deleted their account but haven't been purged yet
+-- (see account_deletion.py).
+
+ALTER TABLE users ADD COLUMN deleted_at TIMESTAMP WITHOUT TIME ZONE;
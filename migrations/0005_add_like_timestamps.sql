@@ -0,0 +1,11 @@
+-- When each like was made, for trending (see trending.py).
+--
+-- Existing likes are stamped with the time this runs. Create the index
+-- outside of a transaction; CONCURRENTLY can't run inside one.
+
+ALTER TABLE likes
+    ADD COLUMN timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL
+    DEFAULT (now() AT TIME ZONE 'utc');
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_likes_timestamp
+    ON likes (timestamp);
@@ -0,0 +1,13 @@
+-- Who-to-follow suggestions, filled by:
+--
+--    flask build-recommendations
+
+CREATE TABLE IF NOT EXISTS recommendations (
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    recommended_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (user_id, recommended_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_recommendations_user_id_score
+    ON recommendations (user_id, score DESC);
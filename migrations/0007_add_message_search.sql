@@ -0,0 +1,16 @@
+-- Full-text search over message text (see search.py).
+--
+-- Adding the generated column rewrites the messages table under an
+-- exclusive lock, so do it in a quiet period. The index is built
+-- CONCURRENTLY; run this file outside of a transaction.
+
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', text)) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_search_vector
+    ON messages USING gin (search_vector);
+
+-- Deleted users whose messages haven't been purged yet, left out of search.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_deleted
+    ON users (id) WHERE deleted_at IS NOT NULL;
@@ -0,0 +1,29 @@
+-- #hashtags and @mentions extracted from messages (see tags.py). Fill
+-- them in for existing messages with:
+--
+--    flask backfill-tags
+
+CREATE TABLE IF NOT EXISTS hashtags (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(50) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS message_hashtags (
+    message_id INTEGER NOT NULL REFERENCES messages (id) ON DELETE CASCADE,
+    hashtag_id INTEGER NOT NULL REFERENCES hashtags (id) ON DELETE CASCADE,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (message_id, hashtag_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_message_hashtags_hashtag_id_timestamp
+    ON message_hashtags (hashtag_id, timestamp DESC, message_id DESC);
+
+CREATE TABLE IF NOT EXISTS mentions (
+    message_id INTEGER NOT NULL REFERENCES messages (id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    PRIMARY KEY (message_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_mentions_user_id_timestamp
+    ON mentions (user_id, timestamp DESC, message_id DESC);
@@ -4,9 +4,52 @@ from datetime import datetime
 
 from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, delete, event, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from hashing import PasswordHasher
+from replicas import RoutingSession
 
 bcrypt = Bcrypt()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+hasher = PasswordHasher()
+
+# text search configuration for message search (see search.py)
+TEXT_SEARCH_CONFIG = 'english'
+
+
+def _insert(model):
+    """The dialect's INSERT construct for `model`, for ON CONFLICT."""
+
+    dialect = db.session.get_bind(mapper=model).dialect.name
+    insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+
+    return insert(model)
+
+
+def insert_ignore(model, **values):
+    """INSERT a `model` row, doing nothing if it already exists.
+
+    Returns whether a row was inserted.
+    """
+
+    result = db.session.execute(
+        _insert(model).values(**values).on_conflict_do_nothing())
+    return result.rowcount == 1
+
+
+def insert_ignore_all(model, rows):
+    """INSERT `rows` (dicts) of `model`, skipping any that already exist."""
+
+    if rows:
+        db.session.execute(_insert(model).on_conflict_do_nothing(), rows)
+
+
+def delete_where(model, **values):
+    """DELETE the `model` row matching `values`; return whether there was one."""
+
+    result = db.session.execute(delete(model).filter_by(**values))
+    return result.rowcount == 1
 
 DEFAULT_IMAGE_URL = (
     "https://icon-library.com/images/default-user-icon/" +
@@ -35,6 +78,40 @@ class Follow(db.Model):
         primary_key=True,
     )
 
+    __table_args__ = (
+        db.Index(
+            'ix_follows_user_following_id',
+            'user_following_id',
+            'user_being_followed_id',
+        ),
+    )
+
+    @classmethod
+    def add(cls, follower_id, followed_id):
+        """Make `follower_id` follow `followed_id`, if they don't already.
+
+        Returns whether a follow was added.
+        """
+
+        return insert_ignore(
+            cls,
+            user_following_id=follower_id,
+            user_being_followed_id=followed_id,
+        )
+
+    @classmethod
+    def remove(cls, follower_id, followed_id):
+        """Stop `follower_id` following `followed_id`, if they do.
+
+        Returns whether a follow was removed.
+        """
+
+        return delete_where(
+            cls,
+            user_following_id=follower_id,
+            user_being_followed_id=followed_id,
+        )
+
 
 class User(db.Model):
     """User in the system."""
@@ -87,33 +164,109 @@ class User(db.Model):
         nullable=False,
     )
 
-    messages = db.relationship('Message', backref="user")
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    # set when the user deletes their account; the rows are removed later
+    # (see account_deletion.py)
+    deleted_at = db.Column(
+        db.DateTime,
+        nullable=True,
+    )
+
+    # passive_deletes: the database cascades these when a user is deleted,
+    # so the ORM needn't load them first
+    messages = db.relationship('Message', backref="user", passive_deletes=True)
 
     followers = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follow.user_being_followed_id == id),
         secondaryjoin=(Follow.user_following_id == id),
-        backref="following",
+        backref=db.backref("following", passive_deletes=True),
+        passive_deletes=True,
     )
 
     likes = db.relationship(
         "Message",
         secondary="likes",
-        backref="likers"
+        backref=db.backref("likers", passive_deletes=True),
+        passive_deletes=True,
+    )
+
+    __table_args__ = (
+        # username search (see search.py): prefix matches for short terms,
+        # and trigram substring matches, lower(username) LIKE '%term%'
+        db.Index(
+            'ix_users_username_lower_prefix',
+            db.func.lower(username).label('username_lower'),
+            postgresql_ops={'username_lower': 'text_pattern_ops'},
+        ),
+        db.Index(
+            'ix_users_username_lower_trgm',
+            db.func.lower(username).label('username_lower'),
+            postgresql_using='gin',
+            postgresql_ops={'username_lower': 'gin_trgm_ops'},
+        ),
+        # the few deleted users, for leaving their content out of lists
+        # (see marked_deleted)
+        db.Index(
+            'ix_users_deleted',
+            'id',
+            postgresql_where=deleted_at.isnot(None),
+        ),
     )
 
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
+    @classmethod
+    def marked_deleted(cls, user_id):
+        """SQL condition: is user `user_id` (a column) marked deleted?
+
+        Negate it to leave deleted users' messages out of a query without
+        joining users; it's answered from the small ix_users_deleted.
+        """
+
+        return (select(cls.id)
+                .where(cls.id == user_id, cls.deleted_at.isnot(None))
+                .exists())
+
     @classmethod
     def signup(cls, username, email, password, image_url=DEFAULT_IMAGE_URL):
         """Sign up user.
 
         Hashes password and adds user to session.
+
+        Raises HashingBusy if the password hasher is overloaded.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = hasher.hash(password)
 
         user = User(
             username=username,
@@ -137,30 +290,102 @@ class User(db.Model):
 
         If this can't find matching user (or if password is wrong), returns
         False.
+
+        Raises HashingBusy if the password hasher is overloaded.
         """
 
-        user = cls.query.filter_by(username=username).one_or_none()
+        user = (cls.query
+                .filter_by(username=username, deleted_at=None)
+                .one_or_none())
 
-        if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
-            if is_auth:
-                return user
+        if user and user.check_password(password):
+            return user
 
         return False
 
+    def check_password(self, password):
+        """Does `password` match this user's password?
+
+        If the stored hash was made with a different work factor, replaces
+        it with one at the current cost; the caller should commit.
+
+        Raises HashingBusy if the password hasher is overloaded.
+        """
+
+        if not hasher.check(self.password, password):
+            return False
+
+        if hasher.needs_rehash(self.password):
+            self.password = hasher.hash(password)
+
+        return True
+
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [
-            user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return db.session.query(
+            Follow.query.filter_by(
+                user_being_followed_id=self.id,
+                user_following_id=other_user.id,
+            ).exists()
+        ).scalar()
 
     def is_following(self, other_user):
         """Is this user following `other_user`?"""
 
-        found_user_list = [
-            user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return db.session.query(
+            Follow.query.filter_by(
+                user_being_followed_id=other_user.id,
+                user_following_id=self.id,
+            ).exists()
+        ).scalar()
+
+    def following_ids_among(self, user_ids):
+        """Return the set of `user_ids` that this user is following."""
+
+        if not user_ids:
+            return set()
+
+        return {
+            user_id for (user_id,) in (db.session
+                .query(Follow.user_being_followed_id)
+                .filter(Follow.user_following_id == self.id)
+                .filter(Follow.user_being_followed_id.in_(user_ids))
+                .all())
+        }
+
+    def has_liked(self, message):
+        """Has this user liked `message`?"""
+
+        return db.session.query(
+            Like.query.filter_by(
+                user_id=self.id,
+                message_id=message.id,
+            ).exists()
+        ).scalar()
+
+    def liked_message_ids(self, message_ids):
+        """Return the set of `message_ids` that this user has liked."""
+
+        if not message_ids:
+            return set()
+
+        return {
+            message_id for (message_id,) in (db.session
+                .query(Like.message_id)
+                .filter(Like.user_id == self.id)
+                .filter(Like.message_id.in_(message_ids))
+                .all())
+        }
+
+
+# the trigram index needs pg_trgm, which create_all doesn't know to add
+event.listen(
+    User.__table__,
+    'before_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(
+        dialect='postgresql'),
+)
 
 
 class Message(db.Model):
@@ -190,6 +415,33 @@ class Message(db.Model):
         nullable=False,
     )
 
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+    )
+
+    # kept up to date by PostgreSQL; see search.py
+    search_vector = db.deferred(db.Column(
+        postgresql.TSVECTOR,
+        db.Computed(f"to_tsvector('{TEXT_SEARCH_CONFIG}', text)"),
+    ))
+
+    __table_args__ = (
+        db.Index(
+            'ix_messages_user_id_timestamp',
+            'user_id',
+            timestamp.desc(),
+            id.desc(),
+        ),
+        db.Index(
+            'ix_messages_search_vector',
+            'search_vector',
+            postgresql_using='gin',
+        ),
+    )
+
 
 class Like(db.Model):
 
@@ -207,6 +459,214 @@ class Like(db.Model):
         primary_key=True,
     )
 
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    __table_args__ = (
+        db.Index(
+            'ix_likes_user_id',
+            'user_id',
+            'message_id',
+        ),
+        db.Index(
+            'ix_likes_timestamp',
+            'timestamp',
+        ),
+    )
+
+    @classmethod
+    def add(cls, user_id, message_id):
+        """Like message `message_id` as `user_id`, if not already liked.
+
+        Returns when the like was made, or None if it was already liked.
+        """
+
+        return db.session.scalar(
+            _insert(cls)
+            .values(user_id=user_id, message_id=message_id)
+            .on_conflict_do_nothing()
+            .returning(cls.timestamp)
+        )
+
+    @classmethod
+    def remove(cls, user_id, message_id):
+        """Unlike message `message_id` as `user_id`, if it was liked.
+
+        Returns when the removed like was made, or None if there wasn't one.
+        """
+
+        return db.session.scalar(
+            delete(cls)
+            .filter_by(user_id=user_id, message_id=message_id)
+            .returning(cls.timestamp)
+        )
+
+
+class TimelineEntry(db.Model):
+    """A message delivered to a user's home timeline (fan-out-on-write)."""
+
+    __tablename__ = "timeline_entries"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index(
+            'ix_timeline_entries_user_id_timestamp',
+            'user_id',
+            timestamp.desc(),
+            message_id.desc(),
+        ),
+        db.Index(
+            'ix_timeline_entries_user_id_author_id',
+            'user_id',
+            'author_id',
+        ),
+        db.Index(
+            'ix_timeline_entries_message_id',
+            'message_id',
+        ),
+    )
+
+
+class Recommendation(db.Model):
+    """A user suggested for another to follow (see recommendations.py)."""
+
+    __tablename__ = "recommendations"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    recommended_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    # how many of the users `user_id` follows follow `recommended_id`
+    score = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index(
+            'ix_recommendations_user_id_score',
+            'user_id',
+            score.desc(),
+        ),
+    )
+
+
+class Hashtag(db.Model):
+    """A #hashtag used in messages (see tags.py)."""
+
+    __tablename__ = "hashtags"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    # casefolded, without the #
+    name = db.Column(
+        db.String(50),
+        nullable=False,
+        unique=True,
+    )
+
+
+class MessageHashtag(db.Model):
+    """A hashtag used in a message."""
+
+    __tablename__ = "message_hashtags"
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    hashtag_id = db.Column(
+        db.Integer,
+        db.ForeignKey('hashtags.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    # the message's, so tag pages are one index range
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index(
+            'ix_message_hashtags_hashtag_id_timestamp',
+            'hashtag_id',
+            timestamp.desc(),
+            message_id.desc(),
+        ),
+    )
+
+
+class Mention(db.Model):
+    """An @mention of a user in a message (see tags.py)."""
+
+    __tablename__ = "mentions"
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    # the message's, so mentions pages are one index range
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index(
+            'ix_mentions_user_id_timestamp',
+            'user_id',
+            timestamp.desc(),
+            message_id.desc(),
+        ),
+    )
+
 
 def connect_db(app):
     """Connect this database to provided Flask app.
@@ -214,6 +674,5 @@ def connect_db(app):
     You should call this in your Flask app.
     """
 
-    app.app_context().push()
-    db.app = app
     db.init_app(app)
+    hasher.init_app(app)
@@ -0,0 +1,172 @@
+"""Full-page cache for anonymous visitors.
+
+The anonymous homepage, login and signup pages are the same for every
+visitor without a session, so after the first render they're served
+straight from the cache: a before_request hook answers before the other
+hooks or the view run, so a landing-page spike never reaches the database
+or Jinja.
+
+Requests that carry a session cookie (logged in, mid-flash, or holding a
+CSRF token from an earlier form) always bypass the cache. The login and
+signup forms embed a CSRF token, so it's cut out of the cached page and a
+fresh one for the visitor's new session is put back in on every hit.
+
+Pages are kept per process in memory, or in PAGE_CACHE_DIR on disk so
+that every worker on the host shares them, for PAGE_CACHE_TTL seconds.
+"""
+
+import json
+import os
+import tempfile
+import time
+from hashlib import sha1
+
+from flask import current_app, g, request
+from flask_wtf.csrf import generate_csrf
+
+from fragment_cache import LRUStore
+
+DEFAULT_PAGE_CACHE_SIZE = 100
+DEFAULT_PAGE_CACHE_TTL = 60
+
+CSRF_PLACEHOLDER = '\x00csrf-token\x00'
+
+# set per request, never cached
+UNCACHED_HEADERS = {'content-length', 'set-cookie'}
+
+
+class DiskStore:
+    """Stores pages as files in `path`, shared by every local worker.
+
+    A file's mtime is set to when it expires.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._file(key)) as file:
+                if os.fstat(file.fileno()).st_mtime <= time.time():
+                    return None
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value, ttl):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path)
+
+        with os.fdopen(fd, 'w') as file:
+            file.write(value)
+
+        expires = time.time() + ttl
+        os.utime(tmp_path, (expires, expires))
+        os.replace(tmp_path, self._file(key))
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, name))
+
+
+class PageCache:
+    """Caches whole responses of selected views for anonymous visitors."""
+
+    def __init__(self, app=None):
+        self.views = set()
+        self.store = None
+        self.ttl = DEFAULT_PAGE_CACHE_TTL
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick a store from `app`'s config and register the hooks.
+
+        Call before registering other before_request hooks, since a cache
+        hit skips the hooks after it, and after the extensions whose
+        after_request hooks should see the page before it's stored (like
+        compression, which runs again on every hit).
+        """
+
+        config = app.config
+        self.ttl = config.get('PAGE_CACHE_TTL', self.ttl)
+
+        if config.get('PAGE_CACHE_DIR'):
+            self.store = DiskStore(config['PAGE_CACHE_DIR'])
+        else:
+            self.store = LRUStore(
+                config.get('PAGE_CACHE_SIZE', DEFAULT_PAGE_CACHE_SIZE))
+
+        app.before_request(self.serve_cached_page)
+        app.after_request(self.store_page)
+
+    def anonymous(self, view):
+        """Decorator: cache `view`'s page for visitors without a session."""
+
+        self.views.add(view)
+        return view
+
+    def cache_key(self):
+        return f"page:{request.host}{request.full_path}"
+
+    def is_cacheable(self):
+        cookie_name = current_app.config['SESSION_COOKIE_NAME']
+
+        return (self.ttl > 0
+                and request.method in ('GET', 'HEAD')
+                and current_app.view_functions.get(request.endpoint)
+                in self.views
+                and cookie_name not in request.cookies)
+
+    def serve_cached_page(self):
+        """Return the cached page for this request, if there is one."""
+
+        if not self.is_cacheable():
+            return None
+
+        entry = self.store.get(self.cache_key())
+
+        if entry is None:
+            g.page_cache_miss = True
+            return None
+
+        status, headers, body = json.loads(entry)
+
+        if CSRF_PLACEHOLDER in body:
+            body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+
+        return current_app.response_class(body, status, headers)
+
+    def store_page(self, response):
+        """Cache the response to a request that missed the cache."""
+
+        if (not g.pop('page_cache_miss', False)
+                or request.method != 'GET'
+                or response.status_code != 200
+                or response.is_streamed):
+            return response
+
+        body = response.get_data(as_text=True)
+
+        token_name = current_app.config.get(
+            'WTF_CSRF_FIELD_NAME', 'csrf_token')
+        token = g.get(token_name)
+        if token:
+            body = body.replace(token, CSRF_PLACEHOLDER)
+
+        headers = [
+            (name, value) for name, value in response.headers
+            if name.lower() not in UNCACHED_HEADERS
+        ]
+
+        self.store.set(
+            self.cache_key(),
+            json.dumps([response.status_code, headers, body]),
+            self.ttl,
+        )
+
+        return response
@@ -0,0 +1,174 @@
+"""Keyset (cursor) pagination for Warbler.
+
+Pages are found by filtering on the sort key of the last row seen instead of
+using OFFSET, so every page costs the same no matter how deep it is.
+
+Messages are paged on (timestamp, id) and users on id, newest first. An
+"older" cursor continues past the last row on a page; a "newer" cursor goes
+back before the first row.
+"""
+
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from flask import abort, current_app, request, url_for
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 20
+DEFAULT_MAX_PAGE_SIZE = 100
+
+# how cursor values are parsed, by column type; anything else is an int
+CURSOR_TYPES = {
+    datetime: datetime.fromisoformat,
+    float: float,
+}
+
+
+class Page:
+    """One page of results, with cursors for the neighbouring pages."""
+
+    def __init__(self, items, older=None, newer=None):
+        self.items = items
+        self.older = older
+        self.newer = newer
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    """Encode a tuple of sort-key values as an opaque, URL-safe cursor."""
+
+    raw = "|".join(
+        value.isoformat() if isinstance(value, datetime) else str(value)
+        for value in values
+    )
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    """Decode `cursor` into a tuple of values matching `columns`.
+
+    Aborts with a 400 if the cursor is malformed.
+    """
+
+    try:
+        parts = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        if len(parts) != len(columns):
+            raise ValueError(cursor)
+
+        return tuple(
+            CURSOR_TYPES.get(column.type.python_type, int)(part)
+            for part, column in zip(parts, columns)
+        )
+    except (ValueError, UnicodeError, binascii.Error):
+        abort(400)
+
+
+def get_page_size():
+    """Return the page size for this request.
+
+    Uses the `limit` query param if given, capped at MAX_PAGE_SIZE.
+    """
+
+    per_page = (request.args.get('limit', type=int)
+                or current_app.config.get('PAGE_SIZE', DEFAULT_PAGE_SIZE))
+    max_per_page = current_app.config.get(
+        'MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+
+    return max(1, min(per_page, max_per_page))
+
+
+def get_cursors(columns):
+    """Return decoded (before, after) cursors from the query string."""
+
+    before = request.args.get('before')
+    after = request.args.get('after')
+
+    return (
+        decode_cursor(before, columns) if before else None,
+        decode_cursor(after, columns) if after else None,
+    )
+
+
+def apply_keyset(query, columns, before=None, after=None, limit=None):
+    """Filter and order `query` on `columns` to fetch one page.
+
+    With `after`, rows come back oldest first (the caller reverses them);
+    otherwise they come back newest first.
+    """
+
+    key = tuple_(*columns)
+
+    if after is not None:
+        query = (query
+                 .filter(key > tuple_(*after))
+                 .order_by(*[column.asc() for column in columns]))
+    else:
+        if before is not None:
+            query = query.filter(key < tuple_(*before))
+        query = query.order_by(*[column.desc() for column in columns])
+
+    return query.limit(limit)
+
+
+def make_page(rows, per_page, key, before=None, after=None):
+    """Build a Page from `rows` fetched with a limit of `per_page` + 1.
+
+    `key` returns the sort-key tuple of a row, used to build the cursors.
+    """
+
+    has_more = len(rows) > per_page
+    rows = list(rows[:per_page])
+
+    if after is not None:
+        rows.reverse()
+        has_older = True
+        has_newer = has_more
+    else:
+        has_older = has_more
+        has_newer = before is not None
+
+    return Page(
+        items=rows,
+        older=encode_cursor(key(rows[-1])) if rows and has_older else None,
+        newer=encode_cursor(key(rows[0])) if rows and has_newer else None,
+    )
+
+
+def paginate(query, columns, key):
+    """Return the Page of `query` requested by this request's query string."""
+
+    before, after = get_cursors(columns)
+    per_page = get_page_size()
+
+    rows = apply_keyset(query, columns, before, after, per_page + 1).all()
+    return make_page(rows, per_page, key, before, after)
+
+
+def message_key(msg):
+    """Sort key for paging messages."""
+
+    return (msg.timestamp, msg.id)
+
+
+def user_key(user):
+    """Sort key for paging users."""
+
+    return (user.id,)
+
+
+def page_url(**params):
+    """URL for the current page with `params` replacing any cursor params."""
+
+    args = {
+        name: value for name, value in request.args.items()
+        if name not in ('before', 'after')
+    }
+    args.update(params)
+
+    return url_for(request.endpoint, **request.view_args, **args)
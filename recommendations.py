@@ -0,0 +1,211 @@
+"""Who-to-follow suggestions: friends of friends.
+
+A user is suggested to you when people you follow follow them; the more
+of them do, the better the suggestion. Working that out with SQL
+self-joins of follows on every page view would be far too slow, so
+`flask build-recommendations` works it out for everyone at once:
+
+- it loads the follows into a sparse adjacency matrix A, where A[i, j] is
+  1 when user i follows user j;
+- for a chunk of users (rows) at a time, A[rows] @ A counts each user's
+  two-hop paths to everyone else;
+- it drops the users themselves and anyone they already follow, keeps
+  each user's best `limit` candidates, and replaces that chunk's rows of
+  the recommendations table.
+
+Chunking bounds the memory the two-hop products need, so the job scales
+to millions of follows. Pages then read suggestions with one indexed
+query (suggestions_for). The job needs numpy and scipy, which are only
+imported when it runs (require_numpy), so web workers don't load them.
+"""
+
+from sqlalchemy import delete, exists, insert, select
+
+from models import db, Follow, Recommendation, User
+
+# imported by require_numpy
+np = sparse = None
+
+DEFAULT_LIMIT = 20
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_SHOWN = 5
+
+# rows fetched from the database at a time
+FETCH_SIZE = 100000
+
+
+def require_numpy():
+    """Import numpy and scipy.sparse, or raise RuntimeError if missing."""
+
+    global np, sparse
+
+    if sparse is not None:
+        return
+
+    try:
+        import numpy as np
+        from scipy import sparse
+    except ImportError:
+        raise RuntimeError(
+            "building recommendations needs numpy and scipy installed")
+
+
+def fetch_array(stmt, columns):
+    """Run `stmt` and return its rows as an int64 array of `columns` columns.
+
+    Rows are fetched FETCH_SIZE at a time, rather than as ORM objects.
+    """
+
+    result = db.session.execute(stmt.execution_options(yield_per=FETCH_SIZE))
+    chunks = [
+        np.array(rows, dtype=np.int64).reshape(-1, columns)
+        for rows in result.partitions()
+    ]
+
+    if not chunks:
+        return np.empty((0, columns), dtype=np.int64)
+
+    return np.concatenate(chunks)
+
+
+def build_adjacency(user_ids, follows):
+    """Return the CSR adjacency matrix of `follows` over sorted `user_ids`.
+
+    `follows` is an array of (follower id, followed id) rows; follows of or
+    by users not in `user_ids` are left out.
+    """
+
+    require_numpy()
+
+    n = len(user_ids)
+    rows = np.searchsorted(user_ids, follows[:, 0])
+    cols = np.searchsorted(user_ids, follows[:, 1])
+
+    known = (rows < n) & (cols < n)
+    known[known] = ((user_ids[rows[known]] == follows[known, 0])
+                    & (user_ids[cols[known]] == follows[known, 1]))
+
+    return sparse.csr_matrix(
+        (np.ones(known.sum(), dtype=np.int32), (rows[known], cols[known])),
+        shape=(n, n),
+    )
+
+
+def two_hop_scores(adjacency, start, stop):
+    """Return rows start:stop of A @ A, less self and existing follows."""
+
+    require_numpy()
+
+    block = adjacency[start:stop]
+    scores = (block @ adjacency).tocsr()
+
+    seen = (block + sparse.eye(
+        stop - start, adjacency.shape[1], k=start,
+        dtype=np.int32, format='csr')).tocsr()
+    seen.data[:] = 1
+
+    scores = (scores - scores.multiply(seen)).tocsr()
+    scores.eliminate_zeros()
+
+    return scores
+
+
+def top_n(scores, limit):
+    """Return (rows, cols, scores) of each row's `limit` best entries.
+
+    Ties go to the lower column (the older user).
+    """
+
+    require_numpy()
+
+    rows = np.repeat(np.arange(scores.shape[0]), np.diff(scores.indptr))
+    order = np.lexsort((scores.indices, -scores.data, rows))
+    rank = np.arange(len(order)) - scores.indptr[rows[order]]
+    best = order[rank < limit]
+
+    return rows[best], scores.indices[best], scores.data[best]
+
+
+def build_recommendations(
+        limit=DEFAULT_LIMIT, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Recompute every user's recommendations; return how many were stored.
+
+    Commits after each chunk of `chunk_size` users, and calls
+    `progress(users done, users)` after each.
+    """
+
+    require_numpy()
+
+    user_ids = fetch_array(
+        select(User.id)
+        .where(User.deleted_at.is_(None))
+        .order_by(User.id),
+        1,
+    )[:, 0]
+    follows = fetch_array(
+        select(Follow.user_following_id, Follow.user_being_followed_id),
+        2,
+    )
+
+    adjacency = build_adjacency(user_ids, follows)
+    del follows
+
+    n = len(user_ids)
+    stored = 0
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        rows, cols, scores = top_n(
+            two_hop_scores(adjacency, start, stop), limit)
+
+        # this chunk's users, and any deleted ones between them
+        replaced = delete(Recommendation)
+        if start:
+            replaced = replaced.where(
+                Recommendation.user_id >= int(user_ids[start]))
+        if stop < n:
+            replaced = replaced.where(
+                Recommendation.user_id < int(user_ids[stop]))
+        db.session.execute(replaced)
+
+        if len(rows):
+            db.session.execute(insert(Recommendation), [
+                {'user_id': user_id, 'recommended_id': recommended_id,
+                 'score': score}
+                for user_id, recommended_id, score in zip(
+                    user_ids[rows + start].tolist(),
+                    user_ids[cols].tolist(),
+                    scores.tolist(),
+                )
+            ])
+
+        db.session.commit()
+        stored += len(rows)
+
+        if progress:
+            progress(stop, n)
+
+    return stored
+
+
+def suggestions_for(user_id, limit=DEFAULT_SHOWN):
+    """Return up to `limit` users suggested for `user_id` to follow, best first.
+
+    Leaves out users they've followed since the job last ran.
+    """
+
+    followed = exists().where(
+        Follow.user_following_id == user_id,
+        Follow.user_being_followed_id == User.id,
+    )
+
+    return (User.query
+            .join(Recommendation, Recommendation.recommended_id == User.id)
+            .filter(
+                Recommendation.user_id == user_id,
+                User.deleted_at.is_(None),
+                ~followed,
+            )
+            .order_by(Recommendation.score.desc(), User.id)
+            .limit(limit)
+            .all())
@@ -0,0 +1,117 @@
+"""Read replicas and database connection settings.
+
+Views marked with @replicas.read_only send their SELECTs to a read
+replica, picked at random per request from SQLALCHEMY_REPLICA_URIS.
+Everything else, including any write or locking read made during a
+read-only view, goes to the primary.
+
+Replicas lag behind the primary, so a visitor whose request committed a
+write reads from the primary for the next READ_YOUR_WRITES_SECONDS. That
+way a new message or follow shows up on the page they're redirected to.
+The time of their last write is kept in their session.
+
+With no replicas configured, everything uses the primary. Replica engines
+belong to the app that made them (app.extensions['replicas']), not to the
+shared Flask-SQLAlchemy object, so apps with and without replicas can live
+in one process.
+"""
+
+import random
+import time
+
+from flask import (
+    current_app, g, has_app_context, has_request_context, request, session)
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+
+DEFAULT_READ_YOUR_WRITES_SECONDS = 10
+LAST_WRITE_KEY = 'last_write'
+
+
+class RoutingSession(Session):
+    """A session that sends reads to this request's replica, if it has one."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None
+                and not self._flushing
+                and has_app_context()
+                and g.get('db_replica') is not None
+                and getattr(clause, 'is_select', False)
+                and getattr(clause, '_for_update_arg', None) is None):
+            return g.db_replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def mark_write(db_session):
+    """Note that this request has committed a write."""
+
+    if has_request_context():
+        g.db_wrote = True
+
+
+class Replicas:
+    """Makes replica engines and routes read-only views to them."""
+
+    def __init__(self, app=None):
+        self.views = set()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Make an engine for each of `app`'s replicas; register the hooks."""
+
+        config = app.config
+        options = config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        app.extensions['replicas'] = [
+            create_engine(
+                uri, echo=config.get('SQLALCHEMY_ECHO', False), **options)
+            for uri in config.get('SQLALCHEMY_REPLICA_URIS') or []
+        ]
+
+        app.config.setdefault(
+            'READ_YOUR_WRITES_SECONDS', DEFAULT_READ_YOUR_WRITES_SECONDS)
+
+        app.before_request(self.choose_replica)
+        app.after_request(self.remember_write)
+        app.teardown_request(self.release_replica)
+
+    def read_only(self, view):
+        """Decorator: `view` may read from a replica."""
+
+        self.views.add(view)
+        return view
+
+    def choose_replica(self):
+        """Pick a replica for this request, if it may use one."""
+
+        g.db_replica = None
+        engines = current_app.extensions['replicas']
+
+        if (not engines
+                or current_app.view_functions.get(request.endpoint)
+                not in self.views):
+            return
+
+        last_write = session.get(LAST_WRITE_KEY, 0)
+        window = current_app.config['READ_YOUR_WRITES_SECONDS']
+
+        if time.time() - last_write < window:
+            return
+
+        g.db_replica = random.choice(engines)
+
+    @staticmethod
+    def remember_write(response):
+        """Note the time of this request's write in the visitor's session."""
+
+        if g.pop('db_wrote', False):
+            session[LAST_WRITE_KEY] = time.time()
+
+        return response
+
+    @staticmethod
+    def release_replica(exc):
+        g.pop('db_replica', None)
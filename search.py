@@ -0,0 +1,163 @@
+"""Search for Warbler.
+
+Username search matches case-insensitively anywhere in the name, ranking
+exact matches first, then prefix matches, then the rest.
+
+In PostgreSQL, substring matches are served by a pg_trgm GIN index on
+lower(username) (see migrations/0003_add_username_search_indexes.sql) and
+prefix matches by a text_pattern_ops B-tree. Trigram indexes can't help
+with terms shorter than three characters, so those only match prefixes.
+
+Message search is full-text: queries are parsed like a web search box
+(words, "quoted phrases", or, -excluded) by websearch_to_tsquery, and
+matched against Message.search_vector, a tsvector column PostgreSQL
+generates from the text and a GIN index serves (see
+migrations/0007_add_message_search.sql). Matches are ranked by ts_rank.
+
+Ranking reads every match's tsvector, so a word in a large share of all
+messages would make every search for it slow. Only the newest
+MAX_RANKED_MATCHES matches are ranked; PostgreSQL finds those by walking
+the primary key backwards when matches are common, and with the GIN index
+when they're rare. Highlighting with ts_headline reparses the text, so it's
+only done for the messages on the page being shown.
+"""
+
+from markupsafe import Markup
+from sqlalchemy import case, cast, func, select
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+
+from models import db, Message, TEXT_SEARCH_CONFIG, User
+
+MIN_SUBSTRING_LENGTH = 3
+
+SEARCH_RANK_EXACT = 2
+SEARCH_RANK_PREFIX = 1
+SEARCH_RANK_SUBSTRING = 0
+
+MAX_RANKED_MATCHES = 10000
+
+# ts_headline marks matches with these; they're swapped for <mark> tags
+# once the rest of the text has been escaped
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+HEADLINE_OPTIONS = (
+    f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, HighlightAll=true")
+
+
+def normalize_term(term):
+    """Return `term` trimmed and lowercased for matching usernames."""
+
+    return (term or "").strip().lower()
+
+
+def user_search_rank(term):
+    """SQL expression ranking a username against normalized `term`."""
+
+    username = func.lower(User.username)
+
+    return case(
+        (username == term, SEARCH_RANK_EXACT),
+        (username.startswith(term, autoescape=True), SEARCH_RANK_PREFIX),
+        else_=SEARCH_RANK_SUBSTRING,
+    )
+
+
+def search_users(term):
+    """Return a query of (User, rank) rows matching normalized `term`.
+
+    The query is unordered; page it on (rank, User.id) so that better
+    matches come first.
+    """
+
+    username = func.lower(User.username)
+    rank = user_search_rank(term)
+
+    if len(term) < MIN_SUBSTRING_LENGTH:
+        match = username.startswith(term, autoescape=True)
+    else:
+        match = username.contains(term, autoescape=True)
+
+    return (db.session
+            .query(User, rank)
+            .filter(match, User.deleted_at.is_(None)))
+
+
+def normalize_query(text):
+    """Return message search `text` trimmed, without highlight markers."""
+
+    text = (text or "").strip()
+    return text.replace(HIGHLIGHT_START, "").replace(HIGHLIGHT_STOP, "")
+
+
+def message_tsquery(text):
+    """SQL tsquery for the message search `text`."""
+
+    return func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, text)
+
+
+def search_messages(text, author_id=None):
+    """Return (query, sort columns) for messages matching search `text`.
+
+    The query's rows are (id, rank), of messages by `author_id` if given;
+    it's unordered, so page it on the sort columns, (rank, id), to get the
+    best matches first. Only the newest MAX_RANKED_MATCHES matches are
+    ranked.
+    """
+
+    tsquery = message_tsquery(text)
+
+    candidates = (select(Message.id, Message.search_vector)
+                  .where(Message.search_vector.bool_op('@@')(tsquery),
+                         ~User.marked_deleted(Message.user_id)))
+    if author_id is not None:
+        candidates = candidates.where(Message.user_id == author_id)
+
+    candidates = (candidates
+                  .order_by(Message.id.desc())
+                  .limit(MAX_RANKED_MATCHES)
+                  .subquery())
+
+    # double precision (ts_rank returns a real) so that the rank survives
+    # a round trip through a page cursor exactly
+    rank = cast(func.ts_rank(candidates.c.search_vector, tsquery),
+                DOUBLE_PRECISION).label('rank')
+
+    query = db.session.query(candidates.c.id, rank)
+    return query, (rank, candidates.c.id)
+
+
+def highlight(headline):
+    """Return a ts_headline result as HTML, its matches in <mark> tags."""
+
+    parts = headline.split(HIGHLIGHT_START)
+    html = Markup.escape(parts[0].replace(HIGHLIGHT_STOP, ""))
+
+    for part in parts[1:]:
+        match, _, rest = part.partition(HIGHLIGHT_STOP)
+        html += Markup("<mark>%s</mark>%s") % (
+            match, rest.replace(HIGHLIGHT_STOP, ""))
+
+    return html
+
+
+def highlight_messages(message_ids, text):
+    """Return {message id: text as HTML, with matches of `text` marked}."""
+
+    if not message_ids:
+        return {}
+
+    headlines = db.session.execute(
+        select(
+            Message.id,
+            func.ts_headline(
+                TEXT_SEARCH_CONFIG,
+                Message.text,
+                message_tsquery(text),
+                HEADLINE_OPTIONS,
+            ),
+        ).where(Message.id.in_(message_ids))
+    )
+
+    return {
+        message_id: highlight(headline) for message_id, headline in headlines
+    }
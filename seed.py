@@ -1,19 +1,28 @@
 """Seed database with sample data from CSV Files."""
 
 from csv import DictReader
-from app import db
-from models import User, Message, Follow
+from app import create_app
+from models import db, User, Message, Follow
+from counters import reconcile_counters
+from timeline import rebuild_timelines
 
-db.drop_all()
-db.create_all()
+app = create_app()
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+with app.app_context():
+    db.drop_all()
+    db.create_all()
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+    with open('generator/users.csv') as users:
+        db.session.bulk_insert_mappings(User, DictReader(users))
 
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follow, DictReader(follows))
+    with open('generator/messages.csv') as messages:
+        db.session.bulk_insert_mappings(Message, DictReader(messages))
 
-db.session.commit()
+    with open('generator/follows.csv') as follows:
+        db.session.bulk_insert_mappings(Follow, DictReader(follows))
+
+    db.session.commit()
+
+    rebuild_timelines()
+    reconcile_counters()
+    db.session.commit()
@@ -0,0 +1,79 @@
+"use strict";
+
+// Like and follow buttons that update in place.
+//
+// Forms marked data-toggle="like" or data-toggle="follow" work without
+// JavaScript. With it, they post in the background asking for JSON and
+// flip the button from the answer, instead of following a redirect and
+// re-rendering the whole page.
+
+const TOGGLES = {
+  like: {
+    on: "/messages/like/",
+    off: "/messages/unlike/",
+
+    update(form, data) {
+      const icon = form.querySelector("i");
+      icon.classList.toggle("bi-hand-thumbs-up-fill", data.liked);
+      icon.classList.toggle("bi-hand-thumbs-up", !data.liked);
+
+      const count = form.parentElement.querySelector(".likes-count");
+      if (count) count.textContent = data.likes_count;
+
+      return data.liked;
+    },
+  },
+
+  follow: {
+    on: "/users/follow/",
+    off: "/users/stop-following/",
+
+    update(form, data) {
+      const button = form.querySelector("button");
+      button.textContent = data.following ? "Unfollow" : "Follow";
+      button.classList.toggle("btn-primary", data.following);
+      button.classList.toggle("btn-outline-primary", !data.following);
+
+      return data.following;
+    },
+  },
+};
+
+
+async function submitToggle(evt) {
+  const form = evt.target;
+  const toggle = TOGGLES[form.dataset.toggle];
+  if (!toggle) return;
+
+  evt.preventDefault();
+  const button = form.querySelector("button");
+  button.disabled = true;
+
+  let resp;
+  try {
+    resp = await fetch(form.action, {
+      method: "POST",
+      body: new FormData(form),
+      headers: { Accept: "application/json" },
+      credentials: "same-origin",
+    });
+  } catch (err) {
+    resp = null;
+  }
+
+  button.disabled = false;
+
+  // likes and follows are idempotent, so on any trouble just post the form
+  // the old way and let the page show what happened
+  if (!resp || !resp.ok) {
+    form.submit();
+    return;
+  }
+
+  const isOn = toggle.update(form, await resp.json());
+  const id = form.action.split("/").pop();
+  form.action = (isOn ? toggle.off : toggle.on) + id;
+}
+
+
+document.addEventListener("submit", submitToggle);
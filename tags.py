@@ -0,0 +1,192 @@
+"""#hashtags and @mentions, indexed when messages are written.
+
+Tag pages and "mentions of me" would otherwise have to scan every
+message's text. Instead, add_message parses each message once, and
+stores:
+
+- each hashtag (casefolded) in `hashtags`, and the message's use of it in
+  `message_hashtags`;
+- each mention of an existing user in `mentions`.
+
+Both carry the message's timestamp, so a tag's or user's page is one
+range of a (hashtag or user, timestamp, message) index, paged like the
+other message lists. Deleting a message removes its rows (the foreign
+keys cascade too). Messages written before this are indexed by
+`flask backfill-tags`, a chunk at a time.
+"""
+
+import re
+
+from markupsafe import Markup
+from sqlalchemy import delete, select
+
+from models import (
+    db, insert_ignore_all, Hashtag, Mention, Message, MessageHashtag, User)
+
+DEFAULT_BACKFILL_CHUNK_SIZE = 1000
+
+# a # or @ inside a word ("c#", "bob@example.com") isn't a tag or mention
+HASHTAG_PATTERN = re.compile(r'(?<![\w#])#(\w+)')
+MENTION_PATTERN = re.compile(r'(?<![\w@])@(\w+)')
+
+MAX_HASHTAG_LENGTH = 50
+MAX_USERNAME_LENGTH = 30
+
+
+def hashtag_name(match):
+    """Return the hashtag of a HASHTAG_PATTERN match, or None if it isn't."""
+
+    name = match.group(1).casefold()
+
+    # "#1" is a number, not a tag
+    if len(name) > MAX_HASHTAG_LENGTH or name.isdigit():
+        return None
+
+    return name
+
+
+def extract_hashtags(text):
+    """Return the distinct hashtags in `text`, casefolded, in order."""
+
+    names = []
+
+    for match in HASHTAG_PATTERN.finditer(text):
+        name = hashtag_name(match)
+        if name and name not in names:
+            names.append(name)
+
+    return names
+
+
+def extract_mentions(text):
+    """Return the distinct usernames @mentioned in `text`, in order."""
+
+    usernames = []
+
+    for match in MENTION_PATTERN.finditer(text):
+        username = match.group(1)
+
+        if len(username) <= MAX_USERNAME_LENGTH and username not in usernames:
+            usernames.append(username)
+
+    return usernames
+
+
+def hashtag_ids(names):
+    """Return {name: id} for hashtags `names`, adding any that are new."""
+
+    if not names:
+        return {}
+
+    insert_ignore_all(Hashtag, [{'name': name} for name in names])
+
+    return dict(db.session.execute(
+        select(Hashtag.name, Hashtag.id).where(Hashtag.name.in_(names))
+    ).all())
+
+
+def index_messages(messages):
+    """Store the hashtags and mentions of `messages`.
+
+    `messages` are Messages (flushed, so they have ids) or rows with the
+    same id, text and timestamp. Already indexed ones are skipped, so this
+    can be rerun. Returns how many (hashtag uses, mentions) it found.
+    """
+
+    tags = {msg.id: extract_hashtags(msg.text) for msg in messages}
+    mentioned = {msg.id: extract_mentions(msg.text) for msg in messages}
+
+    ids = hashtag_ids(sorted({
+        name for names in tags.values() for name in names}))
+
+    usernames = sorted({
+        username for names in mentioned.values() for username in names})
+    user_ids = dict(db.session.execute(
+        select(User.username, User.id)
+        .where(User.username.in_(usernames), User.deleted_at.is_(None))
+    ).all()) if usernames else {}
+
+    hashtag_rows = [
+        {'message_id': msg.id, 'hashtag_id': ids[name],
+         'timestamp': msg.timestamp}
+        for msg in messages
+        for name in tags[msg.id]
+    ]
+    mention_rows = [
+        {'message_id': msg.id, 'user_id': user_ids[username],
+         'timestamp': msg.timestamp}
+        for msg in messages
+        for username in mentioned[msg.id]
+        if username in user_ids
+    ]
+
+    insert_ignore_all(MessageHashtag, hashtag_rows)
+    insert_ignore_all(Mention, mention_rows)
+
+    return len(hashtag_rows), len(mention_rows)
+
+
+def index_message(msg):
+    """Store the hashtags and mentions of new message `msg`."""
+
+    index_messages([msg])
+
+
+def remove_message(msg):
+    """Remove message `msg`'s hashtags and mentions."""
+
+    db.session.execute(
+        delete(MessageHashtag).where(MessageHashtag.message_id == msg.id))
+    db.session.execute(
+        delete(Mention).where(Mention.message_id == msg.id))
+
+
+def backfill_tags(chunk_size=DEFAULT_BACKFILL_CHUNK_SIZE, progress=None):
+    """Index every message's hashtags and mentions, oldest first.
+
+    Reads and indexes `chunk_size` messages at a time, committing after
+    each chunk, and calls `progress(last message id, hashtag uses,
+    mentions)` with the running totals. Returns those totals.
+    """
+
+    last_id = 0
+    totals = [0, 0]
+
+    while True:
+        chunk = db.session.execute(
+            select(Message.id, Message.text, Message.timestamp)
+            .where(Message.id > last_id)
+            .order_by(Message.id)
+            .limit(chunk_size)
+        ).all()
+
+        if not chunk:
+            break
+
+        for n, added in enumerate(index_messages(chunk)):
+            totals[n] += added
+        db.session.commit()
+
+        last_id = chunk[-1].id
+        if progress:
+            progress(last_id, *totals)
+
+    return tuple(totals)
+
+
+def link_hashtags(text):
+    """Jinja filter: `text` as HTML, with its hashtags linked to their pages."""
+
+    html = Markup()
+    end = 0
+
+    for match in HASHTAG_PATTERN.finditer(text):
+        name = hashtag_name(match)
+        if not name:
+            continue
+
+        html += text[end:match.start()]
+        html += Markup('<a href="/tags/%s">%s</a>') % (name, match.group())
+        end = match.end()
+
+    return html + text[end:]
@@ -0,0 +1,141 @@
+"""Account deletion tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_account_deletion.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Follow, Like, Message, TimelineEntry, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+from account_deletion import purge_deleted_users, purge_user
+import counters
+import timeline
+
+app = create_app('testing')
+app.app_context().push()
+
+db.drop_all()
+db.create_all()
+
+
+class AccountDeletionTestCase(TestCase):
+    def setUp(self):
+        TimelineEntry.query.delete()
+        User.query.delete()
+
+        users = [
+            User.signup(f"u{n}", f"u{n}@email.com", "password", None)
+            for n in range(4)
+        ]
+        db.session.flush()
+        u0, *others = users
+
+        for user in users:
+            for n in range(3):
+                db.session.add(Message(text=f"{n}", user_id=user.id))
+        db.session.flush()
+
+        for other in others:
+            Follow.add(u0.id, other.id)
+            Follow.add(other.id, u0.id)
+            for msg in Message.query.filter_by(user_id=other.id):
+                Like.add(u0.id, msg.id)
+            for msg in Message.query.filter_by(user_id=u0.id):
+                Like.add(other.id, msg.id)
+
+        timeline.rebuild_timelines()
+        counters.reconcile_counters()
+        db.session.commit()
+
+        self.u0_id = u0.id
+        self.other_ids = [other.id for other in others]
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_delete_view_marks_user(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u0_id
+
+            resp = c.post("/users/delete")
+            self.assertEqual(resp.status_code, 302)
+
+        # marked and hidden, but nothing deleted yet
+        user = db.session.get(User, self.u0_id)
+        self.assertIsNotNone(user.deleted_at)
+        self.assertEqual(Message.query.filter_by(user_id=self.u0_id).count(), 3)
+        self.assertFalse(User.authenticate("u0", "password"))
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.other_ids[0]
+
+            resp = c.get(f"/users/{self.u0_id}")
+            self.assertEqual(resp.status_code, 404)
+
+            message_ids = [msg.id for msg in
+                           Message.query.filter_by(user_id=self.u0_id)]
+            resp = c.get(f"/messages/{message_ids[0]}")
+            self.assertEqual(resp.status_code, 404)
+
+            # their messages, likes and follows are still there, but hidden
+            for url in ["/", f"/users/{self.other_ids[0]}/likes"]:
+                html = c.get(url).get_data(as_text=True)
+                for message_id in message_ids:
+                    self.assertNotIn(f'"/messages/{message_id}"', html)
+
+            for url in [f"/users/{self.other_ids[0]}/following",
+                        f"/users/{self.other_ids[0]}/followers"]:
+                html = c.get(url).get_data(as_text=True)
+                self.assertNotIn(f'"/users/{self.u0_id}"', html)
+
+    def test_purge_in_chunks(self):
+        progress = []
+
+        db.session.get(User, self.u0_id).deleted_at = db.func.now()
+        db.session.commit()
+
+        deleted = purge_user(
+            self.u0_id,
+            chunk_size=2,
+            progress=lambda step, n: progress.append((step, n)),
+        )
+
+        self.assertEqual(deleted, {
+            'messages': 3,
+            'likes': 9,
+            'following': 3,
+            'followers': 3,
+            'timeline': 9,
+            'mentions': 0,
+            'user': 1,
+        })
+        self.assertIn(('likes', 2), progress)
+        self.assertIn(('likes', 9), progress)
+
+        self.assertIsNone(db.session.get(User, self.u0_id))
+        self.assertEqual(Follow.query.count(), 0)
+        self.assertEqual(Like.query.count(), 0)
+        self.assertEqual(
+            TimelineEntry.query.filter_by(author_id=self.u0_id).count(), 0)
+
+        # every counter was kept right along the way
+        self.assertEqual(
+            set(counters.reconcile_counters().values()), {0})
+
+    def test_purge_deleted_users(self):
+        db.session.get(User, self.u0_id).deleted_at = db.func.now()
+        db.session.commit()
+
+        self.assertEqual(purge_deleted_users(), [self.u0_id])
+        self.assertEqual(purge_deleted_users(), [])
+        self.assertEqual(User.query.count(), 3)
@@ -0,0 +1,107 @@
+"""Response compression tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_compression.py
+
+
+import gzip
+import os
+from unittest import TestCase
+
+import brotli
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from flask import Response
+
+from app import create_app
+from compression import Compress
+
+app = create_app('testing')
+app.app_context().push()
+
+PAGE = "<li>hello</li>" * 200
+
+
+class CompressTestCase(TestCase):
+    """Run responses through Compress.compress_response."""
+
+    def setUp(self):
+        self.compress = Compress()
+
+    def compress_response(self, response, accept='gzip, deflate, br'):
+        with app.test_request_context(headers={'Accept-Encoding': accept}):
+            return self.compress.compress_response(response)
+
+    def test_compress(self):
+        """Are large HTML responses gzipped, with a weakened ETag?"""
+
+        response = Response(PAGE, mimetype='text/html')
+        response.set_etag('abc')
+
+        response = self.compress_response(response, 'gzip')
+
+        self.assertEqual(response.content_encoding, 'gzip')
+        self.assertIn('Accept-Encoding', response.vary)
+        self.assertEqual(response.get_etag(), ('abc', True))
+        self.assertLess(response.content_length, len(PAGE))
+        self.assertEqual(gzip.decompress(response.get_data()).decode(), PAGE)
+
+    def test_brotli(self):
+        """Is brotli preferred when the client accepts it?"""
+
+        response = self.compress_response(Response(PAGE, mimetype='text/html'))
+
+        self.assertEqual(response.content_encoding, 'br')
+        self.assertLess(response.content_length, len(PAGE))
+        self.assertEqual(brotli.decompress(response.get_data()).decode(), PAGE)
+
+        # and streamed chunk by chunk
+        response = self.compress_response(
+            Response(iter([PAGE, PAGE]), mimetype='text/html'))
+        body = b"".join(response.response)
+        self.assertEqual(brotli.decompress(body).decode(), PAGE * 2)
+
+    def test_quality(self):
+        """Are the client's q-values honoured over our preference?"""
+
+        response = self.compress_response(
+            Response(PAGE, mimetype='text/html'), 'br;q=0.1, gzip;q=1.0')
+        self.assertEqual(response.content_encoding, 'gzip')
+
+        response = self.compress_response(
+            Response(PAGE, mimetype='text/html'), 'br;q=0, gzip;q=0.5')
+        self.assertEqual(response.content_encoding, 'gzip')
+
+    def test_skip(self):
+        """Are small, non-text, encoded and unaccepted responses left alone?"""
+
+        responses = [
+            (Response("<p>hi</p>", mimetype='text/html'), 'gzip'),
+            (Response(PAGE, mimetype='image/png'), 'gzip'),
+            (Response(PAGE, mimetype='text/html'), 'identity'),
+            (Response(PAGE, mimetype='text/css',
+                      headers={'Content-Encoding': 'br'}), 'gzip'),
+        ]
+
+        for response, accept in responses:
+            response = self.compress_response(response, accept)
+            self.assertNotEqual(response.content_encoding, 'gzip')
+
+    def test_stream(self):
+        """Are streamed responses compressed chunk by chunk?"""
+
+        def generate():
+            for _ in range(3):
+                yield PAGE
+
+        response = self.compress_response(
+            Response(generate(), mimetype='text/html'), 'gzip')
+
+        self.assertEqual(response.content_encoding, 'gzip')
+        self.assertIsNone(response.content_length)
+
+        chunks = list(response.response)
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(gzip.decompress(b"".join(chunks)).decode(), PAGE * 3)
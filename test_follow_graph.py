@@ -0,0 +1,129 @@
+"""Follow graph snapshot tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_follow_graph.py
+
+
+import os
+import tempfile
+from unittest import TestCase
+
+from models import db, Follow, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY, follow_graph
+from config import TestingConfig
+from follow_graph import FollowGraph, log_path
+
+
+class SnapshotConfig(TestingConfig):
+    FOLLOW_GRAPH_PATH = os.path.join(tempfile.mkdtemp(), 'follows.graph')
+    # look for new snapshots and log records on every question
+    FOLLOW_GRAPH_CHECK_INTERVAL = 0
+    FOLLOW_GRAPH_REBUILD_INTERVAL = 0
+
+
+app = create_app(SnapshotConfig)
+app.app_context().push()
+
+db.drop_all()
+db.create_all()
+
+
+class FollowGraphTestCase(TestCase):
+    def setUp(self):
+        path = SnapshotConfig.FOLLOW_GRAPH_PATH
+        for name in os.listdir(os.path.dirname(path)):
+            os.unlink(os.path.join(os.path.dirname(path), name))
+
+        User.query.delete()
+
+        users = [
+            User.signup(f"u{n}", f"u{n}@email.com", "password", None)
+            for n in range(4)
+        ]
+        db.session.flush()
+        self.ids = [user.id for user in users]
+
+        u0, u1, u2, u3 = self.ids
+        for follower, followed in [(u0, u1), (u0, u2), (u1, u3), (u2, u3),
+                                   (u3, u0)]:
+            Follow.add(follower, followed)
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def follow(self, follower_id, followed_id, action="follow"):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = follower_id
+
+        resp = self.client.post(
+            f"/users/{action}/{followed_id}",
+            headers={"Accept": "application/json"},
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def assert_answers(self, graph):
+        u0, u1, u2, u3 = self.ids
+
+        self.assertTrue(graph.is_following(u0, u1))
+        self.assertFalse(graph.is_following(u1, u0))
+        self.assertEqual(graph.following_among(u0, [u1, u2, u3]), {u1, u2})
+        self.assertEqual(graph.followers_known_to(u0, u3), [u1, u2])
+        self.assertEqual(graph.followers_known_to(u3, u1), [u0])
+
+    def test_snapshot_matches_database(self):
+        # no snapshot yet: from the database
+        self.assertIsNone(follow_graph._current())
+        self.assert_answers(follow_graph)
+
+        self.assertEqual(follow_graph.rebuild(), 5)
+        self.assertEqual(follow_graph._current().generation, 1)
+        self.assert_answers(follow_graph)
+
+        # users past the end of the snapshot follow no one
+        self.assertFalse(follow_graph.is_following(self.ids[3] + 10, 1))
+
+    def test_follows_since_snapshot(self):
+        u0, u1, u2, u3 = self.ids
+        follow_graph.rebuild()
+
+        # another worker, mapping the same files
+        other = FollowGraph(app)
+        app.extensions['follow_graph'] = follow_graph
+
+        self.follow(u0, u3)
+        self.follow(u0, u1, "stop-following")
+
+        for graph in (follow_graph, other):
+            self.assertTrue(graph.is_following(u0, u3))
+            self.assertFalse(graph.is_following(u0, u1))
+            self.assertEqual(graph.followers_known_to(u0, u3), [u2])
+
+        # a new snapshot takes over from the log
+        self.assertEqual(follow_graph.rebuild(), 5)
+        self.follow(u1, u0)
+        follow_graph.rebuild()
+
+        self.assertFalse(os.path.exists(log_path(follow_graph.path, 1)))
+        self.assertEqual(other._current().generation, 3)
+        self.assertTrue(other.is_following(u0, u3))
+        self.assertTrue(other.is_following(u1, u0))
+        self.assertFalse(other.is_following(u0, u1))
+
+    def test_profile(self):
+        u0, u1, u2, u3 = self.ids
+        follow_graph.rebuild()
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u0
+
+        resp = self.client.get(f"/users/{u3}")
+        self.assertIn(b"Follows you", resp.data)
+        self.assertIn(b"@u1, @u2", resp.data)
+
+        resp = self.client.get(f"/users/{u1}")
+        self.assertNotIn(b"Follows you", resp.data)
+        self.assertNotIn(b"Followed by", resp.data)
@@ -19,7 +19,10 @@ os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
 
 # Now we can import app
 
-from app import app, CURR_USER_KEY
+from app import create_app, CURR_USER_KEY
+
+app = create_app('testing')
+app.app_context().push()
 
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 
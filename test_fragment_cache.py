@@ -0,0 +1,111 @@
+"""Fragment cache tests."""
+
+# run these tests like:
+#
+#    FLASK_DEBUG=False python -m unittest test_fragment_cache.py
+
+
+import os
+import time
+from unittest import TestCase
+
+from models import db, User, Follow
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY, fragment_cache
+from fragment_cache import LRUStore
+import counters
+
+app = create_app('testing')
+app.app_context().push()
+
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+db.drop_all()
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class LRUStoreTestCase(TestCase):
+    """Test the in-process store."""
+
+    def test_eviction(self):
+        """Is the least recently used fragment evicted first?"""
+
+        store = LRUStore(maxsize=2)
+        store.set("a", "A", 60)
+        store.set("b", "B", 60)
+        store.get("a")
+        store.set("c", "C", 60)
+
+        self.assertEqual(store.get("a"), "A")
+        self.assertIsNone(store.get("b"))
+
+    def test_ttl(self):
+        """Do fragments expire?"""
+
+        store = LRUStore()
+        store.set("a", "A", 0.01)
+        time.sleep(0.02)
+
+        self.assertIsNone(store.get("a"))
+
+
+class FragmentCacheViewTestCase(TestCase):
+    """Render cached fragments in real pages."""
+
+    def setUp(self):
+        Follow.query.delete()
+        User.query.delete()
+
+        u1 = User.signup("u1", "u1@email.com", "password", None)
+        u2 = User.signup("u2", "u2@email.com", "password", None)
+        u3 = User.signup("u3", "u3@email.com", "password", None)
+        db.session.commit()
+
+        self.u1_id, self.u2_id, self.u3_id = u1.id, u2.id, u3.id
+
+        db.session.add(Follow(
+            user_being_followed_id=self.u3_id,
+            user_following_id=self.u1_id,
+        ))
+        counters.record_follow(self.u1_id, self.u3_id)
+        db.session.commit()
+
+        fragment_cache.store.clear()
+        self.client = app.test_client()
+
+    def get_as(self, user_id, url):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+        return self.client.get(url).get_data(as_text=True)
+
+    def test_viewer_bits_not_cached(self):
+        """Do different viewers still get their own follow buttons?"""
+
+        html = self.get_as(self.u1_id, "/users")
+        self.assertIn(f"/users/stop-following/{self.u3_id}", html)
+
+        html = self.get_as(self.u2_id, "/users")
+        self.assertIn(f"/users/follow/{self.u3_id}", html)
+        self.assertNotIn(f"/users/stop-following/{self.u3_id}", html)
+
+    def test_stamp_change(self):
+        """Does changing a user render a fresh fragment?"""
+
+        self.get_as(self.u1_id, "/users")
+        self.assertIn("@u3", self.get_as(self.u1_id, "/users"))
+
+        db.session.get(User, self.u3_id).username = "renamed"
+        db.session.commit()
+
+        html = self.get_as(self.u1_id, "/users")
+        self.assertIn("@renamed", html)
+        self.assertNotIn("@u3", html)
+
+        html = self.get_as(self.u1_id, f"/users/{self.u3_id}")
+        self.assertIn("@renamed", html)
+        self.assertIn("Unfollow", html)
@@ -0,0 +1,93 @@
+"""Password hashing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_hashing.py
+
+
+import os
+import threading
+from unittest import TestCase
+
+from models import db, hasher, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app
+from hashing import HashingBusy, PasswordHasher
+
+app = create_app('testing')
+app.app_context().push()
+
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+db.drop_all()
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+def saturate(password_hasher):
+    """Occupy every thread of `password_hasher`'s pool until the returned
+    event is set."""
+
+    release = threading.Event()
+    for _ in range(password_hasher.workers):
+        password_hasher._get_executor().submit(release.wait)
+
+    return release
+
+
+class PasswordHasherTestCase(TestCase):
+    def test_hash_and_check(self):
+        password_hasher = PasswordHasher(log_rounds=4)
+        hashed = password_hasher.hash("password")
+
+        self.assertTrue(password_hasher.check(hashed, "password"))
+        self.assertFalse(password_hasher.check(hashed, "wrong"))
+
+    def test_timeout(self):
+        """Does a call that waits too long raise HashingBusy?"""
+
+        password_hasher = PasswordHasher(log_rounds=4, workers=1, timeout=0.05)
+        release = saturate(password_hasher)
+
+        try:
+            with self.assertRaises(HashingBusy):
+                password_hasher.hash("password")
+        finally:
+            release.set()
+
+        # the timed out call gave its place back
+        self.assertTrue(password_hasher.check(
+            password_hasher.hash("password"), "password"))
+
+
+class HashingBusyViewTestCase(TestCase):
+    def setUp(self):
+        User.query.delete()
+        db.session.commit()
+
+        self.old_timeout = hasher.timeout
+        hasher.timeout = 0.05
+
+    def tearDown(self):
+        hasher.timeout = self.old_timeout
+
+    def test_signup_busy(self):
+        """Does signup answer 503, not 500, when hashing times out?"""
+
+        release = saturate(hasher)
+
+        try:
+            resp = app.test_client().post("/signup", data={
+                "username": "u1",
+                "email": "u1@email.com",
+                "password": "password",
+            })
+        finally:
+            release.set()
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn("very busy", resp.get_data(as_text=True))
+        self.assertEqual(User.query.count(), 0)
@@ -0,0 +1,89 @@
+"""Write-behind like count tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_like_buffer.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Message, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY, like_buffer
+from config import TestingConfig
+
+
+class BufferedConfig(TestingConfig):
+    # long enough that only the tests flush
+    LIKE_BUFFER_INTERVAL = 600
+
+
+app = create_app(BufferedConfig)
+app.app_context().push()
+
+db.drop_all()
+db.create_all()
+
+
+class LikeBufferTestCase(TestCase):
+    def setUp(self):
+        like_buffer.flush()
+        User.query.delete()
+
+        author = User.signup("author", "author@email.com", "password", None)
+        db.session.flush()
+        msg = Message(text="viral", user_id=author.id)
+        db.session.add(msg)
+
+        self.fan_ids = []
+        for n in range(3):
+            fan = User.signup(f"fan{n}", f"fan{n}@email.com", "password", None)
+            db.session.flush()
+            self.fan_ids.append(fan.id)
+
+        db.session.commit()
+        self.msg_id = msg.id
+
+        self.client = app.test_client()
+
+    def like(self, user_id, action="like"):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+        return self.client.post(
+            f"/messages/{action}/{self.msg_id}",
+            headers={"Accept": "application/json"},
+        )
+
+    def stored_count(self):
+        db.session.expire_all()
+        return db.session.get(Message, self.msg_id).likes_count
+
+    def test_likes_written_behind(self):
+        for fan_id in self.fan_ids:
+            resp = self.like(fan_id)
+            self.assertEqual(resp.status_code, 200)
+
+        # pending, but merged into what's shown
+        self.assertEqual(resp.json["likes_count"], 3)
+        self.assertEqual(self.stored_count(), 0)
+
+        resp = self.like(self.fan_ids[0], "unlike")
+        self.assertEqual(resp.json["likes_count"], 2)
+
+        self.assertEqual(like_buffer.flush(), 1)
+        self.assertEqual(self.stored_count(), 2)
+        self.assertEqual(like_buffer.flush(), 0)
+
+        # the likers' own counts are still written at once
+        self.assertEqual(db.session.get(User, self.fan_ids[1]).likes_count, 1)
+
+    def test_rolled_back_likes_dropped(self):
+        like_buffer.record(self.msg_id, 1)
+        db.session.rollback()
+
+        self.assertEqual(like_buffer.flush(), 0)
+        self.assertEqual(self.stored_count(), 0)
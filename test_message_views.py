@@ -8,7 +8,9 @@
 import os
 from unittest import TestCase
 
-from models import db, Message, User
+from sqlalchemy import event
+
+from models import db, Follow, Like, Message, User
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -19,7 +21,12 @@ os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
 
 # Now we can import app
 
-from app import app, CURR_USER_KEY
+from app import create_app, CURR_USER_KEY, fragment_cache
+import counters
+import timeline
+
+app = create_app('testing')
+app.app_context().push()
 
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 
@@ -79,3 +86,225 @@ class MessageAddViewTestCase(MessageBaseViewTestCase):
             self.assertEqual(resp.status_code, 302)
 
             Message.query.filter_by(text="Hello").one()
+
+
+class MessagePaginationViewTestCase(MessageBaseViewTestCase):
+    def test_profile_pages(self):
+        """Does the profile page show one page of messages with cursors?"""
+        app.config['PAGE_SIZE'] = 1
+
+        m2 = Message(text="m2-text", user_id=self.u1_id)
+        db.session.add(m2)
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.get(f"/users/{self.u1_id}")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("m2-text", html)
+            self.assertNotIn("m1-text", html)
+            self.assertIn("Older", html)
+
+            older = html.split("before=")[1].split('"')[0]
+            resp = c.get(f"/users/{self.u1_id}?before={older}")
+            html = resp.get_data(as_text=True)
+
+            self.assertIn("m1-text", html)
+            self.assertNotIn("m2-text", html)
+            self.assertIn("Newer", html)
+
+        app.config['PAGE_SIZE'] = 20
+
+    def test_bad_cursor(self):
+        """Is a malformed cursor rejected?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.get(f"/users/{self.u1_id}?before=not-a-cursor")
+            self.assertEqual(resp.status_code, 400)
+
+
+class MessageCachingViewTestCase(MessageBaseViewTestCase):
+    def test_show_message_not_modified(self):
+        """Does a message page answer 304 when the client is up to date?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.get(f"/messages/{self.m1_id}")
+            etag = resp.headers["ETag"]
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("no-cache", resp.headers["Cache-Control"])
+
+            resp = c.get(
+                f"/messages/{self.m1_id}",
+                headers={"If-None-Match": etag},
+            )
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.data, b"")
+
+    def test_new_session_modified(self):
+        """Does a new session's CSRF secret invalidate cached pages?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+                sess["csrf_token"] = "old-secret"
+
+            etag = c.get(f"/messages/{self.m1_id}").headers["ETag"]
+
+            with c.session_transaction() as sess:
+                sess["csrf_token"] = "new-secret"
+
+            resp = c.get(
+                f"/messages/{self.m1_id}",
+                headers={"If-None-Match": etag},
+            )
+            self.assertEqual(resp.status_code, 200)
+
+
+class MessageLikeViewTestCase(MessageBaseViewTestCase):
+    def test_like_idempotent(self):
+        """Are repeated likes and unlikes no-ops?"""
+
+        u2 = User.signup("u2", "u2@email.com", "password", None)
+        db.session.commit()
+        u2_id = u2.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = u2_id
+
+            for _ in range(2):
+                resp = c.post(
+                    f"/messages/like/{self.m1_id}",
+                    headers={"Referer": "/"},
+                )
+                self.assertEqual(resp.status_code, 302)
+
+            self.assertEqual(db.session.get(Message, self.m1_id).likes_count, 1)
+            self.assertEqual(db.session.get(User, u2_id).likes_count, 1)
+
+            for _ in range(2):
+                resp = c.post(
+                    f"/messages/unlike/{self.m1_id}",
+                    headers={"Referer": "/"},
+                )
+                self.assertEqual(resp.status_code, 302)
+
+            self.assertEqual(db.session.get(Message, self.m1_id).likes_count, 0)
+            self.assertEqual(db.session.get(User, u2_id).likes_count, 0)
+
+    def test_like_json(self):
+        """Do likes asked for as JSON answer with the new state and count?"""
+
+        u2 = User.signup("u2", "u2@email.com", "password", None)
+        db.session.commit()
+        u2_id = u2.id
+        headers = {"Accept": "application/json"}
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = u2_id
+
+            resp = c.post(f"/messages/like/{self.m1_id}", headers=headers)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json, {"liked": True, "likes_count": 1})
+
+            resp = c.post(f"/messages/unlike/{self.m1_id}", headers=headers)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json, {"liked": False, "likes_count": 0})
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.post(f"/messages/like/{self.m1_id}", headers=headers)
+            self.assertEqual(resp.status_code, 403)
+            self.assertIn("error", resp.json)
+
+
+class MessageListQueryCountTestCase(MessageBaseViewTestCase):
+    """Do message lists run the same queries for 1 message as for many?"""
+
+    def setUp(self):
+        super().setUp()
+
+        self.authors = 0
+        self.queries = 0
+        event.listen(db.engine, 'before_cursor_execute', self.count_query)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_query)
+
+    def count_query(self, *args, **kwargs):
+        self.queries += 1
+
+    def add_liked_messages(self, count):
+        """Add `count` messages, each by a new author u1 follows and likes.
+
+        Each author also likes a new message of u1's.
+        """
+
+        for _ in range(count):
+            self.authors += 1
+            author = User.signup(
+                f"a{self.authors}", f"a{self.authors}@email.com", "password",
+                None)
+            msg = Message(text=f"a{self.authors}-text", user=author)
+            own = Message(text=f"u1-text-{self.authors}", user_id=self.u1_id)
+            db.session.add_all([msg, own])
+            db.session.flush()
+
+            Follow.add(self.u1_id, author.id)
+            Like.add(self.u1_id, msg.id)
+            Like.add(author.id, own.id)
+
+        timeline.rebuild_timelines()
+        counters.reconcile_counters()
+        db.session.commit()
+        # nothing the pages need is already loaded
+        db.session.expunge_all()
+
+    def page_queries(self):
+        """Return {page: queries to render it} for the message lists."""
+
+        urls = {
+            'home': "/",
+            'profile': f"/users/{self.u1_id}",
+            'likes': f"/users/{self.u1_id}/likes",
+        }
+        queries = {}
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            for page, url in urls.items():
+                # once to warm the per-process caches, then counted with
+                # every message fragment rendered afresh
+                c.get(url)
+                fragment_cache.store.clear()
+
+                self.queries = 0
+                resp = c.get(url)
+                self.assertEqual(resp.status_code, 200)
+                queries[page] = self.queries
+
+        return queries
+
+    def test_fixed_queries_per_page(self):
+        self.add_liked_messages(1)
+        one = self.page_queries()
+
+        self.add_liked_messages(19)
+        many = self.page_queries()
+
+        self.assertEqual(many, one)
@@ -0,0 +1,95 @@
+"""Anonymous page cache tests."""
+
+# run these tests like:
+#
+#    FLASK_DEBUG=False python -m unittest test_page_cache.py
+
+
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY, page_cache
+from page_cache import DiskStore
+
+app = create_app('testing')
+app.app_context().push()
+
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+db.drop_all()
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class DiskStoreTestCase(TestCase):
+    """Test the on-disk store."""
+
+    def test_expiry(self):
+        """Are pages only served until their TTL is up?"""
+
+        with tempfile.TemporaryDirectory() as path:
+            store = DiskStore(path)
+            store.set("page:/", "hello", 60)
+            store.set("page:/login", "hello", 0.01)
+            time.sleep(0.02)
+
+            self.assertEqual(store.get("page:/"), "hello")
+            self.assertIsNone(store.get("page:/login"))
+            self.assertIsNone(store.get("page:/signup"))
+
+
+class PageCacheViewTestCase(TestCase):
+    """Serve anonymous pages from the cache."""
+
+    def setUp(self):
+        User.query.delete()
+        u1 = User.signup("u1", "u1@email.com", "password", None)
+        db.session.commit()
+        self.u1_id = u1.id
+
+        page_cache.store.clear()
+
+        self.queries = 0
+        event.listen(db.engine, 'before_cursor_execute', self.count_query)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.count_query)
+
+    def count_query(self, *args, **kwargs):
+        self.queries += 1
+
+    def test_anonymous_hit(self):
+        """Is a repeat anonymous page served without touching the database?"""
+
+        for url in ["/", "/login", "/signup"]:
+            first = app.test_client().get(url)
+
+            self.queries = 0
+            resp = app.test_client().get(url)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.data, first.data)
+            self.assertEqual(self.queries, 0)
+
+    def test_session_bypass(self):
+        """Do visitors with a session get their own page?"""
+
+        app.test_client().get("/")
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+
+        html = client.get("/").get_data(as_text=True)
+
+        self.assertIn("@u1", html)
+        self.assertNotIn("Sign up now", html)
@@ -0,0 +1,242 @@
+"""Query plan tests.
+
+Runs the hot routes against a seeded database, records the SQL they
+send, and checks with EXPLAIN that none of it needs a sequential scan.
+"""
+
+# run these tests like:
+#
+#    FLASK_DEBUG=False python -m unittest test_query_plans.py
+
+
+import os
+from unittest import TestCase, skipUnless
+
+from sqlalchemy import event
+
+from models import db, User, Message, Follow, Like
+import counters
+import tags
+import timeline
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import create_app, CURR_USER_KEY
+
+app = create_app('testing')
+app.app_context().push()
+
+app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+
+# This is a bit of hack, but don't use Flask DebugToolbar
+
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.drop_all()
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+NUM_USERS = 50
+MESSAGES_PER_USER = 20
+
+UNPARENTHESIZE = str.maketrans("", "", "()")
+
+
+@skipUnless(
+    db.engine.dialect.name == "postgresql",
+    "EXPLAIN checks need PostgreSQL",
+)
+class QueryPlanTestCase(TestCase):
+    """Check that the hot queries are served by indexes."""
+
+    @classmethod
+    def setUpClass(cls):
+        Like.query.delete()
+        Follow.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        users = [
+            User(
+                username=f"user{i}",
+                email=f"user{i}@email.com",
+                password="password",
+            )
+            for i in range(NUM_USERS)
+        ]
+        db.session.add_all(users)
+        db.session.flush()
+
+        db.session.add_all([
+            Message(text=f"message {j} #tag{j} @user{j}", user_id=user.id)
+            for user in users
+            for j in range(MESSAGES_PER_USER)
+        ])
+        db.session.add_all([
+            Follow(user_being_followed_id=other.id, user_following_id=user.id)
+            for i, user in enumerate(users)
+            for other in users[i + 1:i + 6]
+        ])
+        db.session.flush()
+
+        db.session.add_all([
+            Like(user_id=user.id, message_id=msg.id)
+            for user in users[:10]
+            for msg in Message.query.filter(Message.user_id != user.id)
+                                    .limit(10)
+        ])
+
+        timeline.rebuild_timelines()
+        tags.backfill_tags()
+        counters.reconcile_counters()
+        db.session.commit()
+
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+        cls.user_id = users[0].id
+        cls.other_id = users[1].id
+        cls.stranger_id = users[-1].id
+        cls.message_id = (Message.query
+                          .filter_by(user_id=cls.other_id)
+                          .first()
+                          .id)
+
+    def capture(self, requests):
+        """Run `requests` and return the (sql, params) they execute."""
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, many):
+            if not many and not statement.lstrip().upper().startswith(
+                    ("INSERT INTO", "COMMIT", "SAVEPOINT", "RELEASE")):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", record)
+
+        try:
+            with app.test_client() as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.user_id
+
+                for method, url, data in requests:
+                    resp = c.open(
+                        url,
+                        method=method,
+                        data=data,
+                        headers={"Referer": "/"},
+                    )
+                    self.assertLess(resp.status_code, 400, url)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        return statements
+
+    def full_scans(self, plan, leading_columns, limited=False):
+        """Yield plan nodes that read a whole table or index.
+
+        An index scan whose Index Cond doesn't use the index's leading
+        column is a full scan in disguise (the planner picks them when seq
+        scans are disabled), unless a Limit above it stops the scan early.
+        A Sort, Hash or Aggregate in between has to read all of its input
+        first, so it cancels the Limit. Partial indexes (not in
+        `leading_columns`) only hold the rows they're for, so reading one
+        whole is fine.
+        """
+
+        node_type = plan["Node Type"]
+
+        if node_type == "Limit":
+            limited = True
+        elif node_type in ("Sort", "Hash", "Aggregate"):
+            limited = False
+
+        if node_type == "Seq Scan":
+            yield plan
+        elif (plan.get("Index Name") in leading_columns
+              and not limited):
+            # EXPLAIN and pg_get_indexdef parenthesize expressions
+            # differently, so compare without parentheses
+            leading_column = leading_columns[plan["Index Name"]]
+            index_cond = plan.get("Index Cond", "")
+            if (leading_column.translate(UNPARENTHESIZE)
+                    not in index_cond.translate(UNPARENTHESIZE)):
+                yield plan
+
+        for child in plan.get("Plans", []):
+            yield from self.full_scans(child, leading_columns, limited)
+
+    def assertNoSeqScans(self, statements):
+        """Fail if any of `statements` can only be planned as a full scan."""
+
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("SET enable_seqscan = off")
+
+            leading_columns = dict(conn.exec_driver_sql(
+                """SELECT indexrelid::regclass::text,
+                          pg_get_indexdef(indexrelid, 1, true)
+                   FROM pg_index
+                   WHERE indpred IS NULL"""
+            ).all())
+
+            for statement, parameters in statements:
+                [(plan,)] = conn.exec_driver_sql(
+                    f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                scans = [
+                    f"{node['Node Type']} on {node.get('Relation Name')}"
+                    f" using {node.get('Index Name')}"
+                    for node in self.full_scans(
+                        plan[0]["Plan"], leading_columns)
+                ]
+                self.assertEqual(scans, [], statement)
+
+            conn.rollback()
+
+    def test_read_routes(self):
+        """Are timeline, profile and list pages served by indexes?"""
+
+        statements = self.capture([
+            ("GET", "/", None),
+            ("GET", f"/users/{self.user_id}", None),
+            ("GET", f"/users/{self.user_id}/following", None),
+            ("GET", f"/users/{self.user_id}/followers", None),
+            ("GET", f"/users/{self.user_id}/likes", None),
+            ("GET", f"/messages/{self.message_id}", None),
+            ("GET", "/users", None),
+            ("GET", "/users?q=us", None),
+            ("GET", "/users?q=ser1", None),
+            ("GET", "/users/typeahead?q=us", None),
+            ("GET", "/messages/search?q=message+7", None),
+            ("GET", "/messages/search?q=message+7&author=user1", None),
+            ("GET", "/tags/tag1", None),
+            ("GET", f"/users/{self.user_id}/mentions", None),
+        ])
+
+        self.assertNoSeqScans(statements)
+
+    def test_write_routes(self):
+        """Do posting, following and liking avoid full table scans?"""
+
+        statements = self.capture([
+            ("POST", "/messages/new", {"text": "hello #tag1 @user1"}),
+            ("POST", f"/users/follow/{self.stranger_id}", None),
+            ("POST", f"/users/stop-following/{self.stranger_id}", None),
+            ("POST", f"/messages/like/{self.message_id}", None),
+            ("POST", f"/messages/unlike/{self.message_id}", None),
+        ])
+
+        self.assertNoSeqScans(statements)
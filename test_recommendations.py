@@ -0,0 +1,93 @@
+"""Who-to-follow recommendation tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_recommendations.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Follow, Recommendation, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+from recommendations import build_recommendations, suggestions_for
+
+app = create_app('testing')
+app.app_context().push()
+
+db.drop_all()
+db.create_all()
+
+
+class RecommendationsTestCase(TestCase):
+    def setUp(self):
+        User.query.delete()
+
+        users = [
+            User.signup(f"u{n}", f"u{n}@email.com", "password", None)
+            for n in range(5)
+        ]
+        db.session.flush()
+        self.ids = [user.id for user in users]
+
+        for follower, followed in [(0, 1), (0, 2), (1, 3), (2, 3), (2, 4),
+                                   (3, 0), (4, 0)]:
+            Follow.add(self.ids[follower], self.ids[followed])
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def test_build(self):
+        u0, u1, u2, u3, u4 = self.ids
+
+        progress = []
+        stored = build_recommendations(
+            chunk_size=2, progress=lambda done, n: progress.append(done))
+
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertEqual(stored, Recommendation.query.count())
+
+        scores = {
+            (rec.user_id, rec.recommended_id): rec.score
+            for rec in Recommendation.query
+        }
+
+        # u1 and u2 follow u3, and u2 follows u4
+        self.assertEqual(scores[(u0, u3)], 2)
+        self.assertEqual(scores[(u0, u4)], 1)
+        # never yourself or someone you already follow
+        self.assertNotIn((u3, u0), scores)
+        self.assertNotIn((u1, u1), scores)
+
+        self.assertEqual(
+            [user.id for user in suggestions_for(u0)], [u3, u4])
+
+    def test_suggestions_skip_new_follows(self):
+        u0, u1, u2, u3, u4 = self.ids
+        build_recommendations()
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u0
+
+        resp = self.client.get("/")
+        self.assertIn(b"Who to follow", resp.data)
+        self.assertIn(b"@u3", resp.data)
+
+        Follow.add(u0, u3)
+        db.session.commit()
+
+        self.assertEqual([user.id for user in suggestions_for(u0)], [u4])
+
+    def test_rebuild_replaces(self):
+        u0, u1, u2, u3, u4 = self.ids
+        build_recommendations()
+
+        Follow.remove(u0, u2)
+        db.session.commit()
+        build_recommendations(chunk_size=1)
+
+        self.assertEqual(
+            [user.id for user in suggestions_for(u0)], [u3])
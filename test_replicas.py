@@ -0,0 +1,103 @@
+"""Read replica routing tests."""
+
+# run these tests like:
+#
+#    FLASK_DEBUG=False python -m unittest test_replicas.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+from config import TestingConfig
+
+
+class ReplicaConfig(TestingConfig):
+    # the test database stands in for its own replica
+    SQLALCHEMY_REPLICA_URIS = [TestingConfig.SQLALCHEMY_DATABASE_URI]
+
+
+app = create_app(ReplicaConfig)
+app.app_context().push()
+
+db.drop_all()
+db.create_all()
+
+
+class ReplicaRoutingTestCase(TestCase):
+    """Check which engine each request's queries go to."""
+
+    def setUp(self):
+        User.query.delete()
+        u1 = User.signup("u1", "u1@email.com", "password", None)
+        u2 = User.signup("u2", "u2@email.com", "password", None)
+        db.session.commit()
+
+        self.u1_id, self.u2_id = u1.id, u2.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+
+        self.replica_queries = 0
+        [self.replica] = app.extensions['replicas']
+        event.listen(self.replica, 'before_cursor_execute', self.count_query)
+
+    def tearDown(self):
+        event.remove(self.replica, 'before_cursor_execute', self.count_query)
+
+    def count_query(self, *args, **kwargs):
+        self.replica_queries += 1
+
+    def test_read_only_view(self):
+        """Do read-only views read from the replica?"""
+
+        resp = self.client.get("/users")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(self.replica_queries, 0)
+
+    def test_other_view(self):
+        """Do other views stay on the primary?"""
+
+        resp = self.client.get("/users/profile")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.replica_queries, 0)
+
+    def test_read_your_writes(self):
+        """After a write, are the visitor's reads sent to the primary?"""
+
+        resp = self.client.post(f"/users/follow/{self.u2_id}")
+        self.assertEqual(resp.status_code, 302)
+
+        resp = self.client.get(f"/users/{self.u1_id}/following")
+
+        self.assertIn("@u2", resp.get_data(as_text=True))
+        self.assertEqual(self.replica_queries, 0)
+
+    def test_plain_app(self):
+        """Does a later app without replicas use only its primary?"""
+
+        plain = create_app('testing')
+        self.assertEqual(plain.extensions['replicas'], [])
+
+        with plain.app_context():
+            # every bind this app knows of has an engine
+            db.create_all()
+
+            client = plain.test_client()
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = client.get("/users")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("@u2", resp.get_data(as_text=True))
+        self.assertEqual(self.replica_queries, 0)
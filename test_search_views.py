@@ -0,0 +1,202 @@
+"""Search View tests."""
+
+# run these tests like:
+#
+#    FLASK_DEBUG=False python -m unittest test_search_views.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Message, User
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import create_app, CURR_USER_KEY
+
+app = create_app('testing')
+app.app_context().push()
+
+app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+
+# This is a bit of hack, but don't use Flask DebugToolbar
+
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.drop_all()
+db.create_all()
+
+# Don't have WTForms use CSRF at all, since it's a pain to test
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class UserSearchViewTestCase(TestCase):
+    """Set up users with overlapping names"""
+
+    def setUp(self):
+        User.query.delete()
+
+        for username in ["xbob", "bobby", "bob", "alice"]:
+            User.signup(username, f"{username}@email.com", "password", None)
+        db.session.commit()
+
+        self.u1_id = User.query.filter_by(username="alice").one().id
+
+        self.client = app.test_client()
+
+    def test_search_ranking(self):
+        """Are exact matches first, then prefix matches, then the rest?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.get("/users?q=BOB")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotIn("@alice", html)
+            self.assertLess(html.index("@bob<"), html.index("@bobby"))
+            self.assertLess(html.index("@bobby"), html.index("@xbob"))
+
+    def test_short_search_prefix_only(self):
+        """Do terms shorter than three letters only match prefixes?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            html = c.get("/users?q=bo").get_data(as_text=True)
+
+            self.assertIn("@bobby", html)
+            self.assertNotIn("@xbob", html)
+
+    def test_typeahead(self):
+        """Does typeahead return JSON with the best match first?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.get("/users/typeahead?q=bob")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(
+                [u["username"] for u in resp.json["users"]],
+                ["bob", "bobby", "xbob"],
+            )
+
+    def test_typeahead_logged_out(self):
+        """Is typeahead refused when logged out?"""
+
+        resp = self.client.get("/users/typeahead?q=bob")
+        self.assertEqual(resp.status_code, 401)
+
+
+class MessageSearchViewTestCase(TestCase):
+    """Set up messages by two authors"""
+
+    def setUp(self):
+        User.query.delete()
+
+        alice = User.signup("alice", "alice@email.com", "password", None)
+        bob = User.signup("bob", "bob@email.com", "password", None)
+        db.session.flush()
+        self.alice_id = alice.id
+
+        db.session.add_all([
+            Message(text="Cats are great", user_id=alice.id),
+            Message(text="cats cats cats", user_id=bob.id),
+            Message(text="I like dogs <b>", user_id=bob.id),
+            Message(text="my cat is running", user_id=bob.id),
+        ])
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.alice_id
+
+    def search(self, query):
+        resp = self.client.get(
+            f"/messages/search?{query}",
+            headers={"Accept": "application/json"},
+        )
+        self.assertEqual(resp.status_code, 200)
+        return resp.json
+
+    def test_ranked_and_stemmed(self):
+        """Are stemmed matches found, the best (then newest) first?"""
+
+        results = self.search("q=cat")
+
+        self.assertEqual(
+            [msg["text"] for msg in results["messages"]],
+            ["cats cats cats", "my cat is running", "Cats are great"],
+        )
+        self.assertEqual(
+            results["messages"][2]["html"],
+            "<mark>Cats</mark> are great",
+        )
+
+        self.assertCountEqual(
+            [msg["text"] for msg in self.search("q=cat -great")["messages"]],
+            ["cats cats cats", "my cat is running"],
+        )
+
+    def test_pages(self):
+        """Do page cursors continue from the last result?"""
+
+        first = self.search("q=cat&limit=2")
+        self.assertEqual(len(first["messages"]), 2)
+
+        resp = self.client.get(
+            first["older"], headers={"Accept": "application/json"})
+        self.assertEqual(
+            [msg["text"] for msg in resp.json["messages"]],
+            ["Cats are great"],
+        )
+        self.assertIsNone(resp.json["older"])
+
+    def test_author_filter(self):
+        """Are results limited to the author, if there is one?"""
+
+        results = self.search("q=cats&author=@alice")
+        self.assertEqual(
+            [msg["user"]["username"] for msg in results["messages"]],
+            ["alice"],
+        )
+
+        self.assertEqual(self.search("q=cats&author=nobody")["messages"], [])
+
+    def test_html_escaped(self):
+        """Is message text escaped around the highlights?"""
+
+        html = self.client.get("/messages/search?q=dogs").get_data(
+            as_text=True)
+
+        self.assertIn("I like <mark>dogs</mark> &lt;b&gt;", html)
+
+    def test_deleted_authors_left_out(self):
+        """Are messages by deleted (unpurged) users left out?"""
+
+        User.query.filter_by(username="bob").update(
+            {"deleted_at": db.func.now()})
+        db.session.commit()
+
+        results = self.search("q=cats")
+        self.assertEqual(
+            [msg["user"]["username"] for msg in results["messages"]],
+            ["alice"],
+        )
@@ -0,0 +1,100 @@
+"""Static asset pipeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_static_assets.py
+
+
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+import brotli
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, static_assets
+from assets import build_assets
+
+app = create_app('testing')
+app.app_context().push()
+
+
+class StaticAssetsTestCase(TestCase):
+    """Build a small static folder and serve it."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.static_folder = self.tmp.name
+
+        os.mkdir(os.path.join(self.static_folder, 'images'))
+        with open(os.path.join(self.static_folder, 'images', 'a.png'), 'wb') as f:
+            f.write(b'\x89PNG not really')
+        with open(os.path.join(self.static_folder, 'style.css'), 'w') as f:
+            f.write('body { background: url("/static/images/a.png"); }\n' * 50)
+
+        self.manifest = build_assets(self.static_folder)
+
+        self.old_build_folder = static_assets.build_folder
+        static_assets.build_folder = os.path.join(self.static_folder, 'build')
+        static_assets.load_manifest()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        static_assets.build_folder = self.old_build_folder
+        static_assets.load_manifest()
+        self.tmp.cleanup()
+
+    def test_build(self):
+        """Are files fingerprinted and CSS references rewritten?"""
+
+        css = self.manifest['style.css']
+        png = self.manifest['images/a.png']
+        build = os.path.join(self.static_folder, 'build')
+
+        self.assertRegex(css, r'^style\.[0-9a-f]{12}\.css$')
+        for suffix in ('.gz', '.br'):
+            self.assertTrue(os.path.exists(os.path.join(build, css + suffix)))
+            self.assertFalse(os.path.exists(os.path.join(build, png + suffix)))
+
+        with open(os.path.join(build, css)) as f:
+            self.assertIn(f'/static/build/{png}', f.read())
+
+    def test_serve_precompressed(self):
+        """Is the gzip variant sent to clients that accept it?"""
+
+        url = static_assets.url('style.css')
+        resp = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertIn(b'background', gzip.decompress(resp.data))
+
+        resp = self.client.get(url, headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_serve_brotli(self):
+        """Is the brotli variant preferred by clients that accept it?"""
+
+        url = static_assets.url('style.css')
+        resp = self.client.get(
+            url, headers={'Accept-Encoding': 'gzip, deflate, br'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'br')
+        self.assertIn(b'background', brotli.decompress(resp.data))
+
+        # unless the client prefers gzip
+        resp = self.client.get(
+            url, headers={'Accept-Encoding': 'br;q=0.1, gzip;q=1.0'})
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+
+    def test_unbuilt_fallback(self):
+        """Do unbuilt files fall back to /static/?"""
+
+        self.assertEqual(static_assets.url('nope.js'), '/static/nope.js')
+        self.assertEqual(self.client.get('/static/build/nope.js').status_code, 404)
@@ -0,0 +1,143 @@
+"""Hashtag and mention tests."""
+
+# run these tests like:
+#
+#    FLASK_DEBUG=False python -m unittest test_tags.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Hashtag, Mention, Message, MessageHashtag, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY
+import tags
+
+app = create_app('testing')
+app.app_context().push()
+
+app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+app.config['DEBUG_TB_HOSTS'] = ['dont-show-debug-toolbar']
+
+db.drop_all()
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ExtractTestCase(TestCase):
+    def test_extract_hashtags(self):
+        self.assertEqual(
+            tags.extract_hashtags("#Flask and #flask, c# #1 #sql_2 ##x"),
+            ["flask", "sql_2"])
+
+    def test_extract_mentions(self):
+        self.assertEqual(
+            tags.extract_mentions("@u1 and @u2, not me@email.com; @u1"),
+            ["u1", "u2"])
+
+    def test_link_hashtags(self):
+        self.assertEqual(
+            str(tags.link_hashtags("<b>#Hi</b> #1")),
+            '&lt;b&gt;<a href="/tags/hi">#Hi</a>&lt;/b&gt; #1')
+
+
+class TagViewTestCase(TestCase):
+    def setUp(self):
+        Hashtag.query.delete()
+        User.query.delete()
+
+        u1 = User.signup("u1", "u1@email.com", "password", None)
+        u2 = User.signup("u2", "u2@email.com", "password", None)
+        db.session.commit()
+
+        self.u1_id = u1.id
+        self.u2_id = u2.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.u1_id
+
+    def post(self, text):
+        resp = self.client.post("/messages/new", data={"text": text})
+        self.assertEqual(resp.status_code, 302)
+
+        return Message.query.filter_by(text=text).one().id
+
+    def test_index_on_post(self):
+        msg_id = self.post("hi @u2 and @nobody #Flask #flask #web")
+
+        self.assertEqual(
+            sorted(name for (name,) in db.session.query(Hashtag.name)),
+            ["flask", "web"])
+        self.assertEqual(
+            MessageHashtag.query.filter_by(message_id=msg_id).count(), 2)
+        self.assertEqual(
+            [m.user_id for m in Mention.query.filter_by(message_id=msg_id)],
+            [self.u2_id])
+
+    def test_tag_page(self):
+        self.post("first #flask")
+        self.post("second #Flask")
+        self.post("other #web")
+
+        resp = self.client.get("/tags/FLASK")
+        html = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertLess(html.index("second"), html.index("first"))
+        self.assertNotIn("other", html)
+        self.assertIn('<a href="/tags/flask">#Flask</a>', html)
+
+        resp = self.client.get("/tags/unused")
+        self.assertIn("no messages with #unused yet",
+                      resp.get_data(as_text=True))
+
+    def test_tag_page_paginates(self):
+        for n in range(25):
+            self.post(f"message {n} #many")
+
+        html = self.client.get("/tags/many").get_data(as_text=True)
+        self.assertIn("message 24 ", html)
+        self.assertIn("Older", html)
+        self.assertNotIn("message 0 ", html)
+
+    def test_mentions_page(self):
+        self.post("hello @u2")
+        self.post("hello nobody")
+
+        resp = self.client.get(f"/users/{self.u2_id}/mentions")
+        html = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("hello @u2", html)
+        self.assertNotIn("hello nobody", html)
+
+    def test_delete_removes_index(self):
+        msg_id = self.post("bye @u2 #flask")
+
+        resp = self.client.post(f"/messages/{msg_id}/delete")
+        self.assertEqual(resp.status_code, 302)
+
+        self.assertEqual(MessageHashtag.query.count(), 0)
+        self.assertEqual(Mention.query.count(), 0)
+
+    def test_backfill(self):
+        for n in range(5):
+            db.session.add(Message(
+                text=f"old {n} #old @u2", user_id=self.u1_id))
+        db.session.commit()
+
+        progress = []
+        totals = tags.backfill_tags(
+            chunk_size=2, progress=lambda *args: progress.append(args))
+
+        self.assertEqual(totals, (5, 5))
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(MessageHashtag.query.count(), 5)
+
+        # already indexed messages are skipped
+        self.assertEqual(tags.backfill_tags(chunk_size=2), (5, 5))
+        self.assertEqual(Mention.query.count(), 5)
@@ -0,0 +1,132 @@
+"""Timeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_timeline_model.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follow, TimelineEntry
+
+# BEFORE we import our app, let's set an environmental variable
+# to use a different database for tests (we need to do this
+# before we import our app, since that will have already
+# connected to the database
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+# Now we can import app
+
+from app import create_app
+import counters
+import timeline
+
+app = create_app('testing')
+app.app_context().push()
+
+# Create our tables (we do this here, so we only create the tables
+# once for all tests --- in each test, we'll delete the data
+# and create fresh new clean test data
+
+db.drop_all()
+db.create_all()
+
+
+class TimelineTestCase(TestCase):
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Message.query.delete()
+        Follow.query.delete()
+        User.query.delete()
+
+        u1 = User.signup("u1", "u1@email.com", "password", None)
+        u2 = User.signup("u2", "u2@email.com", "password", None)
+        db.session.flush()
+
+        u2.following.append(u1)
+        counters.record_follow(u2.id, u1.id)
+        db.session.commit()
+
+        self.u1_id = u1.id
+        self.u2_id = u2.id
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = timeline.DEFAULT_FANOUT_LIMIT
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def post(self, user_id, text):
+        msg = Message(text=text, user_id=user_id)
+        db.session.add(msg)
+        db.session.flush()
+        timeline.fan_out_message(msg)
+        db.session.commit()
+        return msg
+
+    def test_fan_out_message(self):
+        """Does a new message reach the author and their followers?"""
+        msg = self.post(self.u1_id, "hello")
+
+        self.assertEqual(timeline.get_timeline(self.u1_id), [msg])
+        self.assertEqual(timeline.get_timeline(self.u2_id), [msg])
+
+    def test_remove_message(self):
+        """Does deleting a message remove it from every timeline?"""
+        msg = self.post(self.u1_id, "hello")
+        timeline.remove_message(msg)
+        db.session.commit()
+
+        self.assertEqual(timeline.get_timeline(self.u2_id), [])
+
+    def test_follow_and_unfollow(self):
+        """Are a user's messages added on follow and removed on unfollow?"""
+        msg = self.post(self.u2_id, "from u2")
+
+        timeline.add_follow(self.u1_id, self.u2_id)
+        db.session.commit()
+        self.assertEqual(timeline.get_timeline(self.u1_id), [msg])
+
+        timeline.remove_follow(self.u1_id, self.u2_id)
+        db.session.commit()
+        self.assertEqual(timeline.get_timeline(self.u1_id), [])
+
+    def test_pull_author(self):
+        """Are messages of very popular users merged in at read time?"""
+        app.config['TIMELINE_FANOUT_LIMIT'] = 0
+        msg = self.post(self.u1_id, "hello")
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.u2_id).count(), 0)
+        self.assertEqual(timeline.get_timeline(self.u2_id), [msg])
+
+    def test_resume_fan_out(self):
+        """Are a pulled author's messages delivered once they drop back?"""
+        u3 = User.signup("u3", "u3@email.com", "password", None)
+        db.session.flush()
+        Follow.add(u3.id, self.u1_id)
+        counters.record_follow(u3.id, self.u1_id)
+        db.session.commit()
+
+        app.config['TIMELINE_FANOUT_LIMIT'] = 1
+        msg = self.post(self.u1_id, "hello")
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.u2_id).count(), 0)
+
+        Follow.remove(u3.id, self.u1_id)
+        counters.record_follow(u3.id, self.u1_id, -1)
+        timeline.remove_follow(u3.id, self.u1_id)
+        db.session.commit()
+
+        self.assertEqual(
+            TimelineEntry.query.filter_by(user_id=self.u2_id).count(), 1)
+        self.assertEqual(timeline.get_timeline(self.u2_id), [msg])
+
+    def test_rebuild_timelines(self):
+        """Does rebuilding restore timelines from follows and messages?"""
+        msg = self.post(self.u1_id, "hello")
+        TimelineEntry.query.delete()
+
+        self.assertEqual(timeline.rebuild_timelines(), 2)
+        self.assertEqual(timeline.get_timeline(self.u2_id), [msg])
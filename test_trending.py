@@ -0,0 +1,130 @@
+"""Trending messages tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_trending.py
+
+
+import math
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, Like, Message, User
+from trending import BUCKETS_PER_HALF_LIFE, to_epoch_seconds
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
+
+from app import create_app, CURR_USER_KEY, trending
+
+app = create_app('testing')
+app.app_context().push()
+
+db.drop_all()
+db.create_all()
+
+
+class TrendingTestCase(TestCase):
+    def setUp(self):
+        User.query.delete()
+
+        users = [
+            User.signup(f"u{n}", f"u{n}@email.com", "password", None)
+            for n in range(4)
+        ]
+        db.session.flush()
+        self.user_ids = [user.id for user in users]
+
+        author = users[0]
+        messages = [
+            Message(text=f"m{n}", user_id=author.id) for n in range(3)
+        ]
+        db.session.add_all(messages)
+        db.session.commit()
+        self.message_ids = [msg.id for msg in messages]
+
+        self.client = app.test_client()
+
+    def like(self, user_id, message_id, action="like"):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+        resp = self.client.post(
+            f"/messages/{action}/{message_id}",
+            headers={"Accept": "application/json"},
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_rebuild_decays_and_expires(self):
+        m0, m1, m2 = self.message_ids
+        u1, u2, u3 = self.user_ids[1:]
+        now = datetime.utcnow()
+
+        db.session.add_all([
+            # two likes a day old, against one just now
+            Like(user_id=u1, message_id=m0, timestamp=now - timedelta(hours=20)),
+            Like(user_id=u2, message_id=m0, timestamp=now - timedelta(hours=20)),
+            Like(user_id=u1, message_id=m1, timestamp=now),
+            # outside the window
+            Like(user_id=u1, message_id=m2, timestamp=now - timedelta(days=2)),
+        ])
+        db.session.commit()
+
+        self.assertEqual(trending.rebuild(), 2)
+        self.assertEqual(trending.top(), [m1, m0])
+
+    def test_likes_update_ranking(self):
+        m0, m1, m2 = self.message_ids
+        u1, u2, u3 = self.user_ids[1:]
+
+        trending.rebuild()
+        self.assertEqual(trending.top(), [])
+
+        self.like(u1, m0)
+        self.like(u1, m1)
+        self.like(u2, m1)
+        self.assertEqual(trending.top(), [m1, m0])
+
+        self.like(u1, m1, "unlike")
+        self.like(u2, m1, "unlike")
+        self.assertEqual(trending.top(), [m0])
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = u3
+
+        resp = self.client.get("/trending")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"m0", resp.data)
+        self.assertNotIn(b"m1", resp.data)
+
+    def test_unlike_leaves_no_score(self):
+        m0 = self.message_ids[0]
+        u1 = self.user_ids[1]
+
+        trending.rebuild()
+        self.like(u1, m0)
+        self.like(u1, m0, "unlike")
+
+        self.assertEqual(trending.ranking.top(10), [])
+
+    def test_rebuild_floors_buckets(self):
+        m0 = self.message_ids[0]
+        u1 = self.user_ids[1]
+
+        # late in its bucket, where casting would round up
+        bucket_seconds = trending.half_life / BUCKETS_PER_HALF_LIFE
+        n = math.floor(
+            to_epoch_seconds(datetime.utcnow()) / bucket_seconds) - 1
+        liked_at = datetime(1970, 1, 1) + timedelta(
+            seconds=(n + 0.9) * bucket_seconds)
+
+        db.session.add(Like(user_id=u1, message_id=m0, timestamp=liked_at))
+        db.session.commit()
+
+        trending.rebuild()
+        [(message_id, score)] = trending.ranking.top(10)
+        epoch = trending.ranking.epoch()
+
+        self.assertEqual(message_id, m0)
+        self.assertAlmostEqual(
+            score, trending.weight((n + 0.5) * bucket_seconds, epoch))
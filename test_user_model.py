@@ -8,7 +8,9 @@
 import os
 from unittest import TestCase
 
-from models import db, bcrypt, User, DEFAULT_IMAGE_URL, DEFAULT_HEADER_IMAGE_URL
+from models import (
+    db, bcrypt, hasher, User, Follow, DEFAULT_IMAGE_URL,
+    DEFAULT_HEADER_IMAGE_URL)
 from sqlalchemy.exc import IntegrityError
 
 
@@ -21,7 +23,11 @@ os.environ['DATABASE_URL'] = "postgresql:///warbler_test"
 
 # Now we can import app
 
-from app import app
+from app import create_app, identity_cache
+import counters
+
+app = create_app('testing')
+app.app_context().push()
 
 # Create our tables (we do this here, so we only create the tables
 # once for all tests --- in each test, we'll delete the data
@@ -85,6 +91,22 @@ class UserModelTestCase(TestCase):
         self.assertEqual(u1.is_following(u2), False)
 
 
+    def test_follow_add_remove_idempotent(self):
+        """Do repeated follows and unfollows do nothing?"""
+
+        self.assertTrue(Follow.add(self.u1_id, self.u2_id))
+        self.assertFalse(Follow.add(self.u1_id, self.u2_id))
+        db.session.commit()
+
+        u1 = User.query.get(self.u1_id)
+        self.assertEqual([u.id for u in u1.following], [self.u2_id])
+
+        self.assertTrue(Follow.remove(self.u1_id, self.u2_id))
+        self.assertFalse(Follow.remove(self.u1_id, self.u2_id))
+        db.session.commit()
+
+        self.assertEqual(User.query.get(self.u1_id).following, [])
+
     def test_user_is_followed_by(self):
         u1 = User.query.get(self.u1_id)
         u2 = User.query.get(self.u2_id)
@@ -152,3 +174,69 @@ class UserModelTestCase(TestCase):
         """Does User.authenticate fail to return a user when the password is invalid?"""
         u_auth = User.authenticate("u1", "invalid password")
         self.assertEqual(u_auth, False)
+
+
+    def test_user_counters(self):
+        """Are follow counters updated and repaired by reconcile_counters?"""
+        u1 = User.query.get(self.u1_id)
+        u2 = User.query.get(self.u2_id)
+
+        u2.followers.append(u1)
+        counters.record_follow(self.u1_id, self.u2_id)
+        db.session.commit()
+
+        self.assertEqual(u1.following_count, 1)
+        self.assertEqual(u2.followers_count, 1)
+
+        u2.followers.clear()
+        db.session.commit()
+
+        drifted = counters.reconcile_counters()
+        db.session.commit()
+
+        self.assertEqual(drifted['users.followers_count'], 1)
+        self.assertEqual(drifted['users.following_count'], 1)
+        self.assertEqual(u1.following_count, 0)
+        self.assertEqual(u2.followers_count, 0)
+
+    def test_user_following_ids_among(self):
+        """Does following_ids_among return only the followed ids given?"""
+        u1 = User.query.get(self.u1_id)
+        u2 = User.query.get(self.u2_id)
+
+        self.assertEqual(u1.following_ids_among([self.u2_id]), set())
+
+        u2.followers.append(u1)
+        db.session.commit()
+
+        self.assertEqual(
+            u1.following_ids_among([self.u1_id, self.u2_id]), {self.u2_id})
+        self.assertEqual(u1.following_ids_among([]), set())
+
+    def test_identity_cache(self):
+        """Is the cached identity reused until the user is invalidated?"""
+        principal = identity_cache.get(self.u1_id)
+        self.assertEqual(principal.username, "u1")
+
+        u1 = User.query.get(self.u1_id)
+        u1.username = "renamed"
+        db.session.commit()
+
+        self.assertEqual(identity_cache.get(self.u1_id).username, "u1")
+
+        identity_cache.invalidate(self.u1_id)
+        self.assertEqual(identity_cache.get(self.u1_id).username, "renamed")
+
+    def test_user_rehash_on_cost_change(self):
+        """Is a password hash upgraded when the work factor changes?"""
+        u1 = User.query.get(self.u1_id)
+        old_rounds = hasher.log_rounds
+        hasher.log_rounds = 5
+
+        try:
+            self.assertEqual(u1.check_password("password"), True)
+            self.assertTrue(u1.password.startswith("$2b$05$"))
+            self.assertEqual(u1.check_password("password"), True)
+            self.assertEqual(u1.check_password("wrong password"), False)
+        finally:
+            hasher.log_rounds = old_rounds
@@ -0,0 +1,285 @@
+"""Home timeline storage for Warbler.
+
+Messages are written into each follower's timeline when they are posted
+(fan-out-on-write), so the homepage reads a single indexed range instead of
+querying every followed user's messages.
+
+Authors with more than TIMELINE_FANOUT_LIMIT followers are not fanned out;
+their messages are pulled at read time and merged into the timeline instead.
+When an author drops back to the limit, their recent messages are copied
+into their followers' timelines (resume_fan_out), since the ones posted
+while they were pulled were never delivered.
+"""
+
+from flask import current_app
+from sqlalchemy import func, insert, literal, select, true
+from sqlalchemy.orm import joinedload
+
+from models import db, Follow, Message, TimelineEntry, User
+from pagination import apply_keyset, message_key
+
+DEFAULT_FANOUT_LIMIT = 10000
+DEFAULT_BACKFILL_LIMIT = 100
+
+
+def get_fanout_limit():
+    """Return the follower count above which messages are pulled, not pushed."""
+
+    return current_app.config.get('TIMELINE_FANOUT_LIMIT', DEFAULT_FANOUT_LIMIT)
+
+
+def get_backfill_limit():
+    """Return how many recent messages to copy in when following someone."""
+
+    return current_app.config.get(
+        'TIMELINE_BACKFILL_LIMIT', DEFAULT_BACKFILL_LIMIT)
+
+
+def is_pull_author(user_id):
+    """Is `user_id` followed by so many users that we pull their messages?"""
+
+    followers_count = (db.session
+                       .query(User.followers_count)
+                       .filter(User.id == user_id)
+                       .scalar())
+
+    return (followers_count or 0) > get_fanout_limit()
+
+
+def pull_author_ids(user_id):
+    """Return ids of users followed by `user_id` whose messages are pulled."""
+
+    return [
+        author_id for (author_id,) in (db.session
+            .query(Follow.user_being_followed_id)
+            .join(User, User.id == Follow.user_being_followed_id)
+            .filter(Follow.user_following_id == user_id)
+            .filter(User.followers_count > get_fanout_limit())
+            .all())
+    ]
+
+
+def fan_out_message(msg):
+    """Deliver new message `msg` to its author's and followers' timelines.
+
+    The message must already be flushed so that it has an id.
+    """
+
+    db.session.add(TimelineEntry(
+        user_id=msg.user_id,
+        message_id=msg.id,
+        author_id=msg.user_id,
+        timestamp=msg.timestamp,
+    ))
+
+    if is_pull_author(msg.user_id):
+        return
+
+    followers = (select(
+                    Follow.user_following_id,
+                    literal(msg.id),
+                    literal(msg.user_id),
+                    literal(msg.timestamp, db.DateTime),
+                 )
+                 .where(Follow.user_being_followed_id == msg.user_id)
+                 .where(Follow.user_following_id != msg.user_id))
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'],
+            followers,
+        )
+    )
+
+
+def remove_message(msg):
+    """Remove message `msg` from every timeline it was delivered to."""
+
+    TimelineEntry.query.filter_by(message_id=msg.id).delete()
+
+
+def add_follow(follower_id, followed_id):
+    """Copy recent messages of `followed_id` into `follower_id`'s timeline."""
+
+    if follower_id == followed_id or is_pull_author(followed_id):
+        return
+
+    recent = (select(
+                 literal(follower_id),
+                 Message.id,
+                 Message.user_id,
+                 Message.timestamp,
+              )
+              .where(Message.user_id == followed_id)
+              .order_by(Message.timestamp.desc())
+              .limit(get_backfill_limit()))
+
+    TimelineEntry.query.filter_by(
+        user_id=follower_id, author_id=followed_id).delete()
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'],
+            recent,
+        )
+    )
+
+
+def remove_follow(follower_id, followed_id):
+    """Remove messages of `followed_id` from `follower_id`'s timeline.
+
+    Call this after the follow's counters are updated.
+    """
+
+    if follower_id == followed_id:
+        return
+
+    TimelineEntry.query.filter_by(
+        user_id=follower_id, author_id=followed_id).delete()
+
+    resume_fan_out([followed_id])
+
+
+def resume_fan_out(author_ids):
+    """Deliver recent messages of authors just back down to the limit.
+
+    Call this with users who have just lost followers. Those whose count
+    is now exactly TIMELINE_FANOUT_LIMIT were pulled until now, so each of
+    their followers gets their TIMELINE_BACKFILL_LIMIT most recent
+    messages, as if they'd just followed them.
+    """
+
+    resumed_ids = db.session.scalars(
+        select(User.id)
+        .where(User.id.in_(author_ids),
+               User.followers_count == get_fanout_limit())
+    ).all()
+
+    for author_id in resumed_ids:
+        recent = (select(Message.id, Message.timestamp)
+                  .where(Message.user_id == author_id)
+                  .order_by(Message.timestamp.desc())
+                  .limit(get_backfill_limit())
+                  .subquery())
+
+        followers = (select(
+                        Follow.user_following_id,
+                        recent.c.id,
+                        literal(author_id),
+                        recent.c.timestamp,
+                     )
+                     .join(recent, true())
+                     .where(Follow.user_being_followed_id == author_id)
+                     .where(Follow.user_following_id != author_id))
+
+        TimelineEntry.query.filter(
+            TimelineEntry.author_id == author_id,
+            TimelineEntry.user_id != author_id,
+        ).delete()
+
+        db.session.execute(
+            insert(TimelineEntry).from_select(
+                ['user_id', 'message_id', 'author_id', 'timestamp'],
+                followers,
+            )
+        )
+
+
+def get_timeline(user_id, limit=100, before=None, after=None):
+    """Return up to `limit` most recent messages for `user_id`'s homepage.
+
+    Reads the materialized timeline and merges in messages from followed
+    users who are too popular to fan out. Messages of users marked deleted
+    are skipped, though their entries stay until the account is purged.
+
+    `before` and `after` are (timestamp, id) keyset cursors; with `after`,
+    messages are returned oldest first (see pagination.apply_keyset).
+    """
+
+    messages = apply_keyset(
+        (Message
+         .query
+         .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+         .options(joinedload(Message.user))
+         .filter(TimelineEntry.user_id == user_id,
+                 ~User.marked_deleted(TimelineEntry.author_id))),
+        (TimelineEntry.timestamp, TimelineEntry.message_id),
+        before,
+        after,
+        limit,
+    ).all()
+
+    pulled_ids = pull_author_ids(user_id)
+
+    if not pulled_ids:
+        return messages
+
+    pulled = apply_keyset(
+        (Message
+         .query
+         .options(joinedload(Message.user))
+         .filter(Message.user_id.in_(pulled_ids),
+                 ~User.marked_deleted(Message.user_id))),
+        (Message.timestamp, Message.id),
+        before,
+        after,
+        limit,
+    ).all()
+
+    merged = {msg.id: msg for msg in messages + pulled}
+    return sorted(
+        merged.values(),
+        key=message_key,
+        reverse=after is None,
+    )[:limit]
+
+
+def rebuild_timelines():
+    """Rebuild every timeline from the follows and messages tables.
+
+    Returns the number of timeline entries written.
+    """
+
+    TimelineEntry.query.delete()
+
+    own = select(
+        Message.user_id,
+        Message.id,
+        Message.user_id,
+        Message.timestamp,
+    )
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'],
+            own,
+        )
+    )
+
+    follower_counts = (select(
+                          Follow.user_being_followed_id.label('user_id'),
+                          func.count().label('followers'),
+                       )
+                       .group_by(Follow.user_being_followed_id)
+                       .subquery())
+
+    followed = (select(
+                   Follow.user_following_id,
+                   Message.id,
+                   Message.user_id,
+                   Message.timestamp,
+                )
+                .join(Message, Message.user_id == Follow.user_being_followed_id)
+                .join(follower_counts,
+                      follower_counts.c.user_id == Follow.user_being_followed_id)
+                .where(follower_counts.c.followers <= get_fanout_limit())
+                .where(Follow.user_following_id != Follow.user_being_followed_id))
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'],
+            followed,
+        )
+    )
+
+    return TimelineEntry.query.count()
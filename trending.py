@@ -0,0 +1,301 @@
+"""Trending messages: the most liked over the last TRENDING_WINDOW seconds.
+
+A like counts for less as it ages, halving every TRENDING_HALF_LIFE
+seconds, and not at all once it's older than the window. Rather than
+decaying every score as time passes, a like made at time t scores
+
+    2 ** ((t - epoch) / half_life)
+
+for a fixed epoch, so newer likes simply weigh more. Ordering by these
+scores is ordering by decayed score, so a like or unlike only has to
+adjust one message's score. A message whose score is below that of a
+single like at the start of the window hasn't enough recent likes to
+show.
+
+Scores are kept for a bounded set of the best messages (TRENDING_SIZE
+times CANDIDATES_PER_SLOT), per process, or in a Redis sorted set when
+TRENDING_URL is set (and the redis package is installed), so that workers
+and hosts share one ranking. Every TRENDING_REBUILD_INTERVAL seconds
+the ranking is rebuilt from the likes table with a fresh epoch, which
+drops expired likes and repairs anything missed; `flask rebuild-trending`
+does the same on demand.
+"""
+
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import Integer, cast, event, extract, func, select
+
+from models import db, Like
+from replicas import RoutingSession
+
+DEFAULT_SIZE = 50
+DEFAULT_WINDOW = 24 * 60 * 60
+DEFAULT_HALF_LIFE = 6 * 60 * 60
+DEFAULT_REBUILD_INTERVAL = 5 * 60
+
+CANDIDATES_PER_SLOT = 10
+
+# likes are summed in buckets this fraction of a half-life long
+BUCKETS_PER_HALF_LIFE = 16
+
+
+def to_epoch_seconds(when):
+    """Seconds since 1970 of naive UTC datetime `when`."""
+
+    return (when - datetime(1970, 1, 1)).total_seconds()
+
+
+class LocalRanking:
+    """Trending scores, for this process only."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._scores = {}
+        self._epoch = None
+        self._lock = threading.Lock()
+
+    def epoch(self):
+        """The epoch scores are relative to, or None if never built."""
+
+        return self._epoch
+
+    def add(self, message_id, score):
+        with self._lock:
+            score += self._scores.get(message_id, 0)
+
+            if score > 0:
+                self._scores[message_id] = score
+            else:
+                self._scores.pop(message_id, None)
+
+            # trim now and then rather than on every like
+            if len(self._scores) > 2 * self.capacity:
+                self._scores = dict(heapq.nlargest(
+                    self.capacity, self._scores.items(),
+                    key=lambda item: item[1]))
+
+    def top(self, k):
+        """Return the best `k` (message id, score) pairs, best first."""
+
+        with self._lock:
+            return heapq.nlargest(
+                k, self._scores.items(), key=lambda item: item[1])
+
+    def replace(self, scores, epoch):
+        """Replace every score with `scores`, relative to `epoch`."""
+
+        best = heapq.nlargest(
+            self.capacity, scores.items(), key=lambda item: item[1])
+
+        with self._lock:
+            self._scores = dict(best)
+            self._epoch = epoch
+
+
+class RedisRanking:
+    """Trending scores shared by every process using the same Redis."""
+
+    key = 'trending'
+    epoch_key = 'trending:epoch'
+
+    def __init__(self, url, capacity):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("TRENDING_URL is set but redis isn't installed")
+
+        self._redis = redis.Redis.from_url(url)
+        self.capacity = capacity
+
+    def epoch(self):
+        epoch = self._redis.get(self.epoch_key)
+        return None if epoch is None else float(epoch)
+
+    def add(self, message_id, score):
+        pipe = self._redis.pipeline()
+        pipe.zincrby(self.key, score, message_id)
+        pipe.zremrangebyrank(self.key, 0, -self.capacity - 1)
+        pipe.execute()
+
+    def top(self, k):
+        return [
+            (int(message_id), score)
+            for message_id, score in self._redis.zrevrange(
+                self.key, 0, k - 1, withscores=True)
+        ]
+
+    def replace(self, scores, epoch):
+        best = heapq.nlargest(
+            self.capacity, scores.items(), key=lambda item: item[1])
+
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.delete(self.key)
+        if best:
+            pipe.zadd(self.key, dict(best))
+        pipe.set(self.epoch_key, epoch)
+        pipe.execute()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def add_committed_likes(db_session):
+    """Score the likes and unlikes of a transaction that committed."""
+
+    for trending, message_id, liked_at, sign in db_session.info.pop(
+            'trending_likes', ()):
+        trending.add(message_id, liked_at, sign)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def drop_rolled_back_likes(db_session):
+    db_session.info.pop('trending_likes', None)
+
+
+class Trending:
+    """Keeps the trending ranking up to date and reads it."""
+
+    def __init__(self, app=None, ranking=None):
+        self.app = None
+        self.ranking = ranking
+        self.size = DEFAULT_SIZE
+        self.window = DEFAULT_WINDOW
+        self.half_life = DEFAULT_HALF_LIFE
+        self.rebuild_interval = DEFAULT_REBUILD_INTERVAL
+        self._start_lock = threading.Lock()
+        self._rebuilder_pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read settings and pick a store from `app`'s config."""
+
+        config = app.config
+        self.app = app
+        self.size = config.get('TRENDING_SIZE', self.size)
+        self.window = config.get('TRENDING_WINDOW', self.window)
+        self.half_life = config.get('TRENDING_HALF_LIFE', self.half_life)
+        self.rebuild_interval = config.get(
+            'TRENDING_REBUILD_INTERVAL', self.rebuild_interval)
+
+        if self.ranking is None:
+            capacity = self.size * CANDIDATES_PER_SLOT
+            if config.get('TRENDING_URL'):
+                self.ranking = RedisRanking(config['TRENDING_URL'], capacity)
+            else:
+                self.ranking = LocalRanking(capacity)
+
+    def weight(self, when, epoch):
+        """Score of a like at `when` (seconds since 1970)."""
+
+        return 2 ** ((when - epoch) / self.half_life)
+
+    def record_like(self, message_id, liked_at):
+        """Score a like of `message_id` made at `liked_at` once the
+        transaction commits."""
+
+        self._defer(message_id, liked_at, 1)
+
+    def record_unlike(self, message_id, liked_at):
+        """Unscore a like made at `liked_at` once the transaction commits."""
+
+        self._defer(message_id, liked_at, -1)
+
+    def _defer(self, message_id, liked_at, sign):
+        db.session.info.setdefault('trending_likes', []).append(
+            (self, message_id, liked_at, sign))
+
+    def add(self, message_id, liked_at, sign):
+        """Add (sign=1) or take away (-1) the score of a like at `liked_at`."""
+
+        epoch = self.ranking.epoch()
+        when = to_epoch_seconds(liked_at)
+
+        # not built yet, or a like the last build didn't count
+        if epoch is None or when < epoch:
+            return
+
+        self.ranking.add(message_id, sign * self.weight(when, epoch))
+
+    def top(self):
+        """Return ids of the trending messages, best first.
+
+        Builds the ranking first if this is the first use.
+        """
+
+        self._start_rebuilder()
+
+        epoch = self.ranking.epoch()
+        if epoch is None:
+            self.rebuild()
+            epoch = self.ranking.epoch()
+
+        threshold = self.weight(time.time() - self.window, epoch)
+
+        return [
+            message_id
+            for message_id, score in self.ranking.top(self.size)
+            if score >= threshold
+        ]
+
+    def rebuild(self):
+        """Recompute the ranking from the likes in the window.
+
+        Returns the number of messages scored.
+        """
+
+        bucket_seconds = self.half_life / BUCKETS_PER_HALF_LIFE
+        epoch = time.time() - self.window
+        since = datetime.utcfromtimestamp(epoch)
+
+        # floor, not the cast: PostgreSQL rounds when casting to integer
+        bucket = cast(
+            func.floor(extract('epoch', Like.timestamp) / bucket_seconds),
+            Integer)
+
+        rows = db.session.execute(
+            select(Like.message_id, bucket, func.count())
+            .where(Like.timestamp >= since)
+            .group_by(Like.message_id, bucket)
+        )
+
+        scores = {}
+        for message_id, n, likes in rows:
+            when = (n + 0.5) * bucket_seconds
+            scores[message_id] = (
+                scores.get(message_id, 0) + likes * self.weight(when, epoch))
+
+        self.ranking.replace(scores, epoch)
+        return len(scores)
+
+    def _start_rebuilder(self):
+        """Start this process's rebuild thread, if it hasn't one yet.
+
+        Threads don't survive fork, so each worker process starts its own.
+        """
+
+        if not self.rebuild_interval:
+            return
+
+        with self._start_lock:
+            if self._rebuilder_pid == os.getpid():
+                return
+
+            threading.Thread(
+                target=self._run_rebuilder, name='trending', daemon=True,
+            ).start()
+            self._rebuilder_pid = os.getpid()
+
+    def _run_rebuilder(self):
+        while True:
+            time.sleep(self.rebuild_interval)
+
+            with self.app.app_context():
+                try:
+                    self.rebuild()
+                except Exception:
+                    self.app.logger.exception("rebuilding trending failed")
+
@@ -0,0 +1,18 @@
+"""WSGI entry point.
+
+Run with gunicorn like:
+
+    gunicorn --preload wsgi:app
+
+With --preload the app is built once in the master and forked into the
+workers. Freezing the GC afterwards keeps the collector from writing to
+(and so un-sharing) the master's objects in every worker.
+"""
+
+import gc
+
+from app import create_app
+
+app = create_app()
+
+gc.freeze()